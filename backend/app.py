@@ -8,6 +8,7 @@ except ImportError:
 from flask import Flask, jsonify, request
 import logging
 import os 
+from datetime import datetime
 from .utils.realtime import socketio # 💡 IMPORTANTE: La instancia de socketio
 # --- Importaciones de Librerías Externas ---
 from flask_jwt_extended import JWTManager
@@ -15,9 +16,16 @@ from flask_cors import CORS
 from dotenv import load_dotenv
 from flask_apscheduler import APScheduler 
 from backend.utils.inventory_utils import verificar_tendencia_y_alertar
+from backend.utils.bcv_api import refresh_exchange_rate
+from backend.utils.idempotency import purge_expired_idempotency_keys
+from backend.utils.receivables import refresh_aging_snapshots
+from backend.utils.reconciliation import reconcile_balances_job
+from backend.utils.stock_ledger import take_stock_snapshots_job
 
 # --- Importaciones de Módulos Locales (Absolutas) ---
 from backend.config import Config
+from backend import db
+from backend.commands import register_commands
 
 from backend.auth import auth_bp
 from backend.routes.customer_routes import customer_bp
@@ -43,6 +51,10 @@ app.config.from_object(Config)
 
 # Inicializar extensiones
 jwt = JWTManager(app)
+# Conexión por petición: se devuelve al pool en teardown_appcontext
+db.init_app(app)
+# Comandos CLI (flask --app backend.app migrate, ...)
+register_commands(app)
 
 # 🚀 CORRECCIÓN CLAVE: CONECTAR SOCKETIO A LA APLICACIÓN
 # Esto registra la ruta /socket.io/ que faltaba, resolviendo el 404.
@@ -58,8 +70,10 @@ CORS(
     # Usar la lista de orígenes
     origins="*", 
     supports_credentials=True, 
-    allow_headers=["Content-Type", "Authorization"], 
-    methods=["GET", "POST", "PUT", "DELETE", "OPTIONS"]
+    allow_headers=["Content-Type", "Authorization", "Idempotency-Key", "If-None-Match"], 
+    methods=["GET", "POST", "PUT", "DELETE", "OPTIONS"],
+    # Cabeceras de respuesta que el frontend necesita leer
+    expose_headers=["X-Next-Cursor", "ETag"]
 )
 
 # --- 4. CONFIGURACIÓN Y TAREA PROGRAMADA (SCHEDULER) ---
@@ -81,6 +95,56 @@ if not scheduler.running:
     )
     app_logger.info("Tarea de alertas estacionales programada para las 02:00 AM.")
 
+    # Refresco en segundo plano de la tasa BCV (la primera ejecución es inmediata)
+    scheduler.add_job(
+        id='refrescar_tasa_bcv',
+        func=refresh_exchange_rate,
+        trigger='interval',
+        seconds=Config.RATE_REFRESH_INTERVAL,
+        next_run_time=datetime.now(),
+        max_instances=1,
+        coalesce=True
+    )
+
+    # Limpieza diaria de claves de idempotencia vencidas
+    scheduler.add_job(
+        id='purgar_claves_idempotencia',
+        func=purge_expired_idempotency_keys,
+        trigger='cron',
+        hour=3,
+        minute=30
+    )
+
+    # Recalculo periódico del reporte de antigüedad de saldos (solo comercios que lo consultan)
+    scheduler.add_job(
+        id='refrescar_antiguedad_saldos',
+        func=refresh_aging_snapshots,
+        trigger='interval',
+        seconds=Config.AGING_REFRESH_INTERVAL,
+        max_instances=1,
+        coalesce=True
+    )
+
+    # Conciliación nocturna de saldos de clientes contra sus facturas
+    scheduler.add_job(
+        id='conciliar_saldos_clientes',
+        func=reconcile_balances_job,
+        trigger='cron',
+        hour=4,
+        minute=0,
+        max_instances=1
+    )
+
+    # Instantánea diaria del inventario (stock a una fecha y valorización)
+    scheduler.add_job(
+        id='instantanea_inventario',
+        func=take_stock_snapshots_job,
+        trigger='cron',
+        hour=1,
+        minute=0,
+        max_instances=1
+    )
+
 # --- 5. REGISTRO DE BLUEPRINTS (RUTAS) ---
 app.register_blueprint(auth_bp, url_prefix='/api/auth')
 app.register_blueprint(customer_bp, url_prefix='/api/customers')
@@ -2,6 +2,7 @@ from flask import Blueprint, request, jsonify
 from flask_jwt_extended import create_access_token
 from werkzeug.security import generate_password_hash, check_password_hash
 from backend.db import get_db_cursor
+from backend.utils.catalog_cache import notify_catalog_change
 import logging
 
 auth_bp = Blueprint('auth', __name__, url_prefix='/api/auth')
@@ -30,6 +31,8 @@ def register():
                 (email, hashed_password, role_id, tenant_id)
             )
             new_user_id = cur.fetchone()[0]
+            if tenant_id:
+                notify_catalog_change(cur, tenant_id, 'users')
         return jsonify({"msg": "Registro exitoso", "user_id": new_user_id}), 201
     except Exception as e:
         if "unique constraint" in str(e).lower():
@@ -48,12 +51,17 @@ def login():
     try:
         with get_db_cursor() as cur:
             # Buscamos el usuario y su tenant_id
-            cur.execute("SELECT id, email, password, role_id, tenant_id FROM users WHERE email = %s", (email,)) 
+            cur.execute("SELECT id, email, password, role_id, tenant_id, token_version FROM users WHERE email = %s", (email,)) 
             user = cur.fetchone()
 
         if user and check_password_hash(user['password'], password):
             # 🌟 CLAVE: Incluimos el tenant_id en los claims adicionales del token
-            additional_claims = {"tenant_id": user['tenant_id']}
+            # role_id y token_version permiten resolver la identidad sin ir a la DB
+            additional_claims = {
+                "tenant_id": user['tenant_id'],
+                "role_id": user['role_id'],
+                "token_version": user['token_version']
+            }
             access_token = create_access_token(
                 identity=str(user['id']), 
                 additional_claims=additional_claims
@@ -0,0 +1,104 @@
+import os
+import click
+from backend.db import get_db_cursor
+from backend.utils.sales_utils import backfill_invoice_documents
+from backend.utils.sales_stats import rebuild_sales_stats
+from backend.utils.reconciliation import reconcile_balances
+from backend.utils.stock_ledger import take_stock_snapshots
+
+MIGRATIONS_DIR = os.path.join(os.path.dirname(__file__), 'migrations')
+
+def apply_migrations():
+    """Aplica en orden los .sql de backend/migrations que aún no estén registrados."""
+    applied_now = []
+    with get_db_cursor(commit=True) as cur:
+        cur.execute(
+            """CREATE TABLE IF NOT EXISTS schema_migrations (
+                   name TEXT PRIMARY KEY,
+                   applied_at TIMESTAMP NOT NULL DEFAULT CURRENT_TIMESTAMP
+               )"""
+        )
+        cur.execute("SELECT name FROM schema_migrations")
+        applied = {row['name'] for row in cur.fetchall()}
+
+    for name in sorted(f for f in os.listdir(MIGRATIONS_DIR) if f.endswith('.sql')):
+        if name in applied:
+            continue
+        with open(os.path.join(MIGRATIONS_DIR, name), encoding='utf-8') as fh:
+            ddl = fh.read()
+        # Cada migración en su propia transacción
+        with get_db_cursor(commit=True) as cur:
+            cur.execute(ddl)
+            cur.execute("INSERT INTO schema_migrations (name) VALUES (%s)", (name,))
+        applied_now.append(name)
+    return applied_now
+
+def register_commands(app):
+    """Comandos CLI: flask --app backend.app <comando>"""
+
+    @app.cli.command('migrate')
+    def migrate_command():
+        """Aplica las migraciones SQL pendientes."""
+        applied = apply_migrations()
+        if applied:
+            for name in applied:
+                click.echo(f"Aplicada: {name}")
+        else:
+            click.echo("No hay migraciones pendientes.")
+
+
+    @app.cli.command('backfill-invoices')
+    @click.option('--batch-size', default=1000, show_default=True, help='Ventas por transacción.')
+    def backfill_invoices_command(batch_size):
+        """Genera la factura guardada de las ventas registradas antes de la migración 005."""
+        total = 0
+        while True:
+            # Tandas cortas para no mantener bloqueadas muchas filas de sales a la vez
+            with get_db_cursor(commit=True) as cur:
+                done = len(backfill_invoice_documents(cur, limit=batch_size))
+            total += done
+            if done < batch_size:
+                break
+        click.echo(f"Facturas generadas: {total}")
+
+    @app.cli.command('backfill-sales-stats')
+    @click.option('--tenant', 'tenant_id', default=None, help='Solo este comercio (por defecto, todos).')
+    def backfill_sales_stats_command(tenant_id):
+        """Recalcula sales_daily_stats a partir del historial de ventas y abonos."""
+        with get_db_cursor(commit=True) as cur:
+            rows = rebuild_sales_stats(cur, tenant_id)
+        click.echo(f"Agregados diarios generados: {rows}")
+
+    @app.cli.command('reconcile-balances')
+    @click.option('--repair', is_flag=True, help='Corrige los saldos descuadrados (por defecto solo reporta).')
+    @click.option('--tenant', 'tenants', multiple=True, help='Solo estos comercios (repetible).')
+    @click.option('--workers', type=int, default=None, help='Comercios en paralelo (RECONCILE_WORKERS).')
+    def reconcile_balances_command(repair, tenants, workers):
+        """Concilia customers.balance_pendiente_usd con la suma de saldos de sus ventas."""
+        summary, results = reconcile_balances(repair=repair, tenants=list(tenants) or None, workers=workers)
+        for result in results:
+            if 'error' in result:
+                click.echo(f"{result['tenant_id']}: ERROR {result['error']}")
+            elif result['drifted_customers']:
+                click.echo(
+                    f"{result['tenant_id']}: {result['drifted_customers']} clientes, "
+                    f"descuadre {result['total_drift_usd']} USD (máx. {result['max_drift_usd']}), "
+                    f"corregidos {result['repaired']}"
+                )
+        click.echo(
+            f"Comercios: {summary['tenants']} (con descuadre: {summary['tenants_with_drift']}, "
+            f"fallidos: {summary['failed']}) | clientes: {summary['drifted_customers']} | "
+            f"descuadre total: {summary['total_drift_usd']} USD | corregidos: {summary['repaired']} | "
+            f"{summary['seconds']}s"
+        )
+
+    @app.cli.command('stock-snapshot')
+    @click.option('--margin', type=int, default=None, help='Segundos hacia atrás del corte (STOCK_SNAPSHOT_MARGIN_SECONDS).')
+    def stock_snapshot_command(margin):
+        """Toma la instantánea de inventario (la primera incluye todos los productos)."""
+        with get_db_cursor(commit=True) as cur:
+            saved = take_stock_snapshots(cur, margin)
+        if saved is None:
+            click.echo("Otro proceso está tomando la instantánea.")
+        else:
+            click.echo(f"Productos en la instantánea: {saved}")
@@ -8,6 +8,19 @@ class Config:
     
     # --- Configuración de Base de Datos (Neon/PostgreSQL) ---
     DATABASE_URL = os.environ.get('DATABASE_URL') 
+
+    # --- Pool de Conexiones (backend/db.py) ---
+    DB_POOL_MIN_SIZE = int(os.environ.get('DB_POOL_MIN_SIZE', 1))
+    DB_POOL_MAX_SIZE = int(os.environ.get('DB_POOL_MAX_SIZE', 10))
+    # Segundos que espera una petición cuando el pool está agotado
+    DB_POOL_TIMEOUT = float(os.environ.get('DB_POOL_TIMEOUT', 10))
+    # Reciclar conexiones con más de N segundos de vida (Neon cierra las ociosas)
+    DB_POOL_MAX_LIFETIME = float(os.environ.get('DB_POOL_MAX_LIFETIME', 1800))
+    # Hacer SELECT 1 al prestar una conexión que lleva más de N segundos ociosa
+    DB_POOL_HEALTHCHECK_AFTER = float(os.environ.get('DB_POOL_HEALTHCHECK_AFTER', 30))
+    DB_POOL_RESET_ON_RETURN = os.environ.get('DB_POOL_RESET_ON_RETURN', 'true').lower() == 'true'
+    # Las consultas ceden el hub de gevent mientras esperan a Postgres
+    DB_GEVENT_COOPERATIVE = os.environ.get('DB_GEVENT_COOPERATIVE', 'true').lower() == 'true'
     
     # --- Seguridad de Contraseñas ---
     SECURITY_PASSWORD_HASH = os.environ.get('SECURITY_PASSWORD_HASH', 'pbkdf2:sha256') 
@@ -22,6 +35,96 @@ class Config:
     # Esto asegura que el frontend no tenga problemas con zonas horarias
     JWT_TIMEZONE_LOOKUP = False 
 
+    # --- Caché de identidad (get_user_and_role) ---
+    IDENTITY_CACHE_TTL = float(os.environ.get('IDENTITY_CACHE_TTL', 60))
+    IDENTITY_CACHE_SIZE = int(os.environ.get('IDENTITY_CACHE_SIZE', 10000))
+    # Si es True, role_id/token_version del JWT evitan la consulta a la DB mientras la versión
+    # del token no haya sido invalidada (en cualquier worker, vía LISTEN/NOTIFY). Caché y atajo
+    # solo se usan mientras el worker escucha los avisos (requiere CATALOG_CACHE_ENABLED)
+    IDENTITY_TRUST_JWT_CLAIMS = os.environ.get('IDENTITY_TRUST_JWT_CLAIMS', 'false').lower() == 'true'
+
+    # --- Tasa de cambio (backend/utils/bcv_api.py) ---
+    # Segundos que una tasa se considera fresca; luego el scheduler la refresca en segundo plano
+    RATE_CACHE_TTL = float(os.environ.get('RATE_CACHE_TTL', 300))
+    # Pasado este tiempo sin refrescar, la petición consulta en línea en vez de servir la vieja
+    RATE_MAX_STALE = float(os.environ.get('RATE_MAX_STALE', 6 * 3600))
+    RATE_REFRESH_INTERVAL = int(os.environ.get('RATE_REFRESH_INTERVAL', 120))
+    # (connect, read) en segundos
+    RATE_HTTP_TIMEOUT = (3.05, float(os.environ.get('RATE_HTTP_READ_TIMEOUT', 5)))
+    RATE_HTTP_POOL_SIZE = int(os.environ.get('RATE_HTTP_POOL_SIZE', 4))
+    RATE_BREAKER_THRESHOLD = int(os.environ.get('RATE_BREAKER_THRESHOLD', 3))
+    RATE_BREAKER_RESET = float(os.environ.get('RATE_BREAKER_RESET', 60))
+
+    # --- Ventas ---
+    # Ambas descuentan el stock al final de la transacción (los productos se bloquean los últimos)
+    # 'atomic': UPDATE condicional que bloquea, comprueba y descuenta en una sola sentencia
+    # 'lock': SELECT ... FOR NO KEY UPDATE de todo el ticket, revalidación y UPDATE aparte
+    SALE_STOCK_STRATEGY = os.environ.get('SALE_STOCK_STRATEGY', 'atomic')
+    # Ventas por transacción en POST /api/sales/sync
+    SALES_SYNC_BATCH_SIZE = int(os.environ.get('SALES_SYNC_BATCH_SIZE', 500))
+    # Paginación de GET /api/sales (?limit=&cursor=)
+    SALES_PAGE_SIZE = int(os.environ.get('SALES_PAGE_SIZE', 50))
+    SALES_MAX_PAGE_SIZE = int(os.environ.get('SALES_MAX_PAGE_SIZE', 500))
+    # Sub-filas por día para los totales de sales_daily_stats (reduce la espera entre ventas concurrentes)
+    SALES_STATS_SHARDS = int(os.environ.get('SALES_STATS_SHARDS', 8))
+
+    # Filas por FETCH del cursor del servidor en GET /api/sales/export
+    EXPORT_FETCH_SIZE = int(os.environ.get('EXPORT_FETCH_SIZE', 2000))
+
+    # --- Clientes ---
+    # Paginación de GET /api/customers (?limit=&cursor=)
+    CUSTOMERS_PAGE_SIZE = int(os.environ.get('CUSTOMERS_PAGE_SIZE', 50))
+    CUSTOMERS_MAX_PAGE_SIZE = int(os.environ.get('CUSTOMERS_MAX_PAGE_SIZE', 500))
+
+    # --- Productos ---
+    # Resultados por defecto de GET /api/products/search (backend/utils/product_search.py)
+    PRODUCT_SEARCH_LIMIT = int(os.environ.get('PRODUCT_SEARCH_LIMIT', 10))
+    # Comercios con índice en memoria y segundos antes de reconstruirlo (cambios hechos por otros workers)
+    PRODUCT_INDEX_MAX_TENANTS = int(os.environ.get('PRODUCT_INDEX_MAX_TENANTS', 200))
+    PRODUCT_INDEX_TTL = float(os.environ.get('PRODUCT_INDEX_TTL', 300))
+
+    # Filas máximas por POST /api/products/import
+    PRODUCT_IMPORT_MAX_ROWS = int(os.environ.get('PRODUCT_IMPORT_MAX_ROWS', 50000))
+
+    # Líneas máximas por POST /api/products/stock-adjustments
+    STOCK_ADJUSTMENT_MAX_ITEMS = int(os.environ.get('STOCK_ADJUSTMENT_MAX_ITEMS', 2000))
+
+    # Las instantáneas de inventario llegan hasta now() - margen, para no dejar fuera
+    # movimientos de transacciones todavía abiertas
+    STOCK_SNAPSHOT_MARGIN_SECONDS = int(os.environ.get('STOCK_SNAPSHOT_MARGIN_SECONDS', 600))
+
+    # --- Caché de catálogo (backend/utils/catalog_cache.py) ---
+    # Listados completos de productos y clientes por comercio, invalidados entre workers con LISTEN/NOTIFY
+    CATALOG_CACHE_ENABLED = os.environ.get('CATALOG_CACHE_ENABLED', 'true').lower() == 'true'
+    CATALOG_CACHE_MAX_TENANTS = int(os.environ.get('CATALOG_CACHE_MAX_TENANTS', 1000))
+    # Respaldo por si se pierde un aviso; la frescura la da la notificación
+    CATALOG_CACHE_TTL = float(os.environ.get('CATALOG_CACHE_TTL', 600))
+    # Segundos sin avisos tras los que se comprueba la conexión de escucha, y espera para reconectar
+    CATALOG_LISTEN_HEARTBEAT = float(os.environ.get('CATALOG_LISTEN_HEARTBEAT', 30))
+    CATALOG_LISTEN_RECONNECT = float(os.environ.get('CATALOG_LISTEN_RECONNECT', 5))
+    # Sub-filas por colección en collection_versions (ETag de los listados)
+    COLLECTION_VERSION_SHARDS = int(os.environ.get('COLLECTION_VERSION_SHARDS', 8))
+
+    # --- Cuentas por cobrar (backend/utils/receivables.py) ---
+    # Vigencia del snapshot de antigüedad de saldos y frecuencia con que el scheduler lo recalcula
+    AGING_CACHE_TTL = float(os.environ.get('AGING_CACHE_TTL', 900))
+    AGING_CACHE_SIZE = int(os.environ.get('AGING_CACHE_SIZE', 1000))
+    AGING_REFRESH_INTERVAL = int(os.environ.get('AGING_REFRESH_INTERVAL', 300))
+
+    # --- Conciliación de saldos de clientes (backend/utils/reconciliation.py) ---
+    # Comercios procesados en paralelo (cada uno usa una conexión del pool)
+    RECONCILE_WORKERS = int(os.environ.get('RECONCILE_WORKERS', 4))
+    # Diferencia en USD a partir de la cual un saldo se considera descuadrado
+    RECONCILE_TOLERANCE = float(os.environ.get('RECONCILE_TOLERANCE', 0.01))
+    # La tarea nocturna corrige los descuadres (si es False solo los reporta)
+    RECONCILE_REPAIR = os.environ.get('RECONCILE_REPAIR', 'true').lower() == 'true'
+    RECONCILE_LOCK_TIMEOUT_MS = int(os.environ.get('RECONCILE_LOCK_TIMEOUT_MS', 2000))
+    RECONCILE_STATEMENT_TIMEOUT_MS = int(os.environ.get('RECONCILE_STATEMENT_TIMEOUT_MS', 60000))
+
+    # --- Idempotency-Key (backend/utils/idempotency.py) ---
+    IDEMPOTENCY_TTL_HOURS = int(os.environ.get('IDEMPOTENCY_TTL_HOURS', 48))
+    IDEMPOTENCY_CACHE_SIZE = int(os.environ.get('IDEMPOTENCY_CACHE_SIZE', 5000))
+
     # --- Variables heredadas (Compatibilidad) ---
     DB_HOST = os.environ.get('DB_HOST') or 'localhost' 
     DB_NAME = os.environ.get('DB_NAME') or 'your_database_name'
@@ -1,55 +1,364 @@
+import os
+import time
+import logging
+import threading
 import psycopg2
 import psycopg2.extras
+import psycopg2.pool
 from contextlib import contextmanager
+from flask import g, has_app_context
 # Importación absoluta del archivo de configuración
-from backend.config import Config 
+from backend.config import Config
 
-# --- CONEXIÓN DE LA BASE DE DATOS ---
+db_logger = logging.getLogger('backend.db')
 
-@contextmanager
-def get_db_connection():
-    conn = None
-    
+# --- PARÁMETROS DE CONEXIÓN ---
+
+def _get_conn_params():
     # Lógica para usar DATABASE_URL de Neon o variables locales
     if Config.DATABASE_URL:
         # Usa la URL de conexión (dsn)
-        conn_params = {'dsn': Config.DATABASE_URL}
-    else:
-        # Usa variables separadas (para desarrollo local)
-        conn_params = {
-            'host': Config.DB_HOST,
-            'database': Config.DB_NAME,
-            'user': Config.DB_USER,
-            'password': Config.DB_PASSWORD
-        }
+        return {'dsn': Config.DATABASE_URL}
+    # Usa variables separadas (para desarrollo local)
+    return {
+        'host': Config.DB_HOST,
+        'database': Config.DB_NAME,
+        'user': Config.DB_USER,
+        'password': Config.DB_PASSWORD
+    }
+
+# --- I/O COOPERATIVA (GEVENT) ---
+
+def gevent_wait_callback(conn, timeout=None):
+    """
+    Callback de espera para psycopg2: en lugar de bloquear el hub mientras la consulta
+    está en vuelo, cede el control al resto de greenlets hasta que el socket esté listo.
+    """
+    from gevent.socket import wait_read, wait_write
+    while True:
+        state = conn.poll()
+        if state == psycopg2.extensions.POLL_OK:
+            break
+        elif state == psycopg2.extensions.POLL_READ:
+            wait_read(conn.fileno(), timeout=timeout)
+        elif state == psycopg2.extensions.POLL_WRITE:
+            wait_write(conn.fileno(), timeout=timeout)
+        else:
+            raise psycopg2.OperationalError(f"Bad result from poll: {state!r}")
+
+def make_psycopg_green():
+    """
+    Activa la I/O cooperativa de psycopg2 si gevent parcheó el proceso (ver app.py).
+    Devuelve True si quedó activa. Nota: en este modo psycopg2 no admite COPY.
+    """
+    try:
+        from gevent import monkey
+    except ImportError:
+        return False
+    if not monkey.is_module_patched('socket'):
+        return False
+    psycopg2.extensions.set_wait_callback(gevent_wait_callback)
+    return True
+
+# --- POOL DE CONEXIONES ---
+
+class PoolTimeout(psycopg2.pool.PoolError):
+    """No se liberó ninguna conexión dentro de DB_POOL_TIMEOUT segundos."""
+
+
+class ConnectionPool:
+    """
+    Pool acotado de conexiones psycopg2.
+
+    - Como máximo `maxconn` conexiones abiertas; si se agotan, el llamador espera
+      en un Condition (cooperativo bajo gevent, ya que app.py parchea threading).
+    - Al prestar una conexión se verifica su salud (SELECT 1 si estuvo ociosa
+      más de `healthcheck_after` segundos) y se recicla si superó `max_lifetime`.
+    - Al devolverla se revierte cualquier transacción abierta y se restablece
+      el estado de sesión (SET, autocommit, aislamiento) para el siguiente uso.
+    """
+
+    def __init__(self, conn_params, minconn=1, maxconn=10, timeout=10.0,
+                 max_lifetime=1800.0, healthcheck_after=30.0, reset_on_return=True):
+        self._conn_params = conn_params
+        self.minconn = minconn
+        self.maxconn = maxconn
+        self.timeout = timeout
+        self.max_lifetime = max_lifetime
+        self.healthcheck_after = healthcheck_after
+        self.reset_on_return = reset_on_return
+
+        self._cond = threading.Condition()
+        self._idle = []        # [(conn, created_at, returned_at)] LIFO
+        self._created = {}     # id(conn) -> created_at de las conexiones prestadas
+        self._size = 0         # conexiones abiertas (ociosas + prestadas)
+        self._closed = False
+
+        for _ in range(minconn):
+            conn = self._connect()
+            self._idle.append((conn, time.monotonic(), time.monotonic()))
+            self._size += 1
+
+    def _connect(self):
+        return psycopg2.connect(**self._conn_params)
+
+    @staticmethod
+    def _close_quietly(conn):
+        try:
+            conn.close()
+        except Exception:
+            pass
+
+    def _is_usable(self, conn, created_at, returned_at):
+        now = time.monotonic()
+        if conn.closed:
+            return False
+        if self.max_lifetime and now - created_at > self.max_lifetime:
+            return False
+        if self.healthcheck_after is not None and now - returned_at > self.healthcheck_after:
+            try:
+                with conn.cursor() as cur:
+                    cur.execute("SELECT 1")
+                conn.rollback()
+            except psycopg2.Error:
+                return False
+        return True
+
+    def getconn(self):
+        deadline = time.monotonic() + self.timeout
+        while True:
+            with self._cond:
+                if self._closed:
+                    raise psycopg2.pool.PoolError("connection pool is closed")
+                if self._idle:
+                    conn, created_at, returned_at = self._idle.pop()
+                elif self._size < self.maxconn:
+                    # Reservamos el hueco y conectamos fuera del lock
+                    self._size += 1
+                    conn, created_at, returned_at = None, None, None
+                else:
+                    remaining = deadline - time.monotonic()
+                    if remaining <= 0:
+                        raise PoolTimeout(
+                            f"No hay conexiones libres tras {self.timeout}s (max={self.maxconn})"
+                        )
+                    self._cond.wait(remaining)
+                    continue
+
+            if conn is None:
+                try:
+                    conn = self._connect()
+                except Exception:
+                    with self._cond:
+                        self._size -= 1
+                        self._cond.notify()
+                    raise
+                created_at = time.monotonic()
+            elif not self._is_usable(conn, created_at, returned_at):
+                # Conexión vencida o rota: se descarta y se intenta de nuevo
+                self._close_quietly(conn)
+                with self._cond:
+                    self._size -= 1
+                    # Quedó un hueco libre: despertar a quien espere para abrir otra
+                    self._cond.notify()
+                continue
+
+            with self._cond:
+                self._created[id(conn)] = created_at
+            return conn
+
+    def putconn(self, conn, discard=False):
+        with self._cond:
+            created_at = self._created.pop(id(conn), time.monotonic())
+
+        if not discard and not conn.closed:
+            try:
+                if self.reset_on_return:
+                    # reset() revierte la transacción y ejecuta DISCARD ALL / RESET ALL
+                    conn.reset()
+                elif conn.get_transaction_status() != psycopg2.extensions.TRANSACTION_STATUS_IDLE:
+                    conn.rollback()
+            except psycopg2.Error as e:
+                db_logger.warning(f"Descartando conexión que no pudo restablecerse: {e}")
+                discard = True
+        else:
+            discard = True
 
+        with self._cond:
+            if discard or self._closed:
+                self._size -= 1
+            else:
+                self._idle.append((conn, created_at, time.monotonic()))
+            self._cond.notify()
+
+        if discard or self._closed:
+            self._close_quietly(conn)
+
+    def closeall(self):
+        with self._cond:
+            self._closed = True
+            idle, self._idle = self._idle, []
+            self._size -= len(idle)
+            self._cond.notify_all()
+        for conn, _, _ in idle:
+            self._close_quietly(conn)
+
+    def stats(self):
+        with self._cond:
+            return {"size": self._size, "idle": len(self._idle), "max": self.maxconn}
+
+
+_pool = None
+_pool_pid = None
+_pool_lock = threading.Lock()
+
+def get_pool():
+    """Devuelve el pool del proceso actual, creándolo de forma perezosa (seguro tras el fork de gunicorn)."""
+    global _pool, _pool_pid
+    pid = os.getpid()
+    if _pool is not None and _pool_pid == pid:
+        return _pool
+    with _pool_lock:
+        if _pool is None or _pool_pid != pid:
+            # Las conexiones heredadas del proceso padre no se pueden compartir
+            _pool = ConnectionPool(
+                _get_conn_params(),
+                minconn=Config.DB_POOL_MIN_SIZE,
+                maxconn=Config.DB_POOL_MAX_SIZE,
+                timeout=Config.DB_POOL_TIMEOUT,
+                max_lifetime=Config.DB_POOL_MAX_LIFETIME,
+                healthcheck_after=Config.DB_POOL_HEALTHCHECK_AFTER,
+                reset_on_return=Config.DB_POOL_RESET_ON_RETURN,
+            )
+            _pool_pid = pid
+    return _pool
+
+def close_pool():
+    global _pool
+    with _pool_lock:
+        if _pool is not None:
+            _pool.closeall()
+            _pool = None
+
+# --- CONEXIÓN DE LA BASE DE DATOS ---
+
+def _is_broken(e):
+    return isinstance(e, (psycopg2.OperationalError, psycopg2.InterfaceError))
+
+@contextmanager
+def get_db_connection(scoped=True):
+    """
+    Presta una conexión del pool.
+
+    Dentro de un contexto de Flask (peticiones HTTP, eventos de Socket.IO, comandos CLI)
+    la conexión se guarda en `g` y se comparte entre todos los bloques de la petición:
+    get_user_and_role, la ruta y las verificaciones posteriores usan la misma conexión,
+    que se devuelve al pool en teardown_appcontext. Con scoped=False (o fuera de un
+    contexto, p. ej. tareas del scheduler) se usa una conexión propia del bloque.
+    Compartir la conexión implica compartir la transacción: ver get_db_cursor.
+    """
+    if scoped and has_app_context():
+        conn = g.get('_db_conn')
+        if conn is None or conn.closed:
+            conn = get_pool().getconn()
+            g._db_conn = conn
+        try:
+            yield conn
+        except psycopg2.Error as e:
+            db_logger.error(f"Database connection error: {e}")
+            if _is_broken(e):
+                g._db_conn_broken = True
+            raise
+        return
+
+    conn = None
+    broken = False
     try:
-        # Intento de conexión
-        conn = psycopg2.connect(**conn_params)
+        # Préstamo del pool (puede esperar si está agotado)
+        conn = get_pool().getconn()
         yield conn
     except psycopg2.Error as e:
-        # La excepción se captura e imprime, luego se relanza para que el caller la maneje
-        print(f"Database connection error: {e}")
+        # La excepción se registra y se relanza para que el caller la maneje
+        db_logger.error(f"Database connection error: {e}")
+        broken = _is_broken(e)
         raise # Vuelve a lanzar la excepción
     finally:
-        if conn:
-            conn.close()
+        if conn is not None:
+            get_pool().putconn(conn, discard=broken or bool(conn.closed))
+
+def close_request_connection(exception=None):
+    """Devuelve al pool la conexión de la petición (revierte lo que no se haya confirmado)."""
+    conn = g.pop('_db_conn', None)
+    broken = g.pop('_db_conn_broken', False)
+    if conn is not None:
+        get_pool().putconn(conn, discard=broken or bool(conn.closed))
+
+def init_app(app):
+    app.teardown_appcontext(close_request_connection)
+    if Config.DB_GEVENT_COOPERATIVE and make_psycopg_green():
+        db_logger.info("psycopg2 en modo cooperativo (gevent wait callback).")
 
 # --- CURSOR DE LA BASE DE DATOS ---
 
 @contextmanager
-def get_db_cursor(commit=False):
-    # ¡Esta función es necesaria para resolver tu ImportError!
-    with get_db_connection() as conn:
+def get_db_cursor(commit=False, scoped=True):
+    """
+    Cursor DictCursor sobre la conexión de la petición (o una propia con scoped=False).
+
+    Todos los bloques scoped de una petición comparten UNA transacción:
+    - commit=True confirma al salir del bloque todo lo pendiente en la conexión, incluidas
+      las escrituras que bloques anteriores con commit=False hayan dejado sin confirmar.
+    - Con commit=False lo escrito queda pendiente para los bloques siguientes; si nadie lo
+      confirma se revierte al devolver la conexión al pool (teardown de la petición).
+    - Si un bloque falla se revierte solo lo hecho por ese bloque: cuando ya había una
+      transacción abierta se toma un SAVEPOINT al entrar y se vuelve a él, de modo que el
+      trabajo pendiente de bloques anteriores se conserva y la conexión sigue utilizable.
+    Cuando un bloque debe quedar aislado de lo pendiente en la petición (p. ej. escribir un
+    registro que tiene que persistir aunque la ruta falle), usar scoped=False.
+    """
+    shared = scoped and has_app_context()
+    with get_db_connection(scoped=scoped) as conn:
         # Usa DictCursor para obtener resultados como diccionarios
         cur = conn.cursor(cursor_factory=psycopg2.extras.DictCursor)
+        savepoint = None
         try:
+            if shared and conn.get_transaction_status() == psycopg2.extensions.TRANSACTION_STATUS_INTRANS:
+                g._db_savepoints = g.get('_db_savepoints', 0) + 1
+                savepoint = f"bloque_{g._db_savepoints}"
+                cur.execute(f"SAVEPOINT {savepoint}")
             yield cur
             if commit:
                 conn.commit()
         except Exception as e:
-            conn.rollback()
-            print(f"Database operation error: {e}")
+            if not conn.closed:
+                _rollback_block(conn, cur, savepoint)
+            db_logger.error(f"Database operation error: {e}")
             raise
         finally:
-            cur.close()
\ No newline at end of file
+            cur.close()
+
+def _rollback_block(conn, cur, savepoint):
+    """Revierte lo hecho por el bloque: hasta su SAVEPOINT si existe, si no toda la transacción."""
+    if savepoint and conn.get_transaction_status() in (
+        psycopg2.extensions.TRANSACTION_STATUS_INTRANS, psycopg2.extensions.TRANSACTION_STATUS_INERROR
+    ):
+        try:
+            cur.execute(f"ROLLBACK TO SAVEPOINT {savepoint}")
+            return
+        except psycopg2.Error:
+            # El bloque ya había confirmado o revertido por su cuenta: el SAVEPOINT no existe
+            pass
+    conn.rollback()
+
+# --- UTILIDADES PARA SENTENCIAS POR LOTES ---
+
+def values_sql(cur, rows, template):
+    """
+    Interpola `rows` con `template` (p. ej. "(%s, %s)") y devuelve el bloque VALUES en bytes,
+    listo para componerse con otras partes ya interpoladas y ejecutarse sin parámetros.
+    """
+    return b",".join(cur.mogrify(template, tuple(row)) for row in rows)
+
+def placeholders(n):
+    """'%s, %s, ...' para listas IN (...) cuyos literales toman el tipo de la columna."""
+    return ", ".join(["%s"] * n)
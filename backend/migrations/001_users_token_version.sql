@@ -0,0 +1,3 @@
+-- Versión del token por usuario: se incrementa al cambiar rol/tenant o eliminar al usuario,
+-- invalidando los claims de identidad de los JWT emitidos antes del cambio.
+ALTER TABLE users ADD COLUMN IF NOT EXISTS token_version INTEGER NOT NULL DEFAULT 0;
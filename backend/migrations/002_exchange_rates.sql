@@ -0,0 +1,7 @@
+-- Serie temporal compacta de tasas USD->VES: solo se guarda un punto cuando la tasa cambia,
+-- así "tasa en el instante T" es el último punto con fetched_at <= T.
+CREATE TABLE IF NOT EXISTS exchange_rates (
+    fetched_at TIMESTAMPTZ PRIMARY KEY,
+    rate NUMERIC(18, 6) NOT NULL,
+    source TEXT NOT NULL DEFAULT 'dolarvzla'
+);
@@ -0,0 +1,5 @@
+-- Paginación por cursor de GET /api/sales: (sale_date, id) descendente por tenant y por vendedor
+CREATE INDEX IF NOT EXISTS idx_sales_tenant_date_id ON sales (tenant_id, sale_date DESC, id DESC);
+CREATE INDEX IF NOT EXISTS idx_sales_tenant_user_date_id ON sales (tenant_id, user_id, sale_date DESC, id DESC);
+CREATE INDEX IF NOT EXISTS idx_sales_tenant_customer_date ON sales (tenant_id, customer_id, sale_date DESC);
+CREATE INDEX IF NOT EXISTS idx_sale_items_sale_id ON sale_items (sale_id);
@@ -0,0 +1,4 @@
+-- Factura desnormalizada escrita al registrar la venta (encabezado, cliente, vendedor,
+-- productos con nombre y precio histórico, totales USD/VES). Ventas antiguas: NULL hasta
+-- que se generen con `flask --app backend.app backfill-invoices` o al consultarlas.
+ALTER TABLE sales ADD COLUMN IF NOT EXISTS invoice_document JSONB;
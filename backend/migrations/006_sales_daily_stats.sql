@@ -0,0 +1,20 @@
+-- Agregados diarios de ventas por comercio, mantenidos en la misma transacción que cada
+-- venta/abono (ver backend/utils/sales_stats.py). dimension: 'total' (dim_key ''),
+-- 'seller' (user_id) o 'category'. Cada día puede tener varias sub-filas (shard) que se suman
+-- al leer. Para poblarla con el historial: flask --app backend.app backfill-sales-stats
+CREATE TABLE IF NOT EXISTS sales_daily_stats (
+    tenant_id TEXT NOT NULL,
+    day DATE NOT NULL,
+    dimension TEXT NOT NULL,
+    dim_key TEXT NOT NULL DEFAULT '',
+    shard SMALLINT NOT NULL DEFAULT 0,
+    revenue_usd NUMERIC(14, 2) NOT NULL DEFAULT 0,
+    revenue_ves NUMERIC(18, 2) NOT NULL DEFAULT 0,
+    tickets INTEGER NOT NULL DEFAULT 0,
+    units INTEGER NOT NULL DEFAULT 0,
+    credit_usd NUMERIC(14, 2) NOT NULL DEFAULT 0,
+    contado_usd NUMERIC(14, 2) NOT NULL DEFAULT 0,
+    collected_usd NUMERIC(14, 2) NOT NULL DEFAULT 0,
+    collected_ves NUMERIC(18, 2) NOT NULL DEFAULT 0,
+    PRIMARY KEY (tenant_id, day, dimension, dim_key, shard)
+);
@@ -0,0 +1,9 @@
+-- Índices parciales para cuentas por cobrar: solo contienen ventas con saldo pendiente
+-- (una fracción pequeña de sales), así que se mantienen chicos aunque el historial crezca.
+-- Las consultas deben incluir literalmente `balance_due_usd > 0.05` para poder usarlos.
+CREATE INDEX IF NOT EXISTS idx_sales_receivables
+    ON sales (tenant_id, fecha_vencimiento) INCLUDE (customer_id, balance_due_usd, status)
+    WHERE balance_due_usd > 0.05;
+CREATE INDEX IF NOT EXISTS idx_sales_receivables_customer
+    ON sales (tenant_id, customer_id, sale_date DESC)
+    WHERE balance_due_usd > 0.05;
@@ -0,0 +1,7 @@
+-- Búsqueda de clientes (GET /api/customers?q=): índices trigram para ILIKE '%texto%' y
+-- similitud de nombre; más el índice del orden por nombre para la paginación por cursor.
+CREATE EXTENSION IF NOT EXISTS pg_trgm;
+CREATE INDEX IF NOT EXISTS idx_customers_name_trgm ON customers USING gin (name gin_trgm_ops);
+CREATE INDEX IF NOT EXISTS idx_customers_email_trgm ON customers USING gin (email gin_trgm_ops);
+CREATE INDEX IF NOT EXISTS idx_customers_cedula_trgm ON customers USING gin (cedula gin_trgm_ops);
+CREATE INDEX IF NOT EXISTS idx_customers_tenant_name_id ON customers (tenant_id, name, id);
@@ -0,0 +1,5 @@
+-- Respaldo de GET /api/products/search cuando el índice en memoria no encuentra nada:
+-- similitud trigram (tolerante a errores de tipeo) sobre nombre y categoría.
+CREATE EXTENSION IF NOT EXISTS pg_trgm;
+CREATE INDEX IF NOT EXISTS idx_products_name_trgm ON products USING gin (name gin_trgm_ops);
+CREATE INDEX IF NOT EXISTS idx_products_category_trgm ON products USING gin (category gin_trgm_ops);
@@ -0,0 +1,5 @@
+-- SKU por comercio para la importación masiva (POST /api/products/import) y el índice
+-- que usa la coincidencia por nombre cuando la fila no trae SKU.
+ALTER TABLE products ADD COLUMN IF NOT EXISTS sku TEXT;
+CREATE UNIQUE INDEX IF NOT EXISTS uq_products_tenant_sku ON products (tenant_id, sku) WHERE sku IS NOT NULL;
+CREATE INDEX IF NOT EXISTS idx_products_tenant_lower_name ON products (tenant_id, lower(name));
@@ -0,0 +1,16 @@
+-- Libro de movimientos de inventario: cada cambio de stock con su delta, el stock resultante,
+-- el motivo ('recepcion', 'ajuste', ...) y la referencia (guía de despacho, venta...).
+-- product_id se guarda como texto (p.id::text), igual que en las sentencias por lotes.
+CREATE TABLE IF NOT EXISTS stock_movements (
+    id BIGSERIAL PRIMARY KEY,
+    tenant_id TEXT NOT NULL,
+    product_id TEXT NOT NULL,
+    delta INTEGER NOT NULL,
+    stock_after INTEGER NOT NULL,
+    reason TEXT NOT NULL,
+    reference_id TEXT,
+    user_id TEXT,
+    created_at TIMESTAMPTZ NOT NULL DEFAULT now()
+);
+CREATE INDEX IF NOT EXISTS idx_stock_movements_product ON stock_movements (tenant_id, product_id, created_at);
+CREATE INDEX IF NOT EXISTS idx_stock_movements_tenant_date ON stock_movements (tenant_id, created_at);
@@ -0,0 +1,21 @@
+-- Instantáneas del stock por producto para consultar el stock a una fecha y valorizar el
+-- inventario sin recorrer el libro: stock(T) = última instantánea <= T + movimientos hasta T.
+-- La primera instantánea guarda todos los productos; las siguientes solo los que cambiaron.
+CREATE TABLE IF NOT EXISTS stock_snapshots (
+    tenant_id TEXT NOT NULL,
+    product_id TEXT NOT NULL,
+    taken_at TIMESTAMPTZ NOT NULL,
+    stock INTEGER NOT NULL,
+    PRIMARY KEY (tenant_id, product_id, taken_at)
+);
+
+-- Cortes tomados; el último es el inicio del rango de movimientos de la siguiente instantánea
+CREATE TABLE IF NOT EXISTS stock_snapshot_runs (
+    taken_at TIMESTAMPTZ PRIMARY KEY,
+    products INTEGER NOT NULL
+);
+
+-- La instantánea lee un rango de fechas de todo el libro. stock_movements solo crece y se
+-- inserta en orden de created_at, así que un índice BRIN basta y ocupa unos pocos KB
+-- aunque la tabla llegue a decenas de millones de filas.
+CREATE INDEX IF NOT EXISTS idx_stock_movements_created_brin ON stock_movements USING BRIN (created_at);
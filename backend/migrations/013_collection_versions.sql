@@ -0,0 +1,10 @@
+-- Versión por comercio y colección (products, customers, sales, users) para los ETag de los
+-- listados. Cada transacción que escribe suma 1 en una sub-fila (shard) elegida al azar; la
+-- versión de la colección es la suma de sus sub-filas (ver utils/catalog_cache.py).
+CREATE TABLE IF NOT EXISTS collection_versions (
+    tenant_id TEXT NOT NULL,
+    collection TEXT NOT NULL,
+    shard SMALLINT NOT NULL,
+    version BIGINT NOT NULL,
+    PRIMARY KEY (tenant_id, collection, shard)
+);
@@ -0,0 +1,3 @@
+-- La clave se reserva sin respuesta en la misma transacción que la operación y se completa
+-- después (ver utils/idempotency.py). status_code NULL = operación confirmada, respuesta no guardada.
+ALTER TABLE idempotency_keys ALTER COLUMN status_code DROP NOT NULL;
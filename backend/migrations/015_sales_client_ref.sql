@@ -0,0 +1,17 @@
+-- Referencia del POS para las ventas sincronizadas sin conexión (POST /api/sales/sync).
+-- Vive en la venta, no en idempotency_keys (que se purga), para que un reintento tardío
+-- nunca la duplique. El índice único parcial solo contiene ventas sincronizadas.
+ALTER TABLE sales ADD COLUMN IF NOT EXISTS client_ref TEXT;
+CREATE UNIQUE INDEX IF NOT EXISTS idx_sales_client_ref
+    ON sales (tenant_id, client_ref)
+    WHERE client_ref IS NOT NULL;
+
+-- Referencias ya sincronizadas que aún no se habían purgado
+UPDATE sales s
+SET client_ref = k.key
+FROM idempotency_keys k
+WHERE k.scope = 'sale.sync'
+  AND k.tenant_id = s.tenant_id::text
+  AND k.response->>'sale_id' = s.id::text
+  AND s.client_ref IS NULL;
+DELETE FROM idempotency_keys WHERE scope = 'sale.sync';
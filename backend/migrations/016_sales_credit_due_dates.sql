@@ -0,0 +1,8 @@
+-- Ventas a crédito antiguas sin fecha_vencimiento (el status variaba: 'credito', 'Crédito'...).
+-- Cuentas por cobrar filtran solo por fecha_vencimiento IS NOT NULL, que usa idx_sales_receivables;
+-- se les asigna el vencimiento que habrían tenido (dias_credito o 30 por defecto).
+UPDATE sales
+SET fecha_vencimiento = sale_date::date + COALESCE(dias_credito, 30)
+WHERE fecha_vencimiento IS NULL
+  AND balance_due_usd > 0.05
+  AND status ILIKE '%cr_dito%';
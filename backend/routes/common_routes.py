@@ -1,6 +1,8 @@
-from flask import Blueprint, jsonify
-from backend.utils.bcv_api import get_dolarvzla_rate
+from flask import Blueprint, jsonify, request
+from backend.utils.bcv_api import get_dolarvzla_rate, rate_service
+from backend.utils.rate_history import rate_history
 from flask_cors import cross_origin
+from datetime import datetime, timezone
 import time
 
 # Definimos el blueprint
@@ -13,6 +15,7 @@ def get_current_exchange_rate():
     try:
         # Llamamos a la utilidad que ya corregimos con la estructura {'current': {'usd': ...}}
         rate = get_dolarvzla_rate()
+        _, fetched_at = rate_service.snapshot()
         
         # Si por alguna razón la utilidad devolviera None (aunque pusimos DEFAULT_RATE)
         if rate is None:
@@ -21,7 +24,7 @@ def get_current_exchange_rate():
         return jsonify({
             "rate": rate,
             "source": "DolarVzla (BCV)",
-            "timestamp": int(time.time()), # Timestamp real de la consulta
+            "timestamp": int(fetched_at or time.time()), # Momento en que se consultó la API
             "status": "success"
         }), 200
 
@@ -36,4 +39,39 @@ def get_current_exchange_rate():
             "rate": 340.0, # Tasa de emergencia cercana a la realidad
             "status": "fallback",
             "error": str(e)
-        }), 500
\ No newline at end of file
+        }), 500
+
+def _parse_datetime(value):
+    """ISO 8601; sin zona horaria se asume UTC."""
+    dt = datetime.fromisoformat(value)
+    return dt if dt.tzinfo else dt.replace(tzinfo=timezone.utc)
+
+@rate_bp.route('/at', methods=['GET'])
+@cross_origin()
+def get_exchange_rate_at():
+    """Tasa vigente en un instante dado (?at=ISO8601), resuelta desde la serie local."""
+    try:
+        at = _parse_datetime(request.args['at']) if request.args.get('at') else datetime.now(timezone.utc)
+    except ValueError:
+        return jsonify({"msg": "Parámetro 'at' inválido (use ISO 8601)"}), 400
+
+    rate = rate_history.rate_at(at)
+    if rate is None:
+        return jsonify({"msg": "No hay tasas registradas para esa fecha"}), 404
+    return jsonify({"rate": rate, "at": at.isoformat(), "status": "success"}), 200
+
+@rate_bp.route('/history', methods=['GET'])
+@cross_origin()
+def get_exchange_rate_history():
+    """Puntos de la serie (cambios de tasa) entre ?from= y ?to= (ISO 8601)."""
+    try:
+        start = _parse_datetime(request.args['from']) if request.args.get('from') else None
+        end = _parse_datetime(request.args['to']) if request.args.get('to') else None
+    except ValueError:
+        return jsonify({"msg": "Parámetros de fecha inválidos (use ISO 8601)"}), 400
+
+    points = [
+        {"at": datetime.fromtimestamp(ts, tz=timezone.utc).isoformat(), "rate": rate}
+        for ts, rate in rate_history.points(start, end)
+    ]
+    return jsonify(points), 200
@@ -1,11 +1,18 @@
 from flask import Blueprint, request, jsonify
 from flask_jwt_extended import jwt_required, get_jwt
+from backend.config import Config
 from backend.db import get_db_cursor
 from backend.utils.helpers import (
     get_user_and_role, 
     check_admin_permission, 
-    validate_required_fields
+    validate_required_fields,
+    encode_cursor,
+    decode_cursor,
+    get_page_limit
 )
+from backend.utils.customer_utils import customer_overview, OVERVIEW_SECTIONS
+from backend.utils.catalog_cache import cached_listing, notify_catalog_change
+from backend.utils.etag import conditional_get
 import logging
 
 customer_bp = Blueprint('customer', __name__, url_prefix='/api/customers')
@@ -18,8 +25,9 @@ def get_current_tenant():
 
 @customer_bp.route('', methods=['GET', 'POST'])
 @jwt_required()
+@conditional_get('customers')
 def customers_collection():
-    current_user_id, tenant_id,user_role = get_user_and_role()
+    current_user_id, user_role, *_ = get_user_and_role()
     tenant_id = get_current_tenant()
     
     if not current_user_id:
@@ -46,6 +54,7 @@ def customers_collection():
                      data['cedula'], tenant_id, credit_limit)
                 )
                 new_customer = cur.fetchone()
+                notify_catalog_change(cur, tenant_id, 'customers')
                 
             # Devolvemos el objeto completo para que Vue lo agregue a la lista inmediatamente
             return jsonify(dict(new_customer)), 201
@@ -60,22 +69,100 @@ def customers_collection():
 
     # ------------------ GET (Listar Clientes del Tenant) ------------------
     elif request.method == 'GET':
-        try:
-            with get_db_cursor() as cur:
-                cur.execute(
-                    """SELECT id, name, email, phone, address, cedula, credit_limit_usd, balance_pendiente_usd 
-                       FROM customers WHERE tenant_id = %s ORDER BY name;""",
-                    (tenant_id,)
-                )
-                return jsonify([dict(c) for c in cur.fetchall()]), 200
-        except Exception as e:
-            app_logger.error(f"Error fetch clientes: {e}")
-            return jsonify({"msg": "Error al obtener clientes"}), 500
+        return list_customers(tenant_id)
+
+CUSTOMER_FIELDS = ('id', 'name', 'email', 'phone', 'address', 'cedula', 'credit_limit_usd', 'balance_pendiente_usd')
+
+def list_customers(tenant_id):
+    """
+    Listado de clientes ordenado por nombre, con paginación por cursor (keyset sobre name, id).
+
+    Parámetros opcionales: limit, cursor, fields=name,cedula,... (id siempre se incluye) y
+    q= búsqueda por nombre, email o cédula (subcadena; con 3+ letras también por similitud
+    de nombre). Usa los índices trigram de la migración 008. Sin limit ni cursor se devuelve
+    la lista completa, como antes; el cursor siguiente viene en la cabecera X-Next-Cursor.
+    La lista completa sin filtros se sirve desde la caché del worker (ver catalog_cache).
+    """
+    args = request.args
+    try:
+        limit = get_page_limit(Config.CUSTOMERS_PAGE_SIZE, Config.CUSTOMERS_MAX_PAGE_SIZE)
+        after = decode_cursor(args['cursor']) if args.get('cursor') else None
+    except ValueError as e:
+        return jsonify({"msg": str(e)}), 400
+
+    fields = list(CUSTOMER_FIELDS)
+    if args.get('fields'):
+        requested = [f.strip() for f in args['fields'].split(',') if f.strip()]
+        if unknown := [f for f in requested if f not in CUSTOMER_FIELDS]:
+            return jsonify({"msg": f"Campos desconocidos: {', '.join(unknown)}"}), 400
+        fields = ['id'] + [f for f in CUSTOMER_FIELDS if f in requested and f != 'id']
+    # name se necesita para el cursor aunque no se haya pedido
+    select_fields = fields if 'name' in fields else fields + ['name']
+
+    conditions = ["tenant_id = %s"]
+    params = [tenant_id]
+
+    q = (args.get('q') or '').strip()
+    if q:
+        pattern = '%' + q.replace('\\', '\\\\').replace('%', '\\%').replace('_', '\\_') + '%'
+        search = ["name ILIKE %s", "email ILIKE %s", "cedula ILIKE %s"]
+        params.extend([pattern, pattern, pattern])
+        if len(q) >= 3:
+            # Operador de similitud de pg_trgm (umbral pg_trgm.similarity_threshold)
+            search.append("name %% %s")
+            params.append(q)
+        conditions.append(f"({' OR '.join(search)})")
+
+    if after:
+        conditions.append("(name, id) > (%s, %s)")
+        params.extend(after[:2])
+
+    limit_sql = ""
+    if limit is not None:
+        # Una fila extra para saber si hay página siguiente
+        limit_sql = "LIMIT %s"
+        params.append(limit + 1)
+
+    query = f"""
+        SELECT {', '.join(select_fields)}
+        FROM customers
+        WHERE {' AND '.join(conditions)}
+        ORDER BY name, id
+        {limit_sql}
+    """
+    def load():
+        with get_db_cursor() as cur:
+            cur.execute(query, params)
+            return [dict(r) for r in cur.fetchall()]
+
+    hit = False
+    try:
+        if limit is None and not after and not q and not args.get('fields'):
+            rows, hit = cached_listing('customers', tenant_id, load)
+        else:
+            rows = load()
+    except Exception as e:
+        app_logger.error(f"Error fetch clientes: {e}")
+        return jsonify({"msg": "Error al obtener clientes"}), 500
+
+    has_more = limit is not None and len(rows) > limit
+    if limit is not None:
+        rows = rows[:limit]
+    next_cursor = encode_cursor([rows[-1]['name'], rows[-1]['id']]) if has_more else None
+    if 'name' not in fields:
+        for row in rows:
+            row.pop('name', None)
+
+    response = jsonify(rows)
+    response.headers['X-Cache'] = 'hit' if hit else 'miss'
+    if next_cursor:
+        response.headers['X-Next-Cursor'] = next_cursor
+    return response, 200
 
 @customer_bp.route('/<uuid:customer_id>', methods=['GET', 'PUT', 'DELETE'])
 @jwt_required()
 def customer_single(customer_id):
-    current_user_id, user_role = get_user_and_role()
+    current_user_id, user_role, *_ = get_user_and_role()
     tenant_id = get_current_tenant()
 
     # ------------------ GET SINGLE ------------------
@@ -118,6 +205,7 @@ def customer_single(customer_id):
                 cur.execute(query, tuple(params))
                 updated_customer = cur.fetchone()
                 if updated_customer:
+                    notify_catalog_change(cur, tenant_id, 'customers')
                     return jsonify(dict(updated_customer)), 200
                 return jsonify({"msg": "Cliente no encontrado o no pertenece a su tenant"}), 404
         except Exception as e:
@@ -135,8 +223,41 @@ def customer_single(customer_id):
                 # El tenant_id en el WHERE garantiza que no borren datos de otra empresa
                 cur.execute("DELETE FROM customers WHERE id = %s AND tenant_id = %s RETURNING id;", (customer_id, tenant_id))
                 if cur.fetchone():
+                    notify_catalog_change(cur, tenant_id, 'customers')
                     return jsonify({"msg": "Eliminado"}), 200
                 return jsonify({"msg": "No encontrado"}), 404
         except Exception as e:
             # Captura de error de llave foránea si el cliente tiene facturas
-            return jsonify({"msg": "Integridad referencial: El cliente tiene historial y no puede ser borrado"}), 400
\ No newline at end of file
+            return jsonify({"msg": "Integridad referencial: El cliente tiene historial y no puede ser borrado"}), 400
+
+@customer_bp.route('/<uuid:customer_id>/overview', methods=['GET'])
+@jwt_required()
+def customer_overview_endpoint(customer_id):
+    """
+    Ficha 360 del cliente en una sola petición: perfil, facturas abiertas, ventas recientes,
+    abonos recientes y antigüedad de saldos. ?include=open_invoices,recent_sales,payments,aging
+    elige las secciones (por defecto todas) y ?limit= el tamaño de las listas recientes.
+    """
+    tenant_id = get_current_tenant()
+    if not tenant_id:
+        return jsonify({"msg": "Falta tenant_id"}), 401
+
+    include = request.args.get('include')
+    sections = [s.strip() for s in include.split(',') if s.strip()] if include else list(OVERVIEW_SECTIONS)
+    if unknown := [s for s in sections if s not in OVERVIEW_SECTIONS]:
+        return jsonify({"msg": f"Secciones desconocidas: {', '.join(unknown)}"}), 400
+    try:
+        limit = min(max(int(request.args.get('limit', 10)), 1), 100)
+    except ValueError:
+        return jsonify({"msg": "limit debe ser un entero"}), 400
+
+    try:
+        with get_db_cursor() as cur:
+            overview = customer_overview(cur, tenant_id, customer_id, sections, limit)
+    except Exception as e:
+        app_logger.error(f"Error al obtener ficha del cliente {customer_id}: {e}")
+        return jsonify({"msg": "Error al obtener el cliente"}), 500
+
+    if not overview:
+        return jsonify({"msg": "No encontrado"}), 404
+    return jsonify(overview), 200
@@ -1,11 +1,27 @@
 from flask import Blueprint, request, jsonify
 from flask_jwt_extended import jwt_required, get_jwt
+from backend.config import Config
 from backend.db import get_db_cursor
 from backend.utils.helpers import (
     get_user_and_role, 
     check_product_manager_permission, 
     validate_required_fields
 )
+from backend.utils.product_search import search_products, index_product, unindex_product, invalidate_product_index
+from backend.utils.product_import import parse_rows, collect_rows, import_products
+from backend.utils.stock_ledger import (
+    StockError,
+    normalize_deltas,
+    adjust_stock,
+    insert_movements,
+    parse_as_of,
+    stock_at,
+    inventory_valuation
+)
+from backend.utils.inventory_utils import verificar_stock_y_alertar_lote
+from backend.utils.catalog_cache import cached_listing, notify_catalog_change
+from backend.utils.idempotency import idempotent
+from backend.utils.etag import conditional_get
 import logging
 
 product_bp = Blueprint('product', __name__, url_prefix='/api/products')
@@ -19,13 +35,14 @@ def get_current_tenant():
 
 @product_bp.route('', methods=['GET', 'POST'])
 @jwt_required()
+@conditional_get('products')
 def products_collection():
     result = get_user_and_role()
     if not isinstance(result, (list, tuple)) or len(result) < 2:
         app_logger.error(f"Error en helper get_user_and_role: se recibió {result}")
         return jsonify({"msg": "Error de sesión"}), 401
     
-    user_role_id = result[1]
+    user_id, user_role_id = result[0], result[1]
     tenant_id = get_current_tenant()
     
     # ------------------ POST (Crear Producto) ------------------
@@ -45,6 +62,8 @@ def products_collection():
             stock = int(data['stock'])
             
             with get_db_cursor(commit=True) as cur:
+                # Versiones antes que productos, el mismo orden de bloqueo que las ventas
+                notify_catalog_change(cur, tenant_id, 'products')
                 # Corregido: Se agregaron los placeholders y la columna category
                 cur.execute(
                     """INSERT INTO products (name, price, stock, category, tenant_id) 
@@ -53,7 +72,11 @@ def products_collection():
                     (name, price, stock, category, tenant_id)
                 )
                 new_product = cur.fetchone()
+                # Stock inicial en el libro de movimientos
+                if stock:
+                    insert_movements(cur, [(tenant_id, str(new_product['id']), stock, stock, 'alta', None, str(user_id))])
                 
+            index_product(tenant_id, new_product)
             return jsonify(dict(new_product)), 201
         except Exception as e:
             app_logger.error(f"Error creando producto: {e}")
@@ -61,7 +84,7 @@ def products_collection():
 
     # ------------------ GET (Listar Productos) ------------------
     elif request.method == 'GET':
-        try:
+        def load():
             with get_db_cursor() as cur:
                 cur.execute(
                     """SELECT id, name, price, stock, category
@@ -70,12 +93,176 @@ def products_collection():
                        ORDER BY name;""",
                     (tenant_id,)
                 )
-                rows = cur.fetchall()
-                return jsonify([dict(p) for p in rows]), 200
+                return [dict(p) for p in cur.fetchall()]
+        try:
+            # Los listados completos se sirven desde la caché del worker (ver catalog_cache)
+            rows, hit = cached_listing('products', tenant_id, load)
+            response = jsonify(rows)
+            response.headers['X-Cache'] = 'hit' if hit else 'miss'
+            return response, 200
         except Exception as e:
             app_logger.error(f"Error listando productos: {e}")
             return jsonify({"msg": "Error al obtener productos"}), 500
 
+@product_bp.route('/import', methods=['POST'])
+@jwt_required()
+def product_import():
+    """
+    Importación masiva de productos (alta o actualización) en una sola transacción.
+    Cuerpo: CSV con encabezado (Content-Type text/csv) o NDJSON, con name, price, category y
+    opcionalmente sku y stock. Un producto existente se reconoce por sku, o por nombre si la
+    fila no trae sku. Las filas inválidas se informan por número de línea y no detienen al resto.
+    ?dry_run=1 solo valida.
+    """
+    result = get_user_and_role()
+    if not isinstance(result, (list, tuple)) or len(result) < 2:
+        return jsonify({"msg": "Error de sesión"}), 401
+    user_id, user_role_id = result[0], result[1]
+    if not check_product_manager_permission(user_role_id):
+        return jsonify({"msg": "Acceso denegado: permisos insuficientes"}), 403
+    tenant_id = get_current_tenant()
+
+    rows, errors = collect_rows(parse_rows(request.stream, request.content_type), Config.PRODUCT_IMPORT_MAX_ROWS)
+    summary = {"valid": len(rows), "errors": errors}
+    if request.args.get('dry_run', '').lower() in ('1', 'true'):
+        return jsonify({"msg": "Validación completada", **summary}), 200
+
+    try:
+        with get_db_cursor(commit=True) as cur:
+            # Versiones antes que productos, el mismo orden de bloqueo que las ventas
+            notify_catalog_change(cur, tenant_id, 'products')
+            counts = import_products(cur, tenant_id, rows, user_id)
+    except Exception as e:
+        if "unique constraint" in str(e).lower():
+            return jsonify({"msg": "Otro proceso creó productos con los mismos SKU; reintente la importación"}), 409
+        app_logger.error(f"Error importando productos: {e}")
+        return jsonify({"msg": "Error interno al importar productos"}), 500
+
+    # El catálogo cambió en bloque: se reconstruye el índice de búsqueda en la siguiente consulta
+    invalidate_product_index(tenant_id)
+    return jsonify({"msg": "Importación completada", **counts, **summary}), 200
+
+STOCK_ADJUSTMENT_REASONS = ('recepcion', 'ajuste', 'devolucion', 'merma', 'conteo')
+
+@product_bp.route('/stock-adjustments', methods=['POST'])
+@jwt_required()
+@idempotent
+def stock_adjustments():
+    """
+    Ajuste de stock por lote (p. ej. recepción de mercancía): deltas relativos para muchos
+    productos, aplicados de forma atómica y registrados en stock_movements.
+    Cuerpo: {"items": [{"product_id", "delta"}], "reason": "recepcion", "reference": "guía 123"}.
+    """
+    result = get_user_and_role()
+    if not isinstance(result, (list, tuple)) or len(result) < 2:
+        return jsonify({"msg": "Error de sesión"}), 401
+    user_id, user_role_id = result[0], result[1]
+    if not check_product_manager_permission(user_role_id):
+        return jsonify({"msg": "Acceso denegado: permisos insuficientes"}), 403
+    tenant_id = get_current_tenant()
+
+    data = request.get_json() or {}
+    reason = data.get('reason', 'recepcion')
+    if reason not in STOCK_ADJUSTMENT_REASONS:
+        return jsonify({"msg": f"reason debe ser uno de: {', '.join(STOCK_ADJUSTMENT_REASONS)}"}), 400
+    items = data.get('items')
+    if isinstance(items, list) and len(items) > Config.STOCK_ADJUSTMENT_MAX_ITEMS:
+        return jsonify({"msg": f"Máximo {Config.STOCK_ADJUSTMENT_MAX_ITEMS} líneas por ajuste"}), 400
+
+    cur = None
+    try:
+        deltas = normalize_deltas(items)
+        with get_db_cursor(commit=False) as cur:
+            stock = adjust_stock(cur, tenant_id, user_id, deltas, reason, data.get('reference'))
+            cur.connection.commit()
+    except StockError as e:
+        if cur: cur.connection.rollback()
+        return jsonify({"msg": str(e)}), 400
+    except Exception as e:
+        if cur: cur.connection.rollback()
+        app_logger.error(f"Error en ajuste de stock: {e}")
+        return jsonify({"msg": "Error al ajustar el stock"}), 500
+
+    # Una sola verificación de stock bajo para todos los productos afectados
+    verificar_stock_y_alertar_lote(list(stock), tenant_id)
+    return jsonify({
+        "msg": "Ajuste aplicado",
+        "products": [{"product_id": pid, "stock": value} for pid, value in stock.items()]
+    }), 200
+
+@product_bp.route('/search', methods=['GET'])
+@jwt_required()
+def product_search():
+    """
+    Autocompletado de productos: ?q= (prefijos de nombre/categoría, sin distinguir acentos)
+    y ?limit= (por defecto PRODUCT_SEARCH_LIMIT). Se resuelve en memoria; solo si no hay
+    coincidencias se consulta la DB por similitud (errores de tipeo).
+    """
+    tenant_id = get_current_tenant()
+    query = (request.args.get('q') or '').strip()
+    if not query:
+        return jsonify([]), 200
+    try:
+        limit = min(max(int(request.args.get('limit', Config.PRODUCT_SEARCH_LIMIT)), 1), 50)
+    except ValueError:
+        return jsonify({"msg": "limit debe ser un entero"}), 400
+
+    try:
+        results, source = search_products(tenant_id, query, limit)
+    except Exception as e:
+        app_logger.error(f"Error buscando productos: {e}")
+        return jsonify({"msg": "Error al buscar productos"}), 500
+
+    response = jsonify(results)
+    response.headers['X-Search-Source'] = source
+    return response, 200
+
+@product_bp.route('/valuation', methods=['GET'])
+@jwt_required()
+def product_valuation():
+    """
+    Valorización del inventario (stock x precio) por categoría. ?at=AAAA-MM-DD (cierre del
+    día) o fecha y hora ISO para una fecha pasada, reconstruida desde las instantáneas.
+    """
+    result = get_user_and_role()
+    if not isinstance(result, (list, tuple)) or len(result) < 2:
+        return jsonify({"msg": "Error de sesión"}), 401
+    if not check_product_manager_permission(result[1]):
+        return jsonify({"msg": "Acceso denegado: permisos insuficientes"}), 403
+    tenant_id = get_current_tenant()
+
+    try:
+        at = parse_as_of(request.args['at']) if request.args.get('at') else None
+        with get_db_cursor() as cur:
+            valuation = inventory_valuation(cur, tenant_id, at)
+    except StockError as e:
+        return jsonify({"msg": str(e)}), 400
+    except Exception as e:
+        app_logger.error(f"Error valorizando inventario: {e}")
+        return jsonify({"msg": "Error al valorizar el inventario"}), 500
+    return jsonify(valuation), 200
+
+@product_bp.route('/<string:product_id>/stock', methods=['GET'])
+@jwt_required()
+def product_stock_at(product_id):
+    """Stock del producto en una fecha pasada: ?at=AAAA-MM-DD (cierre del día) o fecha y hora ISO."""
+    tenant_id = get_current_tenant()
+    if not request.args.get('at'):
+        return jsonify({"msg": "Falta el parámetro at"}), 400
+    try:
+        at = parse_as_of(request.args['at'])
+        with get_db_cursor() as cur:
+            row = stock_at(cur, tenant_id, at, [product_id]).get(str(product_id))
+    except StockError as e:
+        return jsonify({"msg": str(e)}), 400
+    except Exception as e:
+        app_logger.error(f"Error obteniendo stock histórico: {e}")
+        return jsonify({"msg": "Error al obtener el stock"}), 500
+
+    if not row:
+        return jsonify({"msg": "Producto no encontrado"}), 404
+    return jsonify({"product_id": row['id'], "name": row['name'], "at": at.isoformat(), "stock": row['stock']}), 200
+
 @product_bp.route('/<string:product_id>', methods=['GET', 'PUT', 'DELETE'])
 @jwt_required()
 def product_single(product_id):
@@ -83,7 +270,7 @@ def product_single(product_id):
     if not isinstance(result, (list, tuple)) or len(result) < 2:
         return jsonify({"msg": "Error de sesión"}), 401
 
-    user_role_id = result[1]
+    user_id, user_role_id = result[0], result[1]
     tenant_id = get_current_tenant()
 
     # ------------------ GET (Producto Único) ------------------
@@ -128,21 +315,41 @@ def product_single(product_id):
                 if not updates:
                     return jsonify({"msg": "No hay datos válidos para actualizar"}), 400
                 
-                params.extend([product_id, tenant_id])
+                params = [product_id, tenant_id, *params, tenant_id, 'ajuste', str(user_id)]
                 
+                # El stock se fija en valor absoluto: se bloquea la fila para registrar en
+                # stock_movements la diferencia exacta con el valor anterior
                 query = f"""
-                    UPDATE products 
-                    SET {', '.join(updates)} 
-                    WHERE id = %s AND tenant_id = %s 
-                    RETURNING id, name, price, stock, category;
+                    WITH prev AS (
+                        SELECT id, stock FROM products WHERE id = %s AND tenant_id = %s FOR UPDATE
+                    ),
+                    upd AS (
+                        UPDATE products p
+                        SET {', '.join(updates)} 
+                        FROM prev
+                        WHERE p.id = prev.id
+                        RETURNING p.id, p.name, p.price, p.stock, p.category, prev.stock AS old_stock
+                    ),
+                    mov AS (
+                        INSERT INTO stock_movements (tenant_id, product_id, delta, stock_after, reason, user_id)
+                        SELECT %s::text, id::text, stock - old_stock, stock, %s, %s FROM upd
+                        WHERE stock <> old_stock
+                    )
+                    SELECT id, name, price, stock, category FROM upd;
                 """
                 
+                # Versiones antes que productos, el mismo orden de bloqueo que las ventas
+                notify_catalog_change(cur, tenant_id, 'products')
                 cur.execute(query, tuple(params))
                 updated = cur.fetchone()
                 
                 if not updated:
+                    # Sin cambios: que la versión del catálogo no se confirme
+                    cur.connection.rollback()
                     return jsonify({"msg": "Producto no encontrado o no pertenece a su negocio"}), 404
-                    
+                
+                cur.connection.commit()
+                index_product(tenant_id, updated)
                 return jsonify(dict(updated)), 200
         except Exception as e:
             app_logger.error(f"Error en actualización (PUT): {e}")
@@ -154,6 +361,7 @@ def product_single(product_id):
             return jsonify({"msg": "Acceso denegado"}), 403
         try:
             with get_db_cursor(commit=True) as cur:
+                notify_catalog_change(cur, tenant_id, 'products')
                 cur.execute(
                     "DELETE FROM products WHERE id = %s AND tenant_id = %s RETURNING id;",
                     (product_id, tenant_id)
@@ -161,8 +369,11 @@ def product_single(product_id):
                 deleted = cur.fetchone()
                 
                 if not deleted:
+                    cur.connection.rollback()
                     return jsonify({"msg": "Producto no encontrado"}), 404
-                    
+                
+                cur.connection.commit()
+                unindex_product(tenant_id, product_id)
                 return jsonify({"msg": "Producto eliminado exitosamente"}), 200
         except Exception as e:
             app_logger.error(f"Error eliminando producto: {e}")
@@ -1,23 +1,42 @@
 import os
+import json
 import uuid
 import logging
 from datetime import datetime, timedelta
 
-from flask import Blueprint, request, jsonify
+from flask import Blueprint, Response, request, jsonify, stream_with_context
 from flask_jwt_extended import jwt_required, get_jwt
 from psycopg2 import sql 
 
 # Importaciones Locales
-from backend.db import get_db_cursor
+from backend.config import Config
+from backend.db import get_db_cursor, placeholders
 from backend.utils.helpers import (
     get_user_and_role, 
     check_admin_permission, 
     validate_required_fields, 
-    check_seller_permission
+    check_seller_permission,
+    encode_cursor,
+    decode_cursor,
+    get_page_limit
 )
-from backend.utils.bcv_api import get_dolarvzla_rate 
-from backend.utils.inventory_utils import verificar_stock_y_alertar, STOCK_THRESHOLD
+from backend.utils.rate_history import resolve_exchange_rate
+from backend.utils.inventory_utils import verificar_stock_y_alertar_lote, STOCK_THRESHOLD
+from backend.utils.sales_utils import (
+    SaleError,
+    PAYMENT_CURRENCIES,
+    create_sale,
+    create_sales_batch,
+    backfill_invoice_documents,
+    pay_customer_invoices
+)
+from backend.utils.sales_stats import StatDeltas, sales_dashboard
+from backend.utils.receivables import get_aging_snapshot
+from backend.utils.catalog_cache import notify_catalog_change
+from backend.utils.export_utils import EXPORT_DATASETS, export_query, stream_rows, csv_chunks, xlsx_chunks
 from backend.utils.security_utils import generate_daily_admin_code
+from backend.utils.idempotency import idempotent
+from backend.utils.etag import conditional_get
 
 # Configuración de Blueprint y Logging
 # Se asume que el prefijo base /api/sales se maneja en app.py
@@ -26,7 +45,6 @@ app_logger = logging.getLogger('backend.routes.sale_routes')
 
 SECRET_SEED = os.environ.get('ADMIN_SECRET_SEED', 'mi-clave-unica-de-permiso')
 PAYMENT_TOLERANCE = 0.01 
-DEFAULT_CREDIT_DAYS = 30
 
 def get_current_tenant():
     """Extrae el tenant_id del token JWT."""
@@ -34,6 +52,8 @@ def get_current_tenant():
 
 @sale_bp.route('', methods=['GET', 'POST'])
 @jwt_required()
+@idempotent
+@conditional_get('sales', 'customers', 'users', 'products')
 def sales_collection():
     current_user_id, user_role, *_ = get_user_and_role() 
     tenant_id = get_current_tenant()
@@ -49,17 +69,11 @@ def sales_collection():
         if error := validate_required_fields(data, ['customer_id', 'items']):
             return jsonify({"msg": f"Campos faltantes: {error}"}), 400
         
-        # 🛠️ CORRECCIÓN 1: Normalización robusta para detectar crédito
-        tipo_pago_raw = data.get('tipo_pago', 'Contado')
-        tipo_pago_clean = tipo_pago_raw.lower().strip().replace('é', 'e').replace('á', 'a')
-        
         usd_paid = float(data.get('usd_paid', 0) or 0)
         ves_paid = float(data.get('ves_paid', 0) or 0)
-        customer_id = data.get("customer_id")
-        items = data.get("items")
 
         try:
-            exchange_rate = get_dolarvzla_rate()
+            exchange_rate = resolve_exchange_rate()
         except Exception as e:
             app_logger.error(f"Error BCV: {e}")
             return jsonify({"msg": "No se pudo obtener la tasa de cambio"}), 500
@@ -67,135 +81,351 @@ def sales_collection():
         cur = None
         try:
             with get_db_cursor(commit=False) as cur: 
-                total_amount_usd = 0.0
-                validated_items = []
-
-                # PASO 1: Validar Stock
-                for item in items:
-                    cur.execute(
-                        "SELECT name, price, stock FROM products WHERE id = %s AND tenant_id = %s::text FOR UPDATE", 
-                        (item.get('product_id'), tenant_id)
-                    )
-                    product = cur.fetchone()
-                    if not product:
-                        raise Exception(f"Producto ID {item.get('product_id')} no encontrado")
-                    
-                    if product['stock'] < int(item.get('quantity', 0)):
-                        raise Exception(f"Stock insuficiente para {product['name']}")
-                    
-                    price_usd = float(product['price'])
-                    total_amount_usd += (price_usd * int(item.get('quantity')))
-                    validated_items.append({**item, 'price': price_usd, 'current_stock': product['stock']})
-
-                # PASO 2: Cálculo de Totales y Saldo
-                total_amount_ves = total_amount_usd * exchange_rate
-                total_paid_usd = usd_paid + (ves_paid / exchange_rate if exchange_rate > 0 else 0)
-                saldo_pendiente = max(0.0, round(total_amount_usd - total_paid_usd, 2))
-
-                # 🛠️ CORRECCIÓN 2: Lógica automática de crédito por saldo
-                if 'credito' in tipo_pago_clean or saldo_pendiente > 0.05:
-                    status = 'Crédito'
-                    dias_credito = int(data.get('dias_credito', DEFAULT_CREDIT_DAYS))
-                    fecha_vencimiento = datetime.now().date() + timedelta(days=dias_credito)
-                    
-                    # Actualizar balance del cliente (usando tenant_id)
-                    cur.execute(
-                        "UPDATE customers SET balance_pendiente_usd = balance_pendiente_usd + %s WHERE id = %s AND tenant_id = %s::text",
-                        (saldo_pendiente, customer_id, tenant_id)
-                    )
-                else:
-                    status = 'Completado'
-                    fecha_vencimiento = None
-                    dias_credito = 0
-
-                # PASO 3: Insertar Venta (Asegúrate que la tabla tenga tenant_id)
-                new_sale_id = str(uuid.uuid4())
-                cur.execute("""
-                    INSERT INTO sales (
-                        id, customer_id, user_id, tenant_id, sale_date, 
-                        total_amount_usd, total_amount_ves, exchange_rate_used, 
-                        status, tipo_pago, usd_paid, ves_paid, balance_due_usd, 
-                        fecha_vencimiento, dias_credito
-                    ) VALUES (%s, %s, %s, %s, %s, %s, %s, %s, %s, %s, %s, %s, %s, %s, %s)
-                """, (
-                    new_sale_id, customer_id, current_user_id, tenant_id, datetime.now(),
-                    total_amount_usd, total_amount_ves, exchange_rate,
-                    status, tipo_pago_raw, usd_paid, ves_paid, saldo_pendiente,
-                    fecha_vencimiento, dias_credito
-                ))
+                # Todo el ticket en un número fijo de sentencias (ver sales_utils.create_sale)
+                sale = create_sale(
+                    cur, tenant_id, current_user_id,
+                    customer_id=data.get("customer_id"),
+                    items=data.get("items"),
+                    exchange_rate=exchange_rate,
+                    tipo_pago=data.get('tipo_pago', 'Contado'),
+                    usd_paid=usd_paid,
+                    ves_paid=ves_paid,
+                    dias_credito=data.get('dias_credito')
+                )
+                cur.connection.commit()
 
-                # PASO 4: Items e Inventario
-                for item in validated_items:
-                    cur.execute(
-                        "INSERT INTO sale_items (sale_id, product_id, quantity, price, tenant_id) VALUES (%s, %s, %s, %s, %s::text)",
-                        (new_sale_id, item['product_id'], item['quantity'], item['price'], tenant_id)
-                    )
-                    cur.execute(
-                        "UPDATE products SET stock = stock - %s WHERE id = %s AND tenant_id = %s::text",
-                        (item['quantity'], item['product_id'], tenant_id)
-                    )
+            # Alertas de stock bajo: una sola consulta para todos los productos vendidos
+            verificar_stock_y_alertar_lote(sale['product_ids'], tenant_id)
 
-                cur.connection.commit()
-                return jsonify({"msg": "Venta exitosa", "sale_id": new_sale_id}), 201
+            return jsonify({"msg": "Venta exitosa", "sale_id": sale['sale_id']}), 201
 
+        except SaleError as e:
+            if cur: cur.connection.rollback()
+            return jsonify({"msg": str(e)}), 400
         except Exception as e:
             if cur: cur.connection.rollback()
+            app_logger.error(f"Error al registrar venta: {e}")
             return jsonify({"msg": str(e)}), 500
 
     elif request.method == "GET":
+        return list_sales(current_user_id, user_role, tenant_id)
+
+def list_sales(current_user_id, user_role, tenant_id):
+    """
+    Listado de ventas con paginación por cursor (keyset sobre sale_date, id).
+
+    Parámetros opcionales: limit, cursor, date_from/date_to (YYYY-MM-DD, inclusivos),
+    status, seller_id (solo admin), customer_id y summary=1 (sin detalle de productos).
+    Si se pide paginar, el cursor de la siguiente página viene en la cabecera X-Next-Cursor;
+    sin limit ni cursor se devuelve el historial completo, como antes.
+    """
+    args = request.args
+    try:
+        limit = get_page_limit(Config.SALES_PAGE_SIZE, Config.SALES_MAX_PAGE_SIZE)
+        after = decode_cursor(args['cursor']) if args.get('cursor') else None
+    except ValueError as e:
+        return jsonify({"msg": str(e)}), 400
+
+    conditions = ["s.tenant_id = %s::text"]
+    params = [tenant_id]
+
+    if not check_admin_permission(user_role):
+        conditions.append("s.user_id = %s")
+        params.append(current_user_id)
+    elif args.get('seller_id'):
+        conditions.append("s.user_id = %s")
+        params.append(args['seller_id'])
+
+    if args.get('customer_id'):
+        conditions.append("s.customer_id = %s")
+        params.append(args['customer_id'])
+    if args.get('status'):
+        conditions.append("s.status = %s")
+        params.append(args['status'])
+    if args.get('date_from'):
+        conditions.append("s.sale_date >= %s::date")
+        params.append(args['date_from'])
+    if args.get('date_to'):
+        conditions.append("s.sale_date < %s::date + 1")
+        params.append(args['date_to'])
+    if after:
+        conditions.append("(s.sale_date, s.id) < (%s, %s)")
+        params.extend(after[:2])
+
+    limit_sql = ""
+    if limit is not None:
+        # Pedimos una fila extra para saber si hay página siguiente
+        limit_sql = "LIMIT %s"
+        params.append(limit + 1)
+
+    summary = args.get('summary', '').lower() in ('1', 'true')
+    # El detalle de productos se agrega solo para las ventas de la página; las ventas con
+    # factura guardada lo toman de ella y solo las antiguas consultan sale_items
+    items_sql = "" if summary else """,
+            COALESCE(pg.invoice_document->'items', (
+                SELECT jsonb_agg(jsonb_build_object(
+                    'name', p.name,
+                    'qty', si.quantity,
+                    'price_usd', si.price -- Precio histórico de la venta
+                ))
+                FROM sale_items si
+                JOIN products p ON si.product_id = p.id
+                WHERE si.sale_id = pg.id
+            ), '[]'::jsonb) AS items"""
+    document_sql = "" if summary else ", s.invoice_document"
+
+    query = f"""
+        WITH pg AS (
+            SELECT s.id, s.sale_date, s.status, s.total_amount_usd, s.total_amount_ves,
+                   s.exchange_rate_used, s.balance_due_usd, s.tipo_pago, s.customer_id, s.user_id{document_sql}
+            FROM sales s
+            WHERE {' AND '.join(conditions)}
+            ORDER BY s.sale_date DESC, s.id DESC
+            {limit_sql}
+        )
+        SELECT
+            pg.id::text,
+            pg.sale_date::text,
+            pg.status,
+            pg.total_amount_usd,
+            pg.total_amount_ves,
+            pg.exchange_rate_used,
+            pg.balance_due_usd,
+            pg.tipo_pago,
+            c.name AS customer_name,
+            c.cedula AS customer_cedula,
+            u.nombre AS seller_name{items_sql}
+        FROM pg
+        JOIN customers c ON pg.customer_id = c.id
+        JOIN users u ON pg.user_id = u.id
+        ORDER BY pg.sale_date DESC, pg.id DESC
+    """
+
+    try:
+        with get_db_cursor() as cur:
+            cur.execute(query, params)
+            rows = [dict(r) for r in cur.fetchall()]
+    except Exception as e:
+        app_logger.error(f"Error al listar ventas detalladas: {e}")
+        return jsonify({"msg": "Error al listar ventas"}), 500
+
+    response = jsonify(rows[:limit] if limit is not None else rows)
+    if limit is not None and len(rows) > limit:
+        last = rows[limit - 1]
+        response.headers['X-Next-Cursor'] = encode_cursor([last['sale_date'], last['id']])
+    return response, 200
+
+@sale_bp.route('/dashboard', methods=['GET'])
+@jwt_required()
+def get_sales_dashboard():
+    """
+    Totales del período (?date_from=&date_to=, YYYY-MM-DD; por defecto los últimos 30 días)
+    con desglose diario, por vendedor y por categoría. Solo administradores.
+    """
+    current_user_id, user_role, *_ = get_user_and_role()
+    tenant_id = get_current_tenant()
+    if not tenant_id:
+        return jsonify({"msg": "Falta tenant_id"}), 401
+    if not check_admin_permission(user_role):
+        return jsonify({"msg": "Acceso denegado"}), 403
+
+    try:
+        date_to = datetime.strptime(request.args['date_to'], '%Y-%m-%d').date() if request.args.get('date_to') else datetime.now().date()
+        date_from = datetime.strptime(request.args['date_from'], '%Y-%m-%d').date() if request.args.get('date_from') else date_to - timedelta(days=29)
+    except ValueError:
+        return jsonify({"msg": "Formato de fecha inválido (YYYY-MM-DD)"}), 400
+    if date_from > date_to:
+        return jsonify({"msg": "date_from no puede ser posterior a date_to"}), 400
+
+    try:
+        with get_db_cursor() as cur:
+            return jsonify(sales_dashboard(cur, tenant_id, date_from, date_to)), 200
+    except Exception as e:
+        app_logger.error(f"Error al generar el dashboard de ventas: {e}")
+        return jsonify({"msg": "Error al generar el dashboard"}), 500
+
+EXPORT_FORMATS = {
+    'csv': ('text/csv; charset=utf-8', csv_chunks),
+    'xlsx': ('application/vnd.openxmlformats-officedocument.spreadsheetml.sheet', xlsx_chunks),
+}
+
+@sale_bp.route('/export', methods=['GET'])
+@jwt_required()
+def export_sales():
+    """
+    Descarga en streaming de ventas, detalle de productos o abonos:
+    ?dataset=sales|items|payments&format=csv|xlsx&date_from=&date_to= (YYYY-MM-DD). Solo administradores.
+    """
+    current_user_id, user_role, *_ = get_user_and_role()
+    tenant_id = get_current_tenant()
+    if not tenant_id:
+        return jsonify({"msg": "Falta tenant_id"}), 401
+    if not check_admin_permission(user_role):
+        return jsonify({"msg": "Acceso denegado"}), 403
+
+    dataset = request.args.get('dataset', 'sales')
+    fmt = request.args.get('format', 'csv')
+    if dataset not in EXPORT_DATASETS or fmt not in EXPORT_FORMATS:
+        return jsonify({"msg": "dataset debe ser sales, items o payments y format csv o xlsx"}), 400
+    try:
+        date_from, date_to = (
+            datetime.strptime(request.args[k], '%Y-%m-%d').date() if request.args.get(k) else None
+            for k in ('date_from', 'date_to')
+        )
+    except ValueError:
+        return jsonify({"msg": "Formato de fecha inválido (YYYY-MM-DD)"}), 400
+
+    header, query, params = export_query(dataset, tenant_id, date_from, date_to)
+    mimetype, writer = EXPORT_FORMATS[fmt]
+    filename = f"{dataset}_{date_from or 'inicio'}_{date_to or 'hoy'}.{fmt}"
+    app_logger.info(f"Exportación {dataset}.{fmt} solicitada por {current_user_id}")
+    return Response(
+        stream_with_context(writer(header, stream_rows(query, params))),
+        mimetype=mimetype,
+        headers={'Content-Disposition': f'attachment; filename="{filename}"'}
+    )
+
+@sale_bp.route('/<sale_id>/invoice', methods=['GET'])
+@jwt_required()
+def get_sale_invoice(sale_id):
+    """
+    Factura de la venta en una sola lectura por clave primaria (ver sales_utils.invoice_document).
+    El estado y el saldo se toman de la fila actual, ya que los abonos los modifican después de la venta.
+    """
+    current_user_id, user_role, *_ = get_user_and_role()
+    tenant_id = get_current_tenant()
+    if not tenant_id:
+        return jsonify({"msg": "Falta tenant_id"}), 401
+
+    query = """
+        SELECT invoice_document, user_id, status, balance_due_usd, usd_paid, ves_paid
+        FROM sales
+        WHERE id = %s AND tenant_id = %s::text
+    """
+    try:
+        with get_db_cursor(commit=True) as cur:
+            cur.execute(query, (sale_id, tenant_id))
+            sale = cur.fetchone()
+            if not sale:
+                return jsonify({"msg": "Venta no encontrada"}), 404
+            if not check_admin_permission(user_role) and str(sale['user_id']) != str(current_user_id):
+                return jsonify({"msg": "Acceso denegado"}), 403
+
+            document = sale['invoice_document']
+            if document is None:
+                # Venta anterior a las facturas guardadas: se genera una vez y queda persistida
+                rows = backfill_invoice_documents(cur, tenant_id=tenant_id, sale_id=sale_id, limit=1)
+                document = rows[0]['invoice_document'] if rows else None
+    except Exception as e:
+        app_logger.error(f"Error al obtener factura de venta {sale_id}: {e}")
+        return jsonify({"msg": "Error al obtener la factura"}), 500
+
+    if document is None:
+        return jsonify({"msg": "Venta no encontrada"}), 404
+
+    document['status'] = sale['status']
+    document.setdefault('totals', {}).update({
+        'usd_paid': float(sale['usd_paid'] or 0),
+        'ves_paid': float(sale['ves_paid'] or 0),
+        'balance_due_usd': float(sale['balance_due_usd'] or 0),
+    })
+    return jsonify(document), 200
+
+def _sync_batch(tenant_id, user_id, sales, offset):
+    """
+    Aplica un lote de ventas offline en una transacción; las ya sincronizadas se omiten.
+    El client_ref queda en la propia venta (índice único por comercio, migración 015), así
+    que un reintento del POS nunca duplica, sin importar cuánto tarde en llegar.
+    """
+    results = [None] * len(sales)
+    refs = {
+        i: str(s['client_ref']) for i, s in enumerate(sales)
+        if isinstance(s, dict) and s.get('client_ref')
+    }
+    pending = []
+    try:
+        with get_db_cursor() as cur:
+            synced = {}
+            if refs:
+                keys = sorted(set(refs.values()))
+                cur.execute(
+                    f"""SELECT client_ref, id::text AS sale_id FROM sales
+                        WHERE tenant_id = %s::text AND client_ref IN ({placeholders(len(keys))})""",
+                    [str(tenant_id), *keys]
+                )
+                synced = {row['client_ref']: row['sale_id'] for row in cur.fetchall()}
+
+            seen = set()
+            for i, sale in enumerate(sales):
+                ref = refs.get(i)
+                if ref and (ref in synced or ref in seen):
+                    results[i] = {'client_ref': ref, 'status': 'duplicate', 'sale_id': synced.get(ref)}
+                    continue
+                if ref:
+                    seen.add(ref)
+                pending.append(i)
+
+            batch_results = create_sales_batch(
+                cur, tenant_id, user_id, [sales[i] for i in pending], rate_for=resolve_exchange_rate
+            )
+            for i, result in zip(pending, batch_results):
+                result.pop('index', None)
+                results[i] = result
+            cur.connection.commit()
+    except Exception as e:
+        app_logger.error(f"Error sincronizando lote de ventas: {e}")
+        # Todo el lote se revirtió; si falló antes de clasificarlo, ninguna venta tiene resultado aún
+        failed = set(pending)
+        for i in range(len(sales)):
+            if i in failed or results[i] is None:
+                results[i] = {'client_ref': refs.get(i), 'status': 'error', 'msg': "Error al guardar el lote; reintente"}
+
+    product_ids = {
+        str(item.get('product_id'))
+        for i, r in enumerate(results) if r and r['status'] == 'created'
+        for item in sales[i].get('items', []) if isinstance(item, dict)
+    }
+    verificar_stock_y_alertar_lote(product_ids, tenant_id)
+
+    for i, result in enumerate(results):
+        result['line'] = offset + i + 1
+    return results
+
+@sale_bp.route('/sync', methods=['POST'])
+@jwt_required()
+def sync_offline_sales():
+    """
+    Sincronización masiva de ventas hechas sin conexión.
+    Cuerpo: NDJSON (una venta por línea, mismo formato que POST /api/sales más
+    `client_ref`, `sale_date` y opcionalmente `exchange_rate`). Se procesa en lotes
+    de SALES_SYNC_BATCH_SIZE, cada uno en su propia transacción.
+    """
+    current_user_id, user_role, *_ = get_user_and_role()
+    tenant_id = get_current_tenant()
+
+    if not tenant_id:
+        return jsonify({"msg": "Token inválido: Falta identificador de empresa"}), 401
+    if not check_seller_permission(user_role):
+        return jsonify({"msg": "Acceso denegado: Solo personal de ventas"}), 403
+
+    results = []
+    batch = []
+    for raw in request.stream:
+        raw = raw.strip()
+        if not raw:
+            continue
         try:
-            with get_db_cursor() as cur:
-                # 🛠️ MEJORA: Traemos TODO lo necesario para la factura de una vez
-                query = """
-                    SELECT 
-                        s.id::text, 
-                        s.sale_date::text, 
-                        s.status, 
-                        s.total_amount_usd, 
-                        s.total_amount_ves,
-                        s.exchange_rate_used,
-                        s.balance_due_usd, 
-                        s.tipo_pago,
-                        c.name as customer_name,
-                        c.cedula as customer_cedula, -- Agregamos la cédula
-                        u.nombre as seller_name,
-                        -- Generamos un JSON con los detalles exactos de cada producto
-                        json_agg(
-                            json_build_object(
-                                'name', p.name, 
-                                'qty', si.quantity,
-                                'price_usd', si.price -- Traemos el precio histórico de la venta
-                            )
-                        ) as items
-                    FROM sales s
-                    JOIN customers c ON s.customer_id = c.id
-                    JOIN users u ON s.user_id = u.id
-                    JOIN sale_items si ON s.id = si.sale_id
-                    JOIN products p ON si.product_id = p.id
-                    WHERE s.tenant_id = %s::text
-                """
-                params = [tenant_id]
-                
-                if not check_admin_permission(user_role):
-                    query += " AND s.user_id = %s"
-                    params.append(current_user_id)
-                
-                # Agrupamos por los campos de las tablas principales para que json_agg funcione
-                query += """ 
-                    GROUP BY 
-                        s.id, c.name, c.cedula, u.nombre 
-                    ORDER BY s.sale_date DESC
-                """
-                
-                cur.execute(query, params)
-                results = cur.fetchall()
-                
-                # Convertimos a lista de diccionarios para enviar al Frontend
-                return jsonify([dict(r) for r in results]), 200
-                
-        except Exception as e:
-            app_logger.error(f"Error al listar ventas detalladas: {e}")
-            return jsonify({"msg": "Error al listar ventas"}), 500
+            batch.append(json.loads(raw))
+        except ValueError:
+            batch.append(None)
+        if len(batch) >= Config.SALES_SYNC_BATCH_SIZE:
+            results.extend(_sync_batch(tenant_id, current_user_id, batch, len(results)))
+            batch = []
+    if batch:
+        results.extend(_sync_batch(tenant_id, current_user_id, batch, len(results)))
+
+    summary = {status: sum(1 for r in results if r['status'] == status) for status in ('created', 'duplicate', 'error')}
+    return jsonify({"msg": "Sincronización procesada", **summary, "results": results}), 200
 
 @sale_bp.route('/credits/pending', methods=['GET'])
 @jwt_required()
@@ -222,7 +452,7 @@ def get_pending_credits():
                 JOIN customers c ON s.customer_id = c.id
                 WHERE s.tenant_id = %s::text 
                   AND s.balance_due_usd > 0.05
-                  AND (s.fecha_vencimiento IS NOT NULL OR s.status ILIKE '%%credito%%')
+                  AND s.fecha_vencimiento IS NOT NULL
                 ORDER BY s.fecha_vencimiento ASC
             """
             cur.execute(query, [tenant_id])
@@ -230,6 +460,30 @@ def get_pending_credits():
     except Exception as e:
         return jsonify({"msg": "Error al obtener créditos"}), 500
 
+@sale_bp.route('/credits/aging', methods=['GET'])
+@jwt_required()
+def get_credits_aging():
+    """
+    Antigüedad de saldos (al día, 1-30, 31-60, 61-90, +90 días de mora) por cliente y total
+    del comercio. Se sirve desde un snapshot en memoria; ?refresh=1 lo recalcula y
+    ?customer_id= deja solo a ese cliente.
+    """
+    tenant_id = get_current_tenant()
+    if not tenant_id:
+        return jsonify({"msg": "Falta tenant_id"}), 401
+
+    refresh = request.args.get('refresh', '').lower() in ('1', 'true')
+    try:
+        snapshot = get_aging_snapshot(tenant_id, refresh=refresh)
+    except Exception as e:
+        app_logger.error(f"Error al calcular antigüedad de saldos: {e}")
+        return jsonify({"msg": "Error al obtener antigüedad de saldos"}), 500
+
+    customer_id = request.args.get('customer_id')
+    if customer_id:
+        snapshot = {**snapshot, 'customers': [c for c in snapshot['customers'] if c['customer_id'] == customer_id]}
+    return jsonify(snapshot), 200
+
 @sale_bp.route('/customer/<customer_id>/credit-sales', methods=['GET'])
 @jwt_required()
 def get_customer_credit_sales(customer_id):
@@ -253,19 +507,8 @@ def get_customer_credit_sales(customer_id):
         app_logger.error(f"Error al obtener créditos del cliente: {e}")
         return jsonify({"msg": "Error interno del servidor"}), 500
 
-@sale_bp.route('/pay-credit', methods=['POST'])
-@jwt_required()
-def pay_credit():
-    current_user_id, user_role, *_ = get_user_and_role()
-    tenant_id = get_current_tenant()
-    data = request.get_json()
-
-    # 1. Validar campos básicos requeridos en el JSON
-    fields = ['sale_id', 'payment_amount', 'payment_currency']
-    if error := validate_required_fields(data, fields):
-        return jsonify({"msg": f"Faltan campos: {error}"}), 400
-
-    # 2. SEGURIDAD: Lógica de Autorización
+def check_credit_payment_authorization(data, current_user_id, user_role, tenant_id):
+    """Los abonos los registra un admin, o un vendedor con el código diario del admin. Devuelve la respuesta 403 o None."""
     es_admin = check_admin_permission(user_role)
     
     if not es_admin:
@@ -281,6 +524,34 @@ def pay_credit():
     else:
         # SI ES ADMIN, SOLO LOGUEAMOS EL BYPASS
         app_logger.info(f"ADMIN BYPASS: Usuario {current_user_id} autorizó pago de crédito directamente.")
+    return None
+
+@sale_bp.route('/pay-credit', methods=['POST'])
+@jwt_required()
+@idempotent
+def pay_credit():
+    current_user_id, user_role, *_ = get_user_and_role()
+    tenant_id = get_current_tenant()
+    data = request.get_json()
+
+    # 1. Validar campos básicos requeridos en el JSON
+    fields = ['sale_id', 'payment_amount', 'payment_currency']
+    if error := validate_required_fields(data, fields):
+        return jsonify({"msg": f"Faltan campos: {error}"}), 400
+    if data['payment_currency'] not in PAYMENT_CURRENCIES:
+        return jsonify({"msg": f"payment_currency debe ser {' o '.join(PAYMENT_CURRENCIES)}"}), 400
+
+    # 2. SEGURIDAD: Lógica de Autorización
+    if denied := check_credit_payment_authorization(data, current_user_id, user_role, tenant_id):
+        return denied
+
+    # La tasa la resuelve el servidor desde la serie local (no se confía en el cliente), antes de
+    # bloquear la factura: si hay que consultar el upstream no se hace con la fila bloqueada
+    try:
+        exchange_rate = resolve_exchange_rate()
+    except Exception as e:
+        app_logger.error(f"Error BCV: {e}")
+        return jsonify({"msg": "No se pudo obtener la tasa de cambio"}), 500
 
     cur = None
     try:
@@ -303,8 +574,7 @@ def pay_credit():
             
             # 4. Cálculos de montos y conversión de moneda
             payment_amount = float(data['payment_amount'])
-            exchange_rate = float(data.get('exchange_rate', 1))
-            
+
             if data['payment_currency'] == 'USD':
                 amt_usd = round(payment_amount, 2)
                 amt_ves = round(payment_amount * exchange_rate, 2)
@@ -361,6 +631,12 @@ def pay_credit():
                 WHERE id = %s AND tenant_id = %s::text
             """, (amt_usd, real_customer_id, tenant_id))
 
+            # 8. Cobranza del día en los agregados del dashboard
+            stats = StatDeltas(tenant_id)
+            stats.add_payment(current_user_id, datetime.now(), amt_usd, amt_ves)
+            stats.apply(cur)
+            notify_catalog_change(cur, tenant_id, 'customers', 'sales')
+
             # Si todo salió bien, guardamos cambios
             cur.connection.commit()
             
@@ -376,6 +652,57 @@ def pay_credit():
         print(f"CRITICAL ERROR IN PAY_CREDIT: {str(e)}")
         return jsonify({"msg": f"Error interno en el servidor: {str(e)}"}), 500
     
+@sale_bp.route('/customer/<customer_id>/pay', methods=['POST'])
+@jwt_required()
+@idempotent
+def pay_customer_credits(customer_id):
+    """
+    Abono de un cliente repartido entre sus facturas pendientes, de la más antigua a la más
+    reciente, en una sola transacción. Cuerpo: payment_amount, payment_currency (USD|VES)
+    y admin_auth_code si quien registra es vendedor.
+    """
+    current_user_id, user_role, *_ = get_user_and_role()
+    tenant_id = get_current_tenant()
+    data = request.get_json()
+
+    if error := validate_required_fields(data, ['payment_amount', 'payment_currency']):
+        return jsonify({"msg": f"Faltan campos: {error}"}), 400
+    if data['payment_currency'] not in PAYMENT_CURRENCIES:
+        return jsonify({"msg": f"payment_currency debe ser {' o '.join(PAYMENT_CURRENCIES)}"}), 400
+    if denied := check_credit_payment_authorization(data, current_user_id, user_role, tenant_id):
+        return denied
+
+    try:
+        payment_amount = float(data['payment_amount'])
+    except (TypeError, ValueError):
+        return jsonify({"msg": "payment_amount debe ser numérico"}), 400
+
+    # La tasa la resuelve el servidor desde la serie local (no se confía en el cliente), antes
+    # de bloquear las facturas del cliente
+    try:
+        exchange_rate = resolve_exchange_rate()
+    except Exception as e:
+        app_logger.error(f"Error BCV: {e}")
+        return jsonify({"msg": "No se pudo obtener la tasa de cambio"}), 500
+
+    cur = None
+    try:
+        with get_db_cursor(commit=False) as cur:
+            result = pay_customer_invoices(
+                cur, tenant_id, current_user_id, customer_id,
+                payment_amount, data['payment_currency'], exchange_rate
+            )
+            cur.connection.commit()
+        return jsonify({"msg": "Pago registrado con éxito", "exchange_rate": exchange_rate, **result}), 200
+
+    except SaleError as e:
+        if cur: cur.connection.rollback()
+        return jsonify({"msg": str(e)}), 400
+    except Exception as e:
+        if cur: cur.connection.rollback()
+        app_logger.error(f"Error al registrar abono del cliente {customer_id}: {e}")
+        return jsonify({"msg": "Error interno en el servidor"}), 500
+
 @sale_bp.route('/admin/security-code', methods=['GET'])
 @jwt_required()
 def generate_daily_admin_code_endpoint():
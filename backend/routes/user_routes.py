@@ -7,8 +7,11 @@ import uuid
 from backend.db import get_db_cursor
 from backend.utils.helpers import (
     get_user_and_role, 
-    check_admin_permission
+    check_admin_permission,
+    invalidate_user_identity
 )
+from backend.utils.catalog_cache import notify_catalog_change
+from backend.utils.etag import conditional_get
 
 # Constantes de Roles
 ALMACENISTA_ROLE_ID = 3 
@@ -64,6 +67,7 @@ def get_user_profile():
 
 @admin_bp.route('/users', methods=['GET']) 
 @jwt_required()
+@conditional_get('users')
 def admin_list_users():
     # AJUSTE: Se añade el desempaquetado extendido (*_) para evitar el ValueError
     current_user_id, user_role_id, *_ = get_user_and_role()
@@ -122,6 +126,7 @@ def admin_create_user():
                 (nombre, cedula, email, password_hash, int(role_id), tenant_id)
             )
             new_user_id = cur.fetchone()['id']
+            notify_catalog_change(cur, tenant_id, 'users')
             return jsonify({"msg": "Empleado creado", "id": str(new_user_id)}), 201
     except Exception as e:
         if 'unique constraint' in str(e).lower():
@@ -150,13 +155,17 @@ def admin_update_user(user_id):
             cur.execute(
                 """
                 UPDATE users 
-                SET nombre = %s, cedula = %s, role_id = %s
+                SET nombre = %s, cedula = %s, role_id = %s,
+                    token_version = token_version + 1
                 WHERE id = %s AND tenant_id = %s
-                RETURNING id
+                RETURNING id, token_version
                 """,
                 (nombre, cedula, int(role_id), str(user_id), tenant_id)
             )
-            if cur.fetchone():
+            updated = cur.fetchone()
+            if updated:
+                notify_catalog_change(cur, tenant_id, 'users', revoked={user_id: updated['token_version']})
+                invalidate_user_identity(user_id, updated['token_version'])
                 return jsonify({"msg": "Empleado actualizado correctamente"}), 200
             return jsonify({"msg": "Usuario no encontrado"}), 404
     except Exception as e:
@@ -177,10 +186,13 @@ def admin_delete_user(user_id):
     try:
         with get_db_cursor(commit=True) as cur:
             cur.execute(
-                "DELETE FROM users WHERE id = %s AND tenant_id = %s RETURNING id", 
+                "DELETE FROM users WHERE id = %s AND tenant_id = %s RETURNING id, token_version", 
                 (str(user_id), tenant_id)
             )
-            if cur.fetchone():
+            deleted = cur.fetchone()
+            if deleted:
+                notify_catalog_change(cur, tenant_id, 'users', revoked={user_id: deleted['token_version'] + 1})
+                invalidate_user_identity(user_id, deleted['token_version'] + 1)
                 return jsonify({"msg": "Usuario eliminado"}), 200
             return jsonify({"msg": "Usuario no encontrado"}), 404
     except Exception as e:
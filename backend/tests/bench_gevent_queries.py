@@ -0,0 +1,66 @@
+"""
+Benchmark: consultas lentas concurrentes bajo gevent, con y sin wait callback.
+
+Uso (requiere DATABASE_URL o DB_* en el entorno):
+    python -m backend.tests.bench_gevent_queries --greenlets 10 --sleep 1
+
+Sin el callback, N consultas de `pg_sleep(s)` se ejecutan en serie (~N*s segundos);
+con el callback se solapan (~s segundos) y el "latido" de otro greenlet no se congela.
+"""
+from gevent import monkey
+monkey.patch_all()
+
+import argparse
+import time
+
+import gevent
+import psycopg2.extensions
+
+from backend.db import get_db_cursor, make_psycopg_green
+
+
+def slow_query(seconds):
+    with get_db_cursor(scoped=False) as cur:
+        cur.execute("SELECT pg_sleep(%s)", (seconds,))
+
+
+def heartbeat(stop, gaps):
+    # Mide cuánto tarda el hub en volver a este greenlet (idealmente ~10 ms)
+    last = time.perf_counter()
+    while not stop:
+        gevent.sleep(0.01)
+        now = time.perf_counter()
+        gaps.append(now - last)
+        last = now
+
+
+def run(greenlets, seconds):
+    stop, gaps = [], []
+    hb = gevent.spawn(heartbeat, stop, gaps)
+    start = time.perf_counter()
+    gevent.joinall([gevent.spawn(slow_query, seconds) for _ in range(greenlets)], raise_error=True)
+    elapsed = time.perf_counter() - start
+    stop.append(True)
+    hb.join()
+    return elapsed, max(gaps) if gaps else 0.0
+
+
+def main():
+    parser = argparse.ArgumentParser()
+    parser.add_argument('--greenlets', type=int, default=10)
+    parser.add_argument('--sleep', type=float, default=1.0)
+    args = parser.parse_args()
+
+    psycopg2.extensions.set_wait_callback(None)
+    blocking, blocking_gap = run(args.greenlets, args.sleep)
+
+    make_psycopg_green()
+    green, green_gap = run(args.greenlets, args.sleep)
+
+    print(f"{args.greenlets} x pg_sleep({args.sleep})")
+    print(f"  bloqueante:  total {blocking:6.2f}s  | máx. pausa del hub {blocking_gap * 1000:8.1f} ms")
+    print(f"  cooperativo: total {green:6.2f}s  | máx. pausa del hub {green_gap * 1000:8.1f} ms")
+
+
+if __name__ == '__main__':
+    main()
@@ -0,0 +1,66 @@
+"""
+Prueba de carga: muchos vendedores vendiendo el mismo producto a la vez.
+
+Uso (requiere DATABASE_URL y datos existentes del tenant):
+    python -m backend.tests.bench_hot_sku --tenant T --customer C --user U --product P \\
+        [--workers 16] [--seconds 10] [--work-ms 20]
+
+Compara el rendimiento (ventas/s) de SALE_STOCK_STRATEGY='lock' vs 'atomic'. Cada venta
+se revierte al final, así que no se consume stock real. `--work-ms` simula el resto de la
+transacción (saldo del cliente, factura, etc.) manteniendo la transacción abierta.
+"""
+import argparse
+import threading
+import time
+
+from backend.config import Config
+from backend.db import get_db_cursor
+from backend.utils.sales_utils import create_sale
+
+
+def worker(args, deadline, counter, lock):
+    while time.monotonic() < deadline:
+        with get_db_cursor(scoped=False) as cur:
+            create_sale(
+                cur, args.tenant, args.user, args.customer,
+                [{'product_id': args.product, 'quantity': 1}],
+                exchange_rate=40.0, tipo_pago='Crédito'
+            )
+            # Trabajo posterior dentro de la misma transacción
+            cur.execute("SELECT pg_sleep(%s)", (args.work_ms / 1000.0,))
+            cur.connection.rollback()
+        with lock:
+            counter[0] += 1
+
+
+def run(args, strategy):
+    Config.SALE_STOCK_STRATEGY = strategy
+    counter, lock = [0], threading.Lock()
+    deadline = time.monotonic() + args.seconds
+    threads = [threading.Thread(target=worker, args=(args, deadline, counter, lock)) for _ in range(args.workers)]
+    for t in threads:
+        t.start()
+    for t in threads:
+        t.join()
+    return counter[0] / args.seconds
+
+
+def main():
+    parser = argparse.ArgumentParser()
+    parser.add_argument('--tenant', required=True)
+    parser.add_argument('--customer', required=True)
+    parser.add_argument('--user', required=True)
+    parser.add_argument('--product', required=True)
+    parser.add_argument('--workers', type=int, default=16)
+    parser.add_argument('--seconds', type=float, default=10)
+    parser.add_argument('--work-ms', type=float, default=20)
+    args = parser.parse_args()
+
+    Config.DB_POOL_MAX_SIZE = max(Config.DB_POOL_MAX_SIZE, args.workers)
+    print(f"{args.workers} vendedores, 1 SKU, {args.seconds:.0f}s por estrategia")
+    for strategy in ('lock', 'atomic'):
+        print(f"  {strategy:>6}: {run(args, strategy):8.1f} ventas/s")
+
+
+if __name__ == '__main__':
+    main()
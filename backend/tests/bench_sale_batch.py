@@ -0,0 +1,107 @@
+"""
+Benchmark: creación de ventas línea por línea (pipeline anterior) vs. por lotes (sales_utils).
+
+Uso (requiere DATABASE_URL y datos existentes del tenant):
+    python -m backend.tests.bench_sale_batch --tenant T --customer C --user U [--repeat 5]
+
+Cada venta se ejecuta dentro de una transacción que se revierte al final, así que no deja
+rastro en la base de datos. Se reportan la latencia media y las sentencias ejecutadas.
+"""
+import argparse
+import time
+import uuid
+from datetime import datetime
+
+from backend.db import get_db_cursor
+from backend.utils.sales_utils import create_sale
+
+
+class CountingCursor:
+    """Envuelve un cursor y cuenta las sentencias (round trips) que ejecuta."""
+
+    def __init__(self, cur):
+        self._cur = cur
+        self.statements = 0
+
+    def execute(self, *args, **kwargs):
+        self.statements += 1
+        return self._cur.execute(*args, **kwargs)
+
+    def __getattr__(self, name):
+        return getattr(self._cur, name)
+
+
+def legacy_create_sale(cur, tenant_id, user_id, customer_id, items, exchange_rate):
+    """Pipeline original: un SELECT FOR UPDATE, un INSERT y un UPDATE por línea."""
+    total = 0.0
+    validated = []
+    for item in items:
+        cur.execute(
+            "SELECT name, price, stock FROM products WHERE id = %s AND tenant_id = %s::text FOR UPDATE",
+            (item['product_id'], tenant_id)
+        )
+        product = cur.fetchone()
+        total += float(product['price']) * item['quantity']
+        validated.append({**item, 'price': float(product['price'])})
+    sale_id = str(uuid.uuid4())
+    cur.execute(
+        """INSERT INTO sales (id, customer_id, user_id, tenant_id, sale_date, total_amount_usd, total_amount_ves,
+                              exchange_rate_used, status, tipo_pago, usd_paid, ves_paid, balance_due_usd,
+                              fecha_vencimiento, dias_credito)
+           VALUES (%s, %s, %s, %s, %s, %s, %s, %s, 'Completado', 'Contado', %s, 0, 0, NULL, 0)""",
+        (sale_id, customer_id, user_id, tenant_id, datetime.now(), total, total * exchange_rate, exchange_rate, total)
+    )
+    for item in validated:
+        cur.execute(
+            "INSERT INTO sale_items (sale_id, product_id, quantity, price, tenant_id) VALUES (%s, %s, %s, %s, %s::text)",
+            (sale_id, item['product_id'], item['quantity'], item['price'], tenant_id)
+        )
+        cur.execute(
+            "UPDATE products SET stock = stock - %s WHERE id = %s AND tenant_id = %s::text",
+            (item['quantity'], item['product_id'], tenant_id)
+        )
+
+
+def batched_create_sale(cur, tenant_id, user_id, customer_id, items, exchange_rate):
+    # Pago completo: igual que la versión anterior, sin actualizar el saldo del cliente
+    create_sale(cur, tenant_id, user_id, customer_id, items, exchange_rate, usd_paid=10 ** 9)
+
+
+def measure(fn, args, lines, repeat):
+    elapsed, statements = 0.0, 0
+    for _ in range(repeat):
+        with get_db_cursor(scoped=False) as raw:
+            cur = CountingCursor(raw)
+            start = time.perf_counter()
+            fn(cur, *args[:3], lines, args[3])
+            elapsed += time.perf_counter() - start
+            statements = cur.statements
+            raw.connection.rollback()
+    return elapsed / repeat * 1000, statements
+
+
+def main():
+    parser = argparse.ArgumentParser()
+    parser.add_argument('--tenant', required=True)
+    parser.add_argument('--customer', required=True)
+    parser.add_argument('--user', required=True)
+    parser.add_argument('--repeat', type=int, default=5)
+    args = parser.parse_args()
+
+    with get_db_cursor(scoped=False) as cur:
+        cur.execute("SELECT id FROM products WHERE tenant_id = %s::text AND stock >= 100 ORDER BY id LIMIT 100", (args.tenant,))
+        product_ids = [str(r['id']) for r in cur.fetchall()]
+    if not product_ids:
+        raise SystemExit("El tenant no tiene productos con stock >= 100")
+
+    call_args = (args.tenant, args.user, args.customer, 40.0)
+    print(f"{'líneas':>7} | {'anterior ms':>11} {'sent.':>6} | {'por lotes ms':>12} {'sent.':>6}")
+    for size in (1, 10, 100):
+        lines = [{'product_id': product_ids[i % len(product_ids)], 'quantity': 1} for i in range(size)]
+        legacy_ms, legacy_st = measure(legacy_create_sale, call_args, lines, args.repeat)
+        batch_ms, batch_st = measure(batched_create_sale, call_args, lines, args.repeat)
+        print(f"{size:>7} | {legacy_ms:>11.1f} {legacy_st:>6} | {batch_ms:>12.1f} {batch_st:>6}")
+
+
+if __name__ == '__main__':
+    main()
@@ -0,0 +1,79 @@
+"""Pruebas unitarias de la caché del reporte de antigüedad de saldos (backend/utils/receivables.py) sin base de datos."""
+from contextlib import contextmanager
+
+import pytest
+
+from backend.utils import receivables
+
+
+@pytest.fixture
+def aging(monkeypatch):
+    """compute_aging falso que cuenta los cálculos; la escucha de avisos se controla con state['listening']."""
+    state = {'computed': 0, 'listening': True, 'during_compute': None}
+
+    @contextmanager
+    def cursor(*args, **kwargs):
+        yield None
+
+    def compute_aging(cur, tenant_id):
+        state['computed'] += 1
+        if state['during_compute']:
+            state['during_compute']()
+        return {'tenant': tenant_id, 'n': state['computed']}
+
+    monkeypatch.setattr(receivables, 'get_db_cursor', cursor)
+    monkeypatch.setattr(receivables, 'compute_aging', compute_aging)
+    monkeypatch.setattr(receivables, 'listening_since', lambda: 1.0 if state['listening'] else None)
+    receivables._snapshots.clear()
+    return state
+
+
+def test_sirve_el_snapshot_cacheado(aging):
+    first = receivables.get_aging_snapshot('t1')
+    assert receivables.get_aging_snapshot('t1') is first
+    assert aging['computed'] == 1
+    receivables.get_aging_snapshot('t1', refresh=True)
+    assert aging['computed'] == 2
+
+
+@pytest.mark.parametrize('kinds', [['customers'], ['sales'], ['stock', 'sales', 'customers']])
+def test_aviso_de_otro_worker_descarta_el_snapshot(aging, kinds):
+    receivables.get_aging_snapshot('t1')
+    receivables.get_aging_snapshot('t2')
+    receivables._on_catalog_change({'tenant': 't1', 'kinds': kinds, 'pid': 0})
+    receivables.get_aging_snapshot('t1')
+    receivables.get_aging_snapshot('t2')
+    assert aging['computed'] == 3
+
+
+def test_avisos_que_no_tocan_saldos_no_descartan(aging):
+    receivables.get_aging_snapshot('t1')
+    receivables._on_catalog_change({'tenant': 't1', 'kinds': ['products'], 'pid': 0})
+    receivables.get_aging_snapshot('t1')
+    assert aging['computed'] == 1
+
+
+def test_perdida_de_avisos_descarta_todo(aging):
+    receivables.get_aging_snapshot('t1')
+    receivables.get_aging_snapshot('t2')
+    receivables._on_catalog_change(None)
+    receivables.get_aging_snapshot('t1')
+    receivables.get_aging_snapshot('t2')
+    assert aging['computed'] == 4
+
+
+def test_calculo_concurrente_con_un_cambio_no_se_guarda(aging):
+    aging['during_compute'] = lambda: receivables._on_catalog_change({'tenant': 't1', 'kinds': ['sales']})
+    receivables.get_aging_snapshot('t1')
+    aging['during_compute'] = None
+    receivables.get_aging_snapshot('t1')
+    assert aging['computed'] == 2
+
+
+def test_sin_escucha_se_calcula_en_cada_lectura(aging):
+    aging['listening'] = False
+    receivables.get_aging_snapshot('t1')
+    receivables.get_aging_snapshot('t1')
+    assert aging['computed'] == 2
+    receivables.refresh_aging_snapshots()
+    assert aging['computed'] == 2
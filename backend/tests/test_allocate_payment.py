@@ -0,0 +1,60 @@
+"""Pruebas unitarias del reparto FIFO de abonos entre facturas y su validación (backend/utils/sales_utils.py)."""
+from decimal import Decimal
+
+import pytest
+
+from backend.utils.sales_utils import SaleError, allocate_payment, payment_status, pay_customer_invoices
+
+
+def test_cubre_de_la_mas_antigua_a_la_mas_reciente():
+    invoices = [('a', 10.0), ('b', 20.0), ('c', 30.0)]
+    assert allocate_payment(invoices, 25.0) == [('a', 10.0, 0.0), ('b', 15.0, 5.0)]
+
+
+def test_no_incluye_facturas_que_no_reciben_pago():
+    assert allocate_payment([('a', 10.0), ('b', 20.0)], 10.0) == [('a', 10.0, 0.0)]
+
+
+def test_abono_mayor_a_la_deuda_se_limita_a_los_saldos():
+    assert allocate_payment([('a', 10.0), ('b', 5.0)], 100.0) == [('a', 10.0, 0.0), ('b', 5.0, 0.0)]
+
+
+def test_acepta_saldos_decimal():
+    assert allocate_payment([('a', Decimal('12.34'))], 12.0) == [('a', 12.0, 0.34)]
+
+
+def test_conserva_el_residual_bajo_la_tolerancia():
+    # Antes el residual de 0.03 se escribía como 0 y el saldo del cliente quedaba 0.03 por encima
+    assert allocate_payment([('a', 10.03)], 10.0) == [('a', 10.0, 0.03)]
+
+
+@pytest.mark.parametrize('amount', [0.01, 9.99, 10.0, 10.04, 33.33, 59.98, 60.0])
+def test_lo_aplicado_es_exactamente_lo_que_bajan_los_saldos(amount):
+    invoices = [('a', 10.04), ('b', 19.97), ('c', 29.99)]
+    allocations = allocate_payment(invoices, amount)
+    before = dict(invoices)
+    applied = round(sum(a for _, a, _ in allocations), 2)
+    reduced = round(sum(before[sale_id] - new for sale_id, _, new in allocations), 2)
+    assert applied == reduced
+    assert applied == round(min(amount, sum(before.values())), 2)
+
+
+def test_redondea_a_centavos():
+    allocations = allocate_payment([('a', 0.1), ('b', 0.2)], 0.3)
+    assert allocations == [('a', 0.1, 0.0), ('b', 0.2, 0.0)]
+
+
+def test_monto_cero_no_reparte():
+    assert allocate_payment([('a', 10.0)], 0) == []
+
+
+@pytest.mark.parametrize('balance, status', [(0.0, 'Pagado'), (0.04, 'Pagado'), (0.05, 'Abonado'), (12.0, 'Abonado')])
+def test_payment_status(balance, status):
+    assert payment_status(balance) == status
+
+
+@pytest.mark.parametrize('currency', ['usd', 'Bs', '', None])
+def test_moneda_invalida_se_rechaza_antes_de_tocar_la_db(currency):
+    # cur=None: la validación no puede llegar a ejecutar sentencias
+    with pytest.raises(SaleError, match="Moneda de pago inválida"):
+        pay_customer_invoices(None, 't1', 'u1', 'c1', 100.0, currency, 40.0)
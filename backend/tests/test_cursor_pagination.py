@@ -0,0 +1,60 @@
+"""Pruebas unitarias de la paginación por cursor (backend/utils/helpers.py)."""
+import base64
+import json
+from datetime import datetime
+
+import pytest
+from flask import Flask
+
+from backend.utils.helpers import encode_cursor, decode_cursor, get_page_limit
+
+
+def test_ida_y_vuelta():
+    values = ['2024-05-01 10:00:00', 'b3c1f6a2-0000-4000-8000-000000000001']
+    assert decode_cursor(encode_cursor(values)) == values
+
+
+def test_fechas_se_serializan_como_texto():
+    sale_date = datetime(2024, 5, 1, 10, 30)
+    assert decode_cursor(encode_cursor([sale_date, 7])) == [str(sale_date), 7]
+
+
+def test_cursor_es_seguro_para_urls():
+    # Valores elegidos para que el base64 estándar produzca '+' y '/'
+    token = encode_cursor(['>>>???', '~~~'])
+    assert '+' not in token and '/' not in token and '=' not in token
+
+
+@pytest.mark.parametrize('token', ['', 'no es base64!', base64.urlsafe_b64encode(b'{not json').decode()])
+def test_cursor_corrupto(token):
+    with pytest.raises(ValueError, match="Cursor inválido"):
+        decode_cursor(token)
+
+
+def test_cursor_que_no_es_lista():
+    token = base64.urlsafe_b64encode(json.dumps({'id': 1}).encode()).decode()
+    with pytest.raises(ValueError, match="Cursor inválido"):
+        decode_cursor(token)
+
+
+@pytest.fixture
+def app():
+    return Flask(__name__)
+
+
+@pytest.mark.parametrize('query, expected', [
+    ('', None),                 # cliente antiguo: respuesta completa
+    ('?cursor=abc', 50),
+    ('?limit=20', 20),
+    ('?limit=0', 1),
+    ('?limit=1000', 200),
+])
+def test_get_page_limit(app, query, expected):
+    with app.test_request_context(f'/api/sales{query}'):
+        assert get_page_limit(50, 200) == expected
+
+
+def test_get_page_limit_invalido(app):
+    with app.test_request_context('/api/sales?limit=diez'):
+        with pytest.raises(ValueError, match="limit"):
+            get_page_limit(50, 200)
@@ -0,0 +1,90 @@
+"""Pruebas unitarias de los generadores de exportación CSV y XLSX (backend/utils/export_utils.py)."""
+import io
+import csv
+import zipfile
+import xml.etree.ElementTree as ET
+from datetime import date, datetime
+from decimal import Decimal
+
+from backend.utils.export_utils import csv_chunks, xlsx_chunks
+
+NS = {'x': 'http://schemas.openxmlformats.org/spreadsheetml/2006/main'}
+HEADER = ['Fecha', 'Cliente', 'Total USD']
+
+
+def read_csv(chunks):
+    text = ''.join(chunks)
+    assert text.startswith('\ufeff')
+    return list(csv.reader(io.StringIO(text[1:])))
+
+
+def read_sheet(chunks):
+    with zipfile.ZipFile(io.BytesIO(b''.join(chunks))) as zf:
+        assert zf.testzip() is None
+        workbook = ET.fromstring(zf.read('xl/workbook.xml'))
+        root = ET.fromstring(zf.read('xl/worksheets/sheet1.xml'))
+    sheet_name = workbook.find('x:sheets/x:sheet', NS).get('name')
+    rows = []
+    for row in root.iterfind('x:sheetData/x:row', NS):
+        values = []
+        for cell in row:
+            if cell.get('t') == 'inlineStr':
+                values.append(cell.find('x:is/x:t', NS).text or '')
+            else:
+                values.append(float(cell.find('x:v', NS).text))
+        rows.append(values)
+    return sheet_name, rows
+
+
+def test_csv_formatea_valores():
+    rows = [(datetime(2024, 5, 1, 10, 30), 'Pérez, Ana', Decimal('12.50')), (date(2024, 5, 2), None, 3)]
+    assert read_csv(csv_chunks(HEADER, rows)) == [
+        HEADER,
+        ['2024-05-01T10:30:00', 'Pérez, Ana', '12.50'],
+        ['2024-05-02', '', '3'],
+    ]
+
+
+def test_csv_entrega_por_trozos():
+    rows = [(i, f'c{i}', i) for i in range(5)]
+    chunks = list(csv_chunks(HEADER, iter(rows), chunk_rows=2))
+    # 2 trozos llenos + el resto (1 fila)
+    assert len(chunks) == 3
+    assert len(read_csv(chunks)) == 6
+
+
+def test_csv_sin_filas():
+    assert read_csv(csv_chunks(HEADER, [])) == [HEADER]
+
+
+def test_xlsx_valido_con_tipos():
+    rows = [(datetime(2024, 5, 1), 'A & <B>', Decimal('12.5')), (None, True, 3)]
+    sheet_name, sheet_rows = read_sheet(xlsx_chunks(HEADER, rows, sheet='Ventas & Co'))
+    assert sheet_name == 'Ventas & Co'
+    assert sheet_rows == [
+        HEADER,
+        ['2024-05-01T00:00:00', 'A & <B>', 12.5],
+        ['', 'True', 3.0],
+    ]
+
+
+def test_xlsx_consume_las_filas_por_trozos():
+    consumed = []
+
+    def rows():
+        for i in range(5):
+            consumed.append(i)
+            yield (i, 'x', i)
+
+    gen = xlsx_chunks(HEADER, rows(), chunk_rows=2)
+    next(gen)                       # partes fijas del libro
+    assert consumed == []
+    next(gen)                       # primer trozo de la hoja
+    assert consumed == [0, 1]
+
+
+def test_xlsx_completo_al_juntar_los_trozos():
+    rows = [(i, f'cliente {i}', i * 1.5) for i in range(1200)]
+    _, sheet_rows = read_sheet(list(xlsx_chunks(HEADER, rows, chunk_rows=500)))
+    assert len(sheet_rows) == 1201
+    assert sheet_rows[-1] == [1199.0, 'cliente 1199', 1798.5]
@@ -0,0 +1,99 @@
+"""
+Prueba de concurrencia: las escrituras que tocan clientes, agregados diarios, versiones del
+catálogo y productos (ventas, ventas por lote, abonos y ajustes de stock) no se interbloquean:
+todas bloquean en ese orden, con los productos al final.
+
+Requiere DATABASE_URL y datos existentes del tenant (como los bench_*):
+    LOCK_TEST_TENANT=T LOCK_TEST_USER=U LOCK_TEST_CUSTOMER=C LOCK_TEST_PRODUCTS=P1,P2 \\
+        python -m pytest backend/tests/test_lock_order.py
+Cada transacción se revierte al final, así que no cambia stock ni saldos.
+"""
+import os
+import random
+import threading
+import time
+
+import psycopg2.errors
+import pytest
+
+from backend.config import Config
+from backend.db import get_db_cursor
+from backend.utils.sales_utils import SaleError, create_sale, create_sales_batch, pay_customer_invoices
+from backend.utils.stock_ledger import StockError, adjust_stock
+
+TENANT = os.environ.get('LOCK_TEST_TENANT')
+USER = os.environ.get('LOCK_TEST_USER')
+CUSTOMER = os.environ.get('LOCK_TEST_CUSTOMER')
+PRODUCTS = [p for p in os.environ.get('LOCK_TEST_PRODUCTS', '').split(',') if p]
+
+pytestmark = pytest.mark.skipif(
+    not (Config.DATABASE_URL and TENANT and USER and CUSTOMER and PRODUCTS),
+    reason="Requiere DATABASE_URL y LOCK_TEST_TENANT/USER/CUSTOMER/PRODUCTS",
+)
+
+THREADS = 8
+SECONDS = 5
+
+
+def items():
+    chosen = random.sample(PRODUCTS, random.randint(1, len(PRODUCTS)))
+    return [{'product_id': pid, 'quantity': 1} for pid in chosen]
+
+
+def sale(cur):
+    create_sale(cur, TENANT, USER, CUSTOMER, items(), exchange_rate=40.0, tipo_pago='Crédito')
+
+
+def sale_batch(cur):
+    sales = [{'customer_id': CUSTOMER, 'items': items(), 'tipo_pago': 'Crédito', 'exchange_rate': 40.0} for _ in range(3)]
+    create_sales_batch(cur, TENANT, USER, sales, rate_for=lambda _: 40.0)
+
+
+def payment(cur):
+    # Venta a crédito y abono en la misma transacción: siempre hay una factura que pagar
+    sale(cur)
+    pay_customer_invoices(cur, TENANT, USER, CUSTOMER, 1.0, 'USD', 40.0)
+
+
+def adjustment(cur):
+    adjust_stock(cur, TENANT, USER, {pid: 1 for pid in sorted(PRODUCTS)}, 'recepcion')
+
+
+@pytest.mark.parametrize('strategy', ['lock', 'atomic'])
+def test_escrituras_concurrentes_no_se_interbloquean(monkeypatch, strategy):
+    monkeypatch.setattr(Config, 'SALE_STOCK_STRATEGY', strategy)
+    # Una sola sub-fila de agregados y de versiones: todas las transacciones compiten por ellas
+    monkeypatch.setattr(Config, 'SALES_STATS_SHARDS', 1)
+    monkeypatch.setattr(Config, 'COLLECTION_VERSION_SHARDS', 1)
+    monkeypatch.setattr(Config, 'DB_POOL_MAX_SIZE', max(Config.DB_POOL_MAX_SIZE, THREADS))
+
+    deadlocks, errors, done = [], [], [0]
+    deadline = time.monotonic() + SECONDS
+
+    def worker():
+        operations = [sale, sale_batch, payment, adjustment]
+        while time.monotonic() < deadline:
+            operation = random.choice(operations)
+            try:
+                with get_db_cursor(scoped=False) as cur:
+                    operation(cur)
+                    # Mantener los bloqueos un momento, como el resto de una petición
+                    cur.execute("SELECT pg_sleep(0.005)")
+                    cur.connection.rollback()
+                done[0] += 1
+            except psycopg2.errors.DeadlockDetected as e:
+                deadlocks.append((operation.__name__, str(e)))
+            except (SaleError, StockError):
+                pass
+            except Exception as e:
+                errors.append((operation.__name__, repr(e)))
+
+    threads = [threading.Thread(target=worker) for _ in range(THREADS)]
+    for thread in threads:
+        thread.start()
+    for thread in threads:
+        thread.join()
+
+    assert deadlocks == []
+    assert errors == []
+    assert done[0] > 0
@@ -0,0 +1,100 @@
+"""Pruebas unitarias de la lectura y validación de la importación de productos (backend/utils/product_import.py)."""
+import io
+
+import pytest
+
+from backend.utils.product_import import parse_rows, validate_row, collect_rows
+
+
+def row(**overrides):
+    data = {'sku': 'PVC-12', 'name': ' Tubo PVC ', 'price': '3.499', 'stock': '10', 'category': 'Plomería'}
+    data.update(overrides)
+    return data
+
+
+# --- validate_row ---
+
+def test_normaliza_la_fila():
+    assert validate_row(row()) == ('PVC-12', 'Tubo PVC', 3.5, 10, 'Plomería')
+
+
+def test_sku_vacio_es_none():
+    assert validate_row(row(sku='  '))[0] is None
+    assert validate_row(row(sku=None))[0] is None
+
+
+@pytest.mark.parametrize('stock, expected', [(None, None), ('', None), ('7', 7), ('7.0', 7), (3, 3)])
+def test_stock_opcional(stock, expected):
+    assert validate_row(row(stock=stock))[3] == expected
+
+
+@pytest.mark.parametrize('overrides, msg', [
+    ({'name': '  '}, "Falta name"),
+    ({'category': None}, "Falta category"),
+    ({'price': 'gratis'}, "price debe ser numérico"),
+    ({'price': None}, "price debe ser numérico"),
+    ({'price': '-1'}, "price no puede ser negativo"),
+    ({'stock': 'diez'}, "stock debe ser entero"),
+    ({'stock': '-3'}, "stock no puede ser negativo"),
+])
+def test_filas_invalidas(overrides, msg):
+    with pytest.raises(ValueError, match=msg):
+        validate_row(row(**overrides))
+
+
+def test_linea_ilegible():
+    with pytest.raises(ValueError, match="Línea ilegible"):
+        validate_row(None)
+
+
+# --- collect_rows ---
+
+def test_separa_validas_y_errores_con_su_linea():
+    parsed = [(1, row()), (2, None), (3, row(sku='X-1', price='abc')), (4, row(sku='X-2', name='Codo'))]
+    rows, errors = collect_rows(parsed, max_rows=100)
+    assert rows == [
+        (1, 'PVC-12', 'Tubo PVC', 3.5, 10, 'Plomería'),
+        (4, 'X-2', 'Codo', 3.5, 10, 'Plomería'),
+    ]
+    assert errors == [{'line': 2, 'msg': "Línea ilegible"}, {'line': 3, 'msg': "price debe ser numérico"}]
+
+
+def test_repetidos_gana_la_primera():
+    parsed = [
+        (1, row()),
+        (2, row(name='Otro nombre')),                  # mismo SKU
+        (3, row(sku=None, name='Codo')),
+        (4, row(sku=None, name=' CODO ')),             # mismo nombre sin SKU, sin distinguir mayúsculas
+        (5, row(sku='C-1', name='Codo')),              # con SKU la clave es el SKU, no el nombre
+    ]
+    rows, errors = collect_rows(parsed, max_rows=100)
+    assert [r[0] for r in rows] == [1, 3, 5]
+    assert errors == [
+        {'line': 2, 'msg': "Producto repetido en el archivo (línea 1)"},
+        {'line': 4, 'msg': "Producto repetido en el archivo (línea 3)"},
+    ]
+
+
+def test_corta_al_superar_el_maximo_sin_leer_el_resto():
+    def parsed():
+        for line in range(1, 10 ** 6):
+            yield line, row(sku=f"S-{line}")
+    rows, errors = collect_rows(parsed(), max_rows=3)
+    assert len(rows) == 3
+    assert errors == [{'line': 4, 'msg': "Se superó el máximo de 3 filas por importación"}]
+
+
+# --- parse_rows ---
+
+def test_parse_csv_con_bom_y_encabezados_libres():
+    body = '\ufeffSKU, Name ,price,stock,Category\r\nA-1,Tubo,1.5,,Plomería\r\n'.encode('utf-8')
+    assert list(parse_rows(io.BytesIO(body), 'text/csv; charset=utf-8')) == [
+        (2, {'sku': 'A-1', 'name': 'Tubo', 'price': '1.5', 'stock': '', 'category': 'Plomería'}),
+    ]
+
+
+def test_parse_ndjson():
+    body = b'{"name": "Tubo"}\n\n{roto\n[1, 2]\n'
+    assert list(parse_rows(io.BytesIO(body), 'application/x-ndjson')) == [
+        (1, {'name': 'Tubo'}), (3, None), (4, None),
+    ]
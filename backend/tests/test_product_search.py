@@ -0,0 +1,114 @@
+"""Pruebas unitarias del índice de búsqueda de productos en memoria (backend/utils/product_search.py)."""
+from backend.utils.product_search import ProductIndex, normalize, tokenize
+
+CATALOG = [
+    {'id': 1, 'name': 'Tubería PVC 1/2"', 'price': '3.50', 'category': 'Plomería'},
+    {'id': 2, 'name': 'Codo PVC 1/2"', 'price': 1, 'category': 'Plomería'},
+    {'id': 3, 'name': 'Pintura Blanca', 'price': 20, 'category': 'Pinturas'},
+    {'id': 4, 'name': 'Tubo fluorescente', 'price': 4, 'category': 'Electricidad'},
+    {'id': 5, 'name': 'Llave de paso', 'price': None, 'category': 'Plomería'},
+    {'id': 6, 'name': 'Brocha', 'price': 2, 'category': None},
+]
+
+
+def ids(results):
+    return [p['id'] for p in results]
+
+
+def test_normalize_y_tokenize():
+    assert normalize('Tubería PVC') == 'tuberia pvc'
+    assert tokenize('Tubería PVC 1/2"') == ['tuberia', 'pvc', '1', '2']
+
+
+def test_busqueda_por_prefijo_sin_acentos():
+    index = ProductIndex(CATALOG)
+    assert ids(index.search('tuberia', 10)) == [1]
+    assert ids(index.search('TUBER', 10)) == [1]
+    assert set(ids(index.search('tub', 10))) == {1, 4}
+
+
+def test_todos_los_terminos_deben_coincidir():
+    index = ProductIndex(CATALOG)
+    assert ids(index.search('pvc codo', 10)) == [2]
+    assert ids(index.search('pvc pintura', 10)) == []
+
+
+def test_primero_los_nombres_que_empiezan_por_la_busqueda_y_los_mas_cortos():
+    index = ProductIndex(CATALOG)
+    # Ninguno empieza por 'pvc': va primero el nombre más corto
+    assert ids(index.search('pvc', 10)) == [2, 1]
+    # 'Codo PVC' empieza por 'codo'; 'Tubería PVC' (16 caracteres) antes que 'Tubo fluorescente' (17)
+    assert ids(index.search('codo', 10)) == [2]
+    assert ids(index.search('tub', 10)) == [1, 4]
+    assert ids(index.search('pvc tuberia', 10)) == [1]
+
+    index = ProductIndex([
+        {'id': 1, 'name': 'Cinta teflón', 'price': 1, 'category': None},
+        {'id': 2, 'name': 'Teflón líquido industrial', 'price': 5, 'category': None},
+    ])
+    assert ids(index.search('teflon', 10)) == [2, 1]
+
+
+def test_completa_con_productos_de_la_categoria():
+    index = ProductIndex(CATALOG)
+    # 'plomeria' solo está en la categoría: sus productos, nombres más cortos primero
+    assert ids(index.search('plomeria', 10)) == [2, 5, 1]
+    # Las coincidencias por nombre van antes que las que necesitan la categoría
+    assert ids(index.search('pint', 10)) == [3]
+
+
+def test_termino_en_categoria_y_otro_en_nombre():
+    index = ProductIndex(CATALOG)
+    assert ids(index.search('plomeria llave', 10)) == [5]
+    assert ids(index.search('plomeria blanca', 10)) == []
+
+
+def test_respeta_el_limite():
+    index = ProductIndex(CATALOG)
+    assert ids(index.search('plomeria', 2)) == [2, 5]
+    assert len(index.search('p', 3)) == 3
+
+
+def test_busqueda_vacia():
+    index = ProductIndex(CATALOG)
+    assert index.search('', 10) == []
+    assert index.search('  ¿? ', 10) == []
+
+
+def test_resultado_con_precio_flotante():
+    index = ProductIndex(CATALOG)
+    assert index.search('tuberia', 1) == [{'id': 1, 'name': 'Tubería PVC 1/2"', 'price': 3.5, 'category': 'Plomería'}]
+    assert index.search('llave', 1)[0]['price'] is None
+
+
+def test_upsert_reemplaza_nombre_y_categoria():
+    index = ProductIndex(CATALOG)
+    index.upsert({'id': 2, 'name': 'Codo galvanizado', 'price': 1, 'category': 'Ferretería'})
+    assert ids(index.search('pvc', 10)) == [1]
+    assert ids(index.search('galv', 10)) == [2]
+    assert ids(index.search('ferreteria', 10)) == [2]
+    assert 2 not in ids(index.search('plomeria', 10))
+    assert len(index) == len(CATALOG)
+
+
+def test_upsert_de_producto_nuevo_mantiene_el_orden():
+    index = ProductIndex(CATALOG)
+    index.upsert({'id': 7, 'name': 'Tubo', 'price': 1, 'category': 'Plomería'})
+    assert ids(index.search('tub', 10)) == [7, 1, 4]
+
+
+def test_remove_limpia_la_categoria_vacia():
+    index = ProductIndex(CATALOG)
+    index.remove(3)
+    index.remove(3)                 # eliminar dos veces no falla
+    assert index.search('pintura', 10) == []
+    assert len(index) == len(CATALOG) - 1
+
+
+def test_construccion_en_lote_igual_a_incremental():
+    batch = ProductIndex(CATALOG)
+    incremental = ProductIndex()
+    for product in reversed(CATALOG):
+        incremental.upsert(product)
+    for query in ('p', 'pvc', 'plomeria', 'tub', 'b', 'llave de'):
+        assert batch.search(query, 10) == incremental.search(query, 10)
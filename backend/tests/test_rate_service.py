@@ -0,0 +1,157 @@
+"""Pruebas unitarias de CircuitBreaker y ExchangeRateService (backend/utils/bcv_api.py), sin red."""
+import threading
+import time
+
+import pytest
+import requests
+
+from backend.utils import bcv_api
+from backend.utils.bcv_api import CircuitBreaker, ExchangeRateService, DEFAULT_RATE
+
+
+@pytest.fixture
+def clock(monkeypatch):
+    now = [1000.0]
+    monkeypatch.setattr(bcv_api.time, 'monotonic', lambda: now[0])
+    return now
+
+
+def make_service(fetcher, ttl=60, max_stale=600, threshold=3, reset_timeout=30):
+    return ExchangeRateService(fetcher, ttl=ttl, max_stale=max_stale,
+                               breaker=CircuitBreaker(threshold, reset_timeout))
+
+
+# --- CircuitBreaker ---
+
+def test_breaker_abre_tras_el_umbral(clock):
+    breaker = CircuitBreaker(threshold=3, reset_timeout=30)
+    for _ in range(2):
+        breaker.record_failure()
+        assert breaker.allow()
+    breaker.record_failure()
+    assert breaker.is_open
+    assert not breaker.allow()
+
+
+def test_breaker_half_open_permite_un_solo_intento(clock):
+    breaker = CircuitBreaker(threshold=1, reset_timeout=30)
+    breaker.record_failure()
+    clock[0] += 29
+    assert not breaker.allow()
+    clock[0] += 1
+    assert breaker.allow()          # intento de prueba
+    assert not breaker.allow()      # mientras la prueba está en curso, nadie más
+
+
+def test_breaker_prueba_fallida_reabre_y_exitosa_cierra(clock):
+    breaker = CircuitBreaker(threshold=1, reset_timeout=30)
+    breaker.record_failure()
+    clock[0] += 30
+    assert breaker.allow()
+    breaker.record_failure()
+    assert not breaker.allow()      # se reinicia la ventana de espera
+    clock[0] += 30
+    assert breaker.allow()
+    breaker.record_success()
+    assert not breaker.is_open
+    assert breaker.allow() and breaker.allow()
+
+
+# --- ExchangeRateService ---
+
+def test_sirve_la_tasa_cacheada_sin_consultar(clock):
+    calls = []
+    service = make_service(lambda: calls.append(1) or 40.0)
+    assert service.get_rate() == 40.0
+    clock[0] += 300                 # vieja (> ttl) pero dentro de max_stale
+    assert service.get_rate() == 40.0
+    assert len(calls) == 1
+
+
+def test_consulta_en_linea_pasado_max_stale(clock):
+    rates = iter([40.0, 41.0])
+    service = make_service(lambda: next(rates))
+    service.get_rate()
+    clock[0] += 601
+    assert service.get_rate() == 41.0
+
+
+def test_refresh_if_stale_solo_tras_el_ttl(clock):
+    calls = []
+    service = make_service(lambda: calls.append(1) or 40.0)
+    service.refresh_if_stale()
+    clock[0] += 59
+    service.refresh_if_stale()
+    assert len(calls) == 1
+    clock[0] += 1
+    service.refresh_if_stale()
+    assert len(calls) == 2
+
+
+def test_fallo_sin_tasa_previa_usa_la_de_respaldo():
+    def failing():
+        raise requests.exceptions.Timeout()
+    service = make_service(failing)
+    assert service.get_rate() == DEFAULT_RATE
+    assert service.snapshot() == (None, None)
+
+
+def test_fallo_con_tasa_previa_conserva_la_ultima(clock):
+    results = iter([40.0, ValueError("respuesta inválida")])
+
+    def fetcher():
+        value = next(results)
+        if isinstance(value, Exception):
+            raise value
+        return value
+    service = make_service(fetcher)
+    service.get_rate()
+    clock[0] += 601
+    assert service.get_rate() == 40.0
+
+
+def test_circuito_abierto_no_llama_al_upstream():
+    calls = []
+
+    def failing():
+        calls.append(1)
+        raise requests.exceptions.ConnectionError()
+    service = make_service(failing, threshold=2)
+    for _ in range(5):
+        service.get_rate()
+    assert len(calls) == 2
+
+
+def test_single_flight_una_consulta_para_peticiones_concurrentes():
+    started, release = threading.Event(), threading.Event()
+    calls = []
+
+    def slow_fetcher():
+        calls.append(1)
+        started.set()
+        release.wait(5)
+        return 42.0
+
+    service = make_service(slow_fetcher)
+    results = []
+    threads = [threading.Thread(target=lambda: results.append(service.get_rate())) for _ in range(8)]
+    threads[0].start()
+    assert started.wait(5)
+    for thread in threads[1:]:
+        thread.start()
+    time.sleep(0.05)                # los seguidores quedan esperando la consulta en vuelo
+    release.set()
+    for thread in threads:
+        thread.join(5)
+
+    assert len(calls) == 1
+    assert results == [42.0] * 8
+
+
+def test_listeners_reciben_cada_tasa_y_sus_errores_no_afectan():
+    received = []
+    service = make_service(lambda: 40.0)
+    service.add_listener(lambda rate, fetched_at: 1 / 0)
+    service.add_listener(lambda rate, fetched_at: received.append(rate))
+    assert service.refresh() == 40.0
+    assert received == [40.0]
@@ -0,0 +1,92 @@
+"""
+Pruebas unitarias del orden de escritura de las ventas (backend/utils/sales_utils.py): clientes,
+agregados diarios y versiones del catálogo primero; los productos, al final.
+"""
+from decimal import Decimal
+
+import pytest
+
+from backend.config import Config
+from backend.utils import sales_utils
+from backend.utils.sales_utils import SaleError, create_sale, create_sales_batch
+
+PRODUCTS = {
+    'p1': {'id': 'p1', 'name': 'Tubo', 'price': Decimal('2.00'), 'stock': 10, 'category': 'Plomería'},
+    'p2': {'id': 'p2', 'name': 'Codo', 'price': Decimal('1.00'), 'stock': 5, 'category': 'Plomería'},
+}
+
+
+class RecordingCursor:
+    def __init__(self, calls):
+        self.calls = calls
+
+    def execute(self, sql, params=None):
+        self.calls.append(' '.join(str(sql).split()[:2]))
+
+    def fetchall(self):
+        return [{'id': 'c1'}]
+
+
+@pytest.fixture
+def calls(monkeypatch):
+    calls = []
+
+    def record(name, result=None):
+        def fn(*args, **kwargs):
+            calls.append(name)
+            return result(*args) if result else None
+        return fn
+
+    monkeypatch.setattr(sales_utils, 'read_products', record('read_products', lambda cur, t, ids: PRODUCTS))
+    monkeypatch.setattr(sales_utils, 'lock_stock', record(
+        'lock_stock', lambda cur, t, quantities, products: {pid: PRODUCTS[pid]['stock'] for pid in quantities}
+    ))
+    for name in ('reserve_stock', 'decrement_stock', 'insert_movements', 'insert_sale_items',
+                 'add_customer_balances', 'notify_catalog_change', 'execute_values'):
+        monkeypatch.setattr(sales_utils, name, record(name))
+    monkeypatch.setattr(sales_utils.StatDeltas, 'apply', record('stats.apply'))
+    return calls
+
+
+def sale_items():
+    return [{'product_id': 'p2', 'quantity': 1}, {'product_id': 'p1', 'quantity': 2}]
+
+
+def test_atomic_reserva_el_stock_como_ultima_sentencia(monkeypatch, calls):
+    monkeypatch.setattr(Config, 'SALE_STOCK_STRATEGY', 'atomic')
+    create_sale(RecordingCursor(calls), 't1', 'u1', 'c1', sale_items(), exchange_rate=40.0, tipo_pago='Crédito')
+    assert calls == [
+        'read_products', 'INSERT INTO', 'insert_sale_items',
+        'UPDATE customers', 'stats.apply', 'notify_catalog_change', 'reserve_stock',
+    ]
+
+
+def test_lock_bloquea_los_productos_al_final(monkeypatch, calls):
+    monkeypatch.setattr(Config, 'SALE_STOCK_STRATEGY', 'lock')
+    create_sale(RecordingCursor(calls), 't1', 'u1', 'c1', sale_items(), exchange_rate=40.0, tipo_pago='Crédito')
+    assert calls == [
+        'read_products', 'INSERT INTO', 'insert_sale_items',
+        'UPDATE customers', 'stats.apply', 'notify_catalog_change',
+        'lock_stock', 'decrement_stock', 'insert_movements',
+    ]
+
+
+def test_lote_bloquea_los_productos_al_final(calls):
+    sales = [{'customer_id': 'c1', 'items': sale_items(), 'tipo_pago': 'Crédito', 'exchange_rate': 40.0}] * 2
+    results = create_sales_batch(RecordingCursor(calls), 't1', 'u1', sales, rate_for=lambda _: 40.0)
+    assert [r['status'] for r in results] == ['created', 'created']
+    assert calls == [
+        'read_products', 'SELECT id', 'execute_values', 'insert_sale_items',
+        'add_customer_balances', 'stats.apply', 'notify_catalog_change',
+        'lock_stock', 'decrement_stock', 'insert_movements',
+    ]
+
+
+def test_lote_revierte_si_el_stock_ya_no_alcanza_al_bloquear(monkeypatch, calls):
+    def lock_stock(cur, tenant_id, quantities, products):
+        raise SaleError("Stock insuficiente para Tubo")
+    monkeypatch.setattr(sales_utils, 'lock_stock', lock_stock)
+    sales = [{'customer_id': 'c1', 'items': sale_items(), 'exchange_rate': 40.0}]
+    with pytest.raises(SaleError):
+        create_sales_batch(RecordingCursor(calls), 't1', 'u1', sales, rate_for=lambda _: 40.0)
+    assert 'decrement_stock' not in calls
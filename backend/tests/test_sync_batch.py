@@ -0,0 +1,58 @@
+"""Pruebas unitarias de la sincronización offline por lotes (backend/routes/sale_routes.py) sin base de datos."""
+from contextlib import contextmanager
+
+import pytest
+
+from backend.routes import sale_routes
+
+
+@pytest.fixture
+def alerts(monkeypatch):
+    calls = []
+    monkeypatch.setattr(sale_routes, 'verificar_stock_y_alertar_lote', lambda ids, tenant_id=None: calls.append((set(ids), tenant_id)))
+    return calls
+
+
+def failing_cursor(*args, **kwargs):
+    @contextmanager
+    def cursor():
+        raise ConnectionError("sin conexión")
+        yield
+    return cursor()
+
+
+def test_falla_de_la_db_marca_todo_el_lote_como_error(monkeypatch, alerts):
+    monkeypatch.setattr(sale_routes, 'get_db_cursor', failing_cursor)
+    sales = [
+        {'client_ref': 'a', 'customer_id': 'c1', 'items': [{'product_id': 'p1', 'quantity': 1}]},
+        None,
+        {'customer_id': 'c1', 'items': []},
+    ]
+    results = sale_routes._sync_batch('t1', 'u1', sales, offset=10)
+    assert [r['status'] for r in results] == ['error'] * 3
+    assert [r['line'] for r in results] == [11, 12, 13]
+    assert [r['client_ref'] for r in results] == ['a', None, None]
+    assert alerts == [(set(), 't1')]
+
+
+def test_falla_al_guardar_conserva_los_duplicados(monkeypatch, alerts):
+    class Cursor:
+        def execute(self, query, params=None):
+            pass
+
+        def fetchall(self):
+            return [{'client_ref': 'ya', 'sale_id': 's-1'}]
+
+    @contextmanager
+    def cursor(*args, **kwargs):
+        yield Cursor()
+
+    def create_sales_batch(*args, **kwargs):
+        raise RuntimeError("lote revertido")
+
+    monkeypatch.setattr(sale_routes, 'get_db_cursor', cursor)
+    monkeypatch.setattr(sale_routes, 'create_sales_batch', create_sales_batch)
+    sales = [{'client_ref': 'ya'}, {'client_ref': 'nueva'}]
+    results = sale_routes._sync_batch('t1', 'u1', sales, offset=0)
+    assert results[0] == {'client_ref': 'ya', 'status': 'duplicate', 'sale_id': 's-1', 'line': 1}
+    assert results[1]['status'] == 'error' and results[1]['client_ref'] == 'nueva'
@@ -0,0 +1,95 @@
+"""Pruebas unitarias de TTLCache (backend/utils/cache.py): expiración, LRU y operaciones básicas."""
+import pytest
+
+from backend.utils import cache as cache_module
+from backend.utils.cache import TTLCache
+
+
+@pytest.fixture
+def clock(monkeypatch):
+    """Reloj monotónico controlado por la prueba."""
+    now = [1000.0]
+    monkeypatch.setattr(cache_module.time, 'monotonic', lambda: now[0])
+    return now
+
+
+def test_get_set_y_default():
+    cache = TTLCache(maxsize=10, ttl=60)
+    assert cache.get('a') is None
+    assert cache.get('a', 'x') == 'x'
+    cache.set('a', 1)
+    assert cache.get('a') == 1
+    assert 'a' in cache
+    assert len(cache) == 1
+
+
+def test_valores_falsos_se_distinguen_de_ausentes():
+    cache = TTLCache(maxsize=10, ttl=60)
+    cache.set('cero', 0)
+    assert cache.get('cero', 'x') == 0
+    assert 'cero' in cache
+
+
+def test_expira_al_cumplirse_el_ttl(clock):
+    cache = TTLCache(maxsize=10, ttl=5)
+    cache.set('a', 1)
+    clock[0] += 4.9
+    assert cache.get('a') == 1
+    clock[0] += 0.1
+    assert cache.get('a') is None
+    assert 'a' not in cache
+
+
+def test_ttl_por_clave_y_sin_expiracion(clock):
+    cache = TTLCache(maxsize=10, ttl=5)
+    cache.set('corta', 1, ttl=1)
+    cache.set('eterna', 2, ttl=None)
+    clock[0] += 10 ** 6
+    assert cache.get('corta') is None
+    assert cache.get('eterna') == 2
+
+
+def test_desaloja_la_menos_usada():
+    cache = TTLCache(maxsize=2, ttl=60)
+    cache.set('a', 1)
+    cache.set('b', 2)
+    cache.get('a')          # 'a' pasa a ser la más reciente
+    cache.set('c', 3)
+    assert cache.get('b') is None
+    assert cache.get('a') == 1
+    assert cache.get('c') == 3
+    assert len(cache) == 2
+
+
+def test_set_de_clave_existente_no_desaloja():
+    cache = TTLCache(maxsize=2, ttl=60)
+    cache.set('a', 1)
+    cache.set('b', 2)
+    cache.set('a', 10)
+    assert cache.get('a') == 10
+    assert cache.get('b') == 2
+
+
+def test_pop_y_clear():
+    cache = TTLCache(maxsize=10, ttl=60)
+    cache.set('a', 1)
+    cache.set('b', 2)
+    assert cache.pop('a') == 1
+    assert cache.pop('a', 'x') == 'x'
+    cache.clear()
+    assert len(cache) == 0
+    assert cache.get('b') is None
+
+
+def test_keys_omite_vencidas_sin_alterar_el_orden(clock):
+    cache = TTLCache(maxsize=3, ttl=5)
+    cache.set('vieja', 1, ttl=1)
+    cache.set('a', 2)
+    cache.set('b', 3)
+    clock[0] += 2
+    assert cache.keys() == ['a', 'b']
+    # keys() no cuenta como uso: 'vieja' (vencida, aún guardada) y luego 'a' salen primero
+    cache.set('c', 4)
+    cache.set('d', 5)
+    assert cache.get('a') is None
+    assert cache.get('b') == 3
@@ -5,6 +5,7 @@ from .helpers import (
     WAREHOUSE_ROLE_ID,
     CUSTOMER_ROLE_ID,
     get_user_and_role, 
+    invalidate_user_identity,
     check_admin_permission, 
     check_seller_permission,
     check_product_manager_permission,
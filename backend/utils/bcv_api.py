@@ -1,55 +1,202 @@
+import time
+import threading
 import requests
 import logging
+from requests.adapters import HTTPAdapter
+from backend.config import Config
 
 # Configuración de logging para diagnóstico
 api_logger = logging.getLogger('backend.utils.bcv_api')
 
 # URL de la API proporcionada por el usuario
-DOLAR_VZLA_API_URL = "https://api.dolarvzla.com/public/exchange-rate" 
+DOLAR_VZLA_API_URL = "https://api.dolarvzla.com/public/exchange-rate"
 
 # Tasa de respaldo en caso de caída total de la API
-DEFAULT_RATE = 36.5 
+DEFAULT_RATE = 36.5
 
-def get_dolarvzla_rate():
+# Sesión HTTP reutilizable (keep-alive + pool de conexiones TLS)
+_session = requests.Session()
+_session.mount('https://', HTTPAdapter(pool_connections=1, pool_maxsize=Config.RATE_HTTP_POOL_SIZE))
+
+def fetch_dolarvzla_rate():
     """
-    Obtiene la tasa de cambio actual desde DolarVzla API.
+    Consulta la tasa de cambio actual en DolarVzla API (sin caché).
     Estructura esperada: {"current": {"usd": 341.74, ...}, ...}
+    Lanza ValueError si la respuesta no trae una tasa numérica.
+    """
+    response = _session.get(DOLAR_VZLA_API_URL, timeout=Config.RATE_HTTP_TIMEOUT)
+
+    # Lanza una excepción si el status code no es 2xx
+    response.raise_for_status()
+
+    data = response.json()
+
+    # Log para depuración: Ver qué está llegando exactamente al servidor
+    api_logger.debug(f"Estructura recibida de la API: {data}")
+
+    # Extracción segura: Accedemos a data['current']['usd']
+    current_data = data.get('current')
+    if not current_data or 'usd' not in current_data:
+        raise ValueError("No se encontró la clave 'current' o 'usd' en la respuesta de la API.")
+
+    rate_val = current_data.get('usd')
+    # Verificamos que el valor sea numérico
+    if not isinstance(rate_val, (int, float)) or isinstance(rate_val, bool):
+        raise ValueError(f"El campo 'usd' no es un número: {rate_val} (tipo: {type(rate_val)})")
+    return float(rate_val)
+
+
+class CircuitBreaker:
+    """
+    Tras `threshold` fallos seguidos deja de llamar al upstream durante `reset_timeout`
+    segundos; después permite un único intento de prueba (half-open).
+    """
+
+    def __init__(self, threshold=3, reset_timeout=60.0):
+        self.threshold = threshold
+        self.reset_timeout = reset_timeout
+        self._failures = 0
+        self._opened_at = None
+        self._probing = False
+        self._lock = threading.Lock()
+
+    def allow(self):
+        with self._lock:
+            if self._opened_at is None:
+                return True
+            if time.monotonic() - self._opened_at < self.reset_timeout or self._probing:
+                return False
+            self._probing = True
+            return True
+
+    def record_success(self):
+        with self._lock:
+            self._failures = 0
+            self._opened_at = None
+            self._probing = False
+
+    def record_failure(self):
+        with self._lock:
+            self._failures += 1
+            self._probing = False
+            if self._failures >= self.threshold:
+                if self._opened_at is None:
+                    api_logger.warning("Circuito de DolarVzla abierto: se usará la última tasa conocida.")
+                self._opened_at = time.monotonic()
+
+    @property
+    def is_open(self):
+        with self._lock:
+            return self._opened_at is not None
+
+
+class ExchangeRateService:
+    """
+    Caché de la tasa con stale-while-revalidate:
+    - Tasa con menos de `ttl` segundos: se sirve directamente.
+    - Tasa vieja pero con menos de `max_stale`: se sirve igual; el scheduler la refresca.
+    - Sin tasa (o demasiado vieja): se consulta en línea, con una sola petición en vuelo
+      compartida por todos los que llegan a la vez (single-flight).
     """
-    try:
-        # Realizamos la petición con un timeout prudencial (10 segundos)
-        response = requests.get(DOLAR_VZLA_API_URL, timeout=10)
-        
-        # Lanza una excepción si el status code no es 2xx
-        response.raise_for_status()
-        
-        data = response.json()
-        
-        # Log para depuración: Ver qué está llegando exactamente al servidor
-        api_logger.info(f"Estructura recibida de la API: {data}")
-
-        # Extracción segura: Accedemos a data['current']['usd']
-        current_data = data.get('current')
-        
-        if current_data and 'usd' in current_data:
-            rate_val = current_data.get('usd')
-            
-            # Verificamos que el valor sea numérico
-            if isinstance(rate_val, (int, float)):
-                rate = float(rate_val)
-                api_logger.info(f"Tasa extraída con éxito: {rate}")
-                return rate
+
+    def __init__(self, fetcher, ttl, max_stale, breaker):
+        self._fetcher = fetcher
+        self.ttl = ttl
+        self.max_stale = max_stale
+        self.breaker = breaker
+        self._rate = None
+        self._fetched_mono = None
+        self._fetched_at = None      # epoch, para informar al cliente
+        self._lock = threading.Lock()
+        self._inflight = None        # threading.Event de la consulta en curso
+        self._listeners = []
+
+    def add_listener(self, callback):
+        """callback(rate, fetched_at) se invoca tras cada consulta exitosa al upstream."""
+        self._listeners.append(callback)
+
+    def _age(self):
+        if self._fetched_mono is None:
+            return None
+        return time.monotonic() - self._fetched_mono
+
+    def refresh(self):
+        """Consulta el upstream (single-flight). Devuelve la tasa vigente tras el intento."""
+        with self._lock:
+            event = self._inflight
+            leader = event is None
+            if leader:
+                event = self._inflight = threading.Event()
+
+        if not leader:
+            event.wait(Config.RATE_HTTP_TIMEOUT[0] + Config.RATE_HTTP_TIMEOUT[1])
+            return self._rate
+
+        try:
+            if not self.breaker.allow():
+                return self._rate
+            try:
+                rate = self._fetcher()
+            except requests.exceptions.Timeout:
+                api_logger.error("Timeout al conectar con la API de DolarVzla.")
+                self.breaker.record_failure()
+            except requests.exceptions.RequestException as e:
+                api_logger.error(f"Error de red o HTTP: {e}")
+                self.breaker.record_failure()
+            except Exception as e:
+                api_logger.error(f"Error inesperado al procesar la tasa: {e}", exc_info=True)
+                self.breaker.record_failure()
             else:
-                api_logger.error(f"El campo 'usd' no es un número: {rate_val} (tipo: {type(rate_val)})")
-        else:
-            api_logger.error("No se encontró la clave 'current' o 'usd' en la respuesta de la API.")
-
-    except requests.exceptions.Timeout:
-        api_logger.error("Timeout al conectar con la API de DolarVzla.")
-    except requests.exceptions.RequestException as e:
-        api_logger.error(f"Error de red o HTTP: {e}")
-    except Exception as e:
-        api_logger.error(f"Error inesperado al procesar la tasa: {e}", exc_info=True)
-
-    # Si llegamos aquí, algo falló. Retornamos la tasa por defecto.
-    api_logger.warning(f"Se utilizará la tasa por defecto: {DEFAULT_RATE}")
-    return DEFAULT_RATE
\ No newline at end of file
+                self.breaker.record_success()
+                self._rate = rate
+                self._fetched_mono = time.monotonic()
+                self._fetched_at = time.time()
+                api_logger.debug(f"Tasa extraída con éxito: {rate}")
+                for callback in self._listeners:
+                    try:
+                        callback(rate, self._fetched_at)
+                    except Exception as e:
+                        api_logger.error(f"Error en listener de tasa: {e}")
+            return self._rate
+        finally:
+            with self._lock:
+                self._inflight = None
+            event.set()
+
+    def get_rate(self):
+        age = self._age()
+        if age is not None and age < self.max_stale:
+            # Fresca o "stale" aceptable: no se bloquea la petición
+            return self._rate
+        rate = self.refresh()
+        if rate is None:
+            # Si llegamos aquí, algo falló y no hay tasa previa. Retornamos la tasa por defecto.
+            api_logger.warning(f"Se utilizará la tasa por defecto: {DEFAULT_RATE}")
+            return DEFAULT_RATE
+        return rate
+
+    def refresh_if_stale(self):
+        """Tarea del scheduler: refresca en segundo plano cuando la tasa superó el TTL."""
+        age = self._age()
+        if age is None or age >= self.ttl:
+            self.refresh()
+
+    def snapshot(self):
+        """(tasa, epoch de la última consulta exitosa) sin disparar consultas."""
+        return self._rate, self._fetched_at
+
+
+rate_service = ExchangeRateService(
+    fetch_dolarvzla_rate,
+    ttl=Config.RATE_CACHE_TTL,
+    max_stale=Config.RATE_MAX_STALE,
+    breaker=CircuitBreaker(Config.RATE_BREAKER_THRESHOLD, Config.RATE_BREAKER_RESET),
+)
+
+def get_dolarvzla_rate():
+    """Tasa USD->VES vigente (cacheada). Nunca espera al upstream si hay una tasa reciente."""
+    return rate_service.get_rate()
+
+def refresh_exchange_rate():
+    """Punto de entrada para APScheduler."""
+    rate_service.refresh_if_stale()
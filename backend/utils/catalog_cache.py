@@ -0,0 +1,246 @@
+import os
+import json
+import time
+import random
+import select
+import logging
+import threading
+import psycopg2
+from backend.config import Config
+from backend.db import get_db_cursor, _get_conn_params
+from backend.utils.cache import TTLCache
+from backend.utils.product_search import invalidate_product_index
+
+catalog_logger = logging.getLogger('backend.utils.catalog_cache')
+
+# Canal de Postgres por el que las escrituras avisan a todos los workers
+CATALOG_CHANNEL = 'catalog_changes'
+
+# Tipo de cambio -> colección cuya versión sube. 'stock' (ventas, ajustes) no toca nombres ni
+# categorías, así que no obliga a reconstruir el índice de búsqueda de los demás workers.
+CHANGE_KINDS = {
+    'products': 'products',
+    'stock': 'products',
+    'customers': 'customers',
+    'sales': 'sales',
+    'users': 'users',
+}
+
+# Sube la versión de las colecciones (collection_versions, migración 013) y avisa a los workers
+# en una sola sentencia. La versión está repartida en sub-filas elegidas al azar, como
+# sales_daily_stats, para que las escrituras concurrentes de un comercio no esperen una misma
+# fila; la versión de la colección es la suma y cambia con cada transacción confirmada.
+BUMP_SQL = """
+    WITH bumped AS (
+        INSERT INTO collection_versions AS cv (tenant_id, collection, shard, version)
+        SELECT %(tenant)s::text, c, %(shard)s, 1
+        FROM unnest(%(collections)s::text[]) AS c
+        ORDER BY c
+        ON CONFLICT (tenant_id, collection, shard) DO UPDATE SET version = cv.version + 1
+    )
+    SELECT pg_notify(%(channel)s, %(payload)s)
+"""
+
+# (colección, tenant_id) -> (versión, filas). El TTL es solo un respaldo: la invalidación llega por NOTIFY.
+_cache = TTLCache(maxsize=Config.CATALOG_CACHE_MAX_TENANTS, ttl=Config.CATALOG_CACHE_TTL)
+# (colección, tenant_id) -> versión conocida por este worker (ver collection_version)
+_versions = TTLCache(maxsize=Config.CATALOG_CACHE_MAX_TENANTS * len(CHANGE_KINDS), ttl=Config.CATALOG_CACHE_TTL)
+# Contadores de invalidación: una lectura que empezó antes de un cambio no puede guardar su resultado
+_generations = {}
+_epoch = 0
+_lock = threading.Lock()
+
+_ready = threading.Event()
+_listening_since = None
+# Funciones que reciben cada aviso (dict) y None cuando se pierde o reanuda la escucha
+_subscribers = []
+_listener = None
+_listener_pid = None
+_listener_guard = threading.Lock()
+
+
+def notify_catalog_change(cur, tenant_id, *kinds, revoked=None):
+    """
+    Registra que cambiaron colecciones del comercio: productos ('products' o solo 'stock'),
+    clientes ('customers'), ventas ('sales') o empleados ('users'). Sube sus versiones y
+    avisa por pg_notify; ambas cosas se hacen efectivas al confirmar la transacción de `cur`.
+    También invalida en el acto la copia de este worker, para que quien escribe lea lo suyo.
+    Llamarla una vez por transacción, con todos los tipos: bloquea una fila de
+    collection_versions hasta el COMMIT, y todas las escrituras toman sus bloqueos en el mismo
+    orden (clientes, agregados diarios, versiones y, al final, productos) para no interbloquearse.
+    `revoked` ({user_id: token_version mínima}) viaja en el aviso para que todos los workers
+    olviden la identidad cacheada de esos usuarios (ver helpers.get_user_and_role).
+    """
+    collections = sorted({CHANGE_KINDS[kind] for kind in kinds})
+    data = {'tenant': str(tenant_id), 'kinds': sorted(set(kinds)), 'pid': os.getpid()}
+    if revoked:
+        data['revoked'] = {str(uid): version for uid, version in revoked.items()}
+    payload = json.dumps(data)
+    cur.execute(BUMP_SQL, {
+        'tenant': str(tenant_id),
+        'shard': random.randrange(Config.COLLECTION_VERSION_SHARDS),
+        'collections': collections,
+        'channel': CATALOG_CHANNEL,
+        'payload': payload,
+    })
+    for collection in collections:
+        invalidate_catalog(tenant_id, collection)
+
+
+def invalidate_catalog(tenant_id, collection):
+    key = (collection, str(tenant_id))
+    with _lock:
+        _generations[key] = _generations.get(key, 0) + 1
+        _cache.pop(key)
+        _versions.pop(key)
+
+
+def invalidate_all():
+    global _epoch
+    with _lock:
+        _epoch += 1
+        _cache.clear()
+        _versions.clear()
+    _publish(None)
+
+
+def subscribe(callback):
+    """Registra `callback(aviso | None)`; None significa que pudieron perderse avisos."""
+    _subscribers.append(callback)
+
+
+def _publish(data):
+    for callback in _subscribers:
+        try:
+            callback(data)
+        except Exception as e:
+            catalog_logger.error(f"Error procesando aviso de catálogo: {e}")
+
+
+def listening_since():
+    """Momento (time.time()) desde el que este worker recibe todos los avisos, o None si no escucha."""
+    return _listening_since if _listening() else None
+
+
+def _handle(payload):
+    try:
+        data = json.loads(payload)
+        tenant_id, kinds = data['tenant'], data['kinds']
+        collections = {CHANGE_KINDS[kind] for kind in kinds}
+    except (ValueError, KeyError, TypeError):
+        catalog_logger.warning(f"Notificación de catálogo inválida: {payload!r}")
+        return
+    for collection in collections:
+        invalidate_catalog(tenant_id, collection)
+    _publish(data)
+    # El worker que escribió ya actualizó su índice de búsqueda producto a producto
+    if 'products' in kinds and data.get('pid') != os.getpid():
+        invalidate_product_index(tenant_id)
+
+
+def _listen_forever():
+    global _listening_since
+    while True:
+        conn = None
+        try:
+            conn = psycopg2.connect(**_get_conn_params())
+            conn.autocommit = True
+            with conn.cursor() as cur:
+                cur.execute(f"LISTEN {CATALOG_CHANNEL}")
+            # Lo cacheado antes de escuchar pudo perderse avisos
+            invalidate_all()
+            _listening_since = time.time()
+            _ready.set()
+            catalog_logger.info("Escuchando cambios de catálogo")
+            while True:
+                if select.select([conn], [], [], Config.CATALOG_LISTEN_HEARTBEAT) == ([], [], []):
+                    # Sin avisos: comprobar que la conexión sigue viva
+                    with conn.cursor() as cur:
+                        cur.execute("SELECT 1")
+                conn.poll()
+                while conn.notifies:
+                    _handle(conn.notifies.pop(0).payload)
+        except Exception as e:
+            catalog_logger.error(f"Escucha de cambios de catálogo interrumpida: {e}")
+        finally:
+            # Sin escucha no hay garantía de frescura: se deja de servir desde la caché
+            _ready.clear()
+            invalidate_all()
+            if conn is not None:
+                try:
+                    conn.close()
+                except Exception:
+                    pass
+        time.sleep(Config.CATALOG_LISTEN_RECONNECT)
+
+
+def ensure_listener():
+    """Arranca (una vez por proceso, también tras el fork de gunicorn) el hilo que escucha los avisos."""
+    global _listener, _listener_pid
+    pid = os.getpid()
+    if _listener is not None and _listener_pid == pid and _listener.is_alive():
+        return
+    with _listener_guard:
+        if _listener is None or _listener_pid != pid or not _listener.is_alive():
+            if _listener_pid != pid:
+                _ready.clear()
+                invalidate_all()
+            _listener = threading.Thread(target=_listen_forever, name='catalog-listener', daemon=True)
+            _listener_pid = pid
+            _listener.start()
+
+
+def _listening():
+    if not Config.CATALOG_CACHE_ENABLED:
+        return False
+    ensure_listener()
+    return _ready.is_set()
+
+
+def collection_version(tenant_id, collection):
+    """
+    Versión actual de la colección del comercio. Mientras la escucha esté activa se responde
+    desde memoria (los avisos la invalidan); si no, con una consulta mínima a collection_versions.
+    """
+    key = (collection, str(tenant_id))
+    listening = _listening()
+    if listening:
+        version = _versions.get(key)
+        if version is not None:
+            return version
+    with _lock:
+        seen = (_epoch, _generations.get(key, 0))
+    with get_db_cursor() as cur:
+        cur.execute(
+            "SELECT COALESCE(SUM(version), 0) AS version FROM collection_versions WHERE tenant_id = %s::text AND collection = %s",
+            (str(tenant_id), collection)
+        )
+        version = int(cur.fetchone()['version'])
+    with _lock:
+        if listening and _ready.is_set() and (_epoch, _generations.get(key, 0)) == seen:
+            _versions.set(key, version)
+    return version
+
+
+def cached_listing(listing, tenant_id, loader):
+    """
+    Listado completo (`listing`: 'products' o 'customers') del comercio desde la caché del
+    worker; si no está, lo carga con `loader()` y lo guarda junto a la versión leída antes de
+    cargarlo, salvo que haya llegado un aviso de cambio mientras se leía. Mientras la escucha
+    no esté activa siempre se lee de la DB. Devuelve (filas, True si salió de la caché).
+    """
+    if not _listening():
+        return loader(), False
+
+    key = (listing, str(tenant_id))
+    version = collection_version(tenant_id, listing)
+    entry = _cache.get(key)
+    if entry is not None and entry[0] == version:
+        return entry[1], True
+    with _lock:
+        seen = (_epoch, _generations.get(key, 0))
+    rows = loader()
+    with _lock:
+        if _ready.is_set() and (_epoch, _generations.get(key, 0)) == seen:
+            _cache.set(key, (version, rows))
+    return rows, False
@@ -0,0 +1,81 @@
+from backend.utils.receivables import AGING_BUCKETS
+
+# Secciones de la ficha del cliente (GET /api/customers/<id>/overview): nombre -> (CTEs que usa, expresión)
+OVERVIEW_CTES = {
+    'open': """
+        open_inv AS (
+            SELECT s.id::text AS sale_id, s.sale_date::text AS sale_date, s.total_amount_usd, s.balance_due_usd,
+                   s.fecha_vencimiento::text AS fecha_vencimiento, s.status,
+                   GREATEST(COALESCE(CURRENT_DATE - s.fecha_vencimiento::date, 0), 0) AS dias_mora
+            FROM sales s
+            WHERE s.tenant_id = %(tenant)s::text AND s.customer_id = %(customer)s AND s.balance_due_usd > 0.05
+            ORDER BY s.sale_date, s.id
+        )""",
+    'recent': """
+        recent AS (
+            SELECT s.id::text AS sale_id, s.sale_date::text AS sale_date, s.total_amount_usd, s.total_amount_ves,
+                   s.balance_due_usd, s.tipo_pago, s.status, u.nombre AS seller_name
+            FROM sales s
+            LEFT JOIN users u ON u.id = s.user_id
+            WHERE s.tenant_id = %(tenant)s::text AND s.customer_id = %(customer)s
+            ORDER BY s.sale_date DESC, s.id DESC
+            LIMIT %(limit)s
+        )""",
+    'payments': """
+        pays AS (
+            SELECT cp.id::text AS payment_id, cp.sale_id::text AS sale_id, cp.payment_date::text AS payment_date,
+                   cp.amount_usd, cp.amount_ves, cp.exchange_rate, cp.payment_method, u.nombre AS user_name
+            FROM credit_payments cp
+            LEFT JOIN users u ON u.id = cp.user_id
+            WHERE cp.tenant_id = %(tenant)s::text AND cp.customer_id = %(customer)s
+            ORDER BY cp.payment_date DESC, cp.id DESC
+            LIMIT %(limit)s
+        )""",
+}
+
+_AGING_FILTERS = {
+    'current': "o.dias_mora = 0",
+    'd1_30': "o.dias_mora BETWEEN 1 AND 30",
+    'd31_60': "o.dias_mora BETWEEN 31 AND 60",
+    'd61_90': "o.dias_mora BETWEEN 61 AND 90",
+    'd90_plus': "o.dias_mora > 90",
+}
+
+OVERVIEW_SECTIONS = {
+    'open_invoices': (('open',), "(SELECT COALESCE(json_agg(o ORDER BY o.sale_date, o.sale_id), '[]'::json) FROM open_inv o)"),
+    'recent_sales': (('recent',), "(SELECT COALESCE(json_agg(r ORDER BY r.sale_date DESC, r.sale_id DESC), '[]'::json) FROM recent r)"),
+    'payments': (('payments',), "(SELECT COALESCE(json_agg(p ORDER BY p.payment_date DESC, p.payment_id DESC), '[]'::json) FROM pays p)"),
+    'aging': (('open',), "(SELECT json_build_object({fields}, 'total', COALESCE(SUM(o.balance_due_usd), 0), "
+                         "'invoices', COUNT(*)) FROM open_inv o)".format(fields=', '.join(
+                             f"'{bucket}', COALESCE(SUM(o.balance_due_usd) FILTER (WHERE {_AGING_FILTERS[bucket]}), 0)"
+                             for bucket in AGING_BUCKETS))),
+}
+
+
+def customer_overview(cur, tenant_id, customer_id, sections, limit=10):
+    """
+    Ficha completa del cliente (perfil + `sections`) en una sola consulta con varias CTE.
+    Solo se incluyen las CTE de las secciones pedidas. Devuelve None si el cliente no existe.
+    """
+    ctes = []
+    for section in sections:
+        for name in OVERVIEW_SECTIONS[section][0]:
+            if OVERVIEW_CTES[name] not in ctes:
+                ctes.append(OVERVIEW_CTES[name])
+    columns = ''.join(f",\n            {OVERVIEW_SECTIONS[section][1]} AS {section}" for section in sections)
+    with_sql = f"WITH {','.join(ctes)}" if ctes else ""
+
+    cur.execute(
+        f"""
+        {with_sql}
+        SELECT row_to_json(c) AS profile{columns}
+        FROM (
+            SELECT id, name, email, phone, address, cedula, credit_limit_usd, balance_pendiente_usd
+            FROM customers
+            WHERE id = %(customer)s AND tenant_id = %(tenant)s
+        ) c
+        """,
+        {'tenant': str(tenant_id), 'customer': str(customer_id), 'limit': limit}
+    )
+    row = cur.fetchone()
+    return dict(row) if row else None
@@ -0,0 +1,49 @@
+import hashlib
+from functools import wraps
+from flask import request, make_response
+from flask_jwt_extended import get_jwt, get_jwt_identity
+from backend.utils.catalog_cache import collection_version
+
+
+def compute_etag(collections):
+    """
+    ETag fuerte del listado: versiones de las colecciones de las que depende (ver
+    catalog_cache.collection_version), el usuario y su rol (los listados filtran por ellos)
+    y la URL con sus parámetros. No consulta los datos del listado.
+    """
+    claims = get_jwt()
+    tenant_id = claims.get('tenant_id')
+    versions = ','.join(f"{c}:{collection_version(tenant_id, c)}" for c in collections)
+    key = '|'.join([
+        str(tenant_id), str(get_jwt_identity()), str(claims.get('role_id')), str(claims.get('token_version')),
+        request.full_path, versions,
+    ])
+    return hashlib.sha256(key.encode('utf-8')).hexdigest()[:32]
+
+
+def conditional_get(*collections):
+    """
+    GET condicional para listados: calcula el ETag antes de ejecutar la vista y, si coincide
+    con If-None-Match, responde 304 sin consultar el listado. Las respuestas 200 llevan el ETag
+    y Cache-Control: private, no-cache (el navegador guarda la copia pero siempre revalida).
+    Las versiones se calculan antes de leer los datos: una escritura concurrente puede dar un
+    ETag viejo con datos nuevos (se revalida de más), nunca al revés.
+    Debe ir debajo de @jwt_required(); en otros métodos no hace nada.
+    """
+    def decorator(f):
+        @wraps(f)
+        def decorated_function(*args, **kwargs):
+            if request.method != 'GET' or not get_jwt().get('tenant_id'):
+                return f(*args, **kwargs)
+            etag = compute_etag(collections)
+            if request.if_none_match.contains(etag):
+                response = make_response('', 304)
+            else:
+                response = make_response(f(*args, **kwargs))
+                if response.status_code != 200:
+                    return response
+            response.set_etag(etag)
+            response.headers['Cache-Control'] = 'private, no-cache'
+            return response
+        return decorated_function
+    return decorator
@@ -0,0 +1,203 @@
+import io
+import csv
+import uuid
+import zipfile
+from datetime import date, datetime
+from decimal import Decimal
+from xml.sax.saxutils import escape
+from backend.config import Config
+from backend.db import get_db_connection
+
+# Consultas de exportación: (encabezados, SQL). Las condiciones se agregan en {where}.
+EXPORT_DATASETS = {
+    'sales': (
+        ['sale_id', 'sale_date', 'customer', 'cedula', 'seller', 'tipo_pago', 'status',
+         'total_usd', 'total_ves', 'exchange_rate', 'usd_paid', 'ves_paid', 'balance_due_usd', 'fecha_vencimiento'],
+        """
+        SELECT s.id::text, s.sale_date, c.name, c.cedula, u.nombre, s.tipo_pago, s.status,
+               s.total_amount_usd, s.total_amount_ves, s.exchange_rate_used, s.usd_paid, s.ves_paid,
+               s.balance_due_usd, s.fecha_vencimiento
+        FROM sales s
+        LEFT JOIN customers c ON c.id = s.customer_id
+        LEFT JOIN users u ON u.id = s.user_id
+        WHERE s.tenant_id = %(tenant)s::text {where}
+        ORDER BY s.sale_date, s.id
+        """,
+    ),
+    'items': (
+        ['sale_id', 'sale_date', 'product_id', 'product', 'category', 'quantity', 'price_usd', 'subtotal_usd'],
+        """
+        SELECT si.sale_id::text, s.sale_date, si.product_id::text, p.name, p.category,
+               si.quantity, si.price, si.quantity * si.price
+        FROM sales s
+        JOIN sale_items si ON si.sale_id = s.id
+        LEFT JOIN products p ON p.id = si.product_id
+        WHERE s.tenant_id = %(tenant)s::text {where}
+        ORDER BY s.sale_date, s.id
+        """,
+    ),
+    'payments': (
+        ['payment_id', 'payment_date', 'sale_id', 'customer', 'cedula', 'user',
+         'amount_usd', 'amount_ves', 'exchange_rate', 'payment_method'],
+        """
+        SELECT cp.id::text, cp.payment_date, cp.sale_id::text, c.name, c.cedula, u.nombre,
+               cp.amount_usd, cp.amount_ves, cp.exchange_rate, cp.payment_method
+        FROM credit_payments cp
+        LEFT JOIN customers c ON c.id = cp.customer_id
+        LEFT JOIN users u ON u.id = cp.user_id
+        WHERE cp.tenant_id = %(tenant)s::text {where}
+        ORDER BY cp.payment_date, cp.id
+        """,
+    ),
+}
+
+# Columna de fecha usada por date_from/date_to en cada conjunto
+EXPORT_DATE_COLUMNS = {'sales': 's.sale_date', 'items': 's.sale_date', 'payments': 'cp.payment_date'}
+
+
+def export_query(dataset, tenant_id, date_from=None, date_to=None):
+    """(encabezados, sql, params) del conjunto pedido; KeyError si no existe."""
+    header, query = EXPORT_DATASETS[dataset]
+    column = EXPORT_DATE_COLUMNS[dataset]
+    conditions = []
+    params = {'tenant': tenant_id}
+    if date_from:
+        conditions.append(f"AND {column} >= %(date_from)s::date")
+        params['date_from'] = date_from
+    if date_to:
+        conditions.append(f"AND {column} < %(date_to)s::date + 1")
+        params['date_to'] = date_to
+    return header, query.format(where=' '.join(conditions)), params
+
+
+def stream_rows(query, params):
+    """
+    Genera las filas con un cursor con nombre (del lado del servidor): Postgres las envía en
+    bloques de Config.EXPORT_FETCH_SIZE, así que la memoria del worker no crece con el rango.
+    Usa una conexión propia, que se libera al agotar (o cerrar) el generador.
+    """
+    with get_db_connection(scoped=False) as conn:
+        cur = conn.cursor(name=f"export_{uuid.uuid4().hex}")
+        cur.itersize = Config.EXPORT_FETCH_SIZE
+        try:
+            cur.execute(query, params)
+            for row in cur:
+                yield row
+        finally:
+            cur.close()
+            conn.rollback()
+
+
+def _format_value(value):
+    if value is None:
+        return ''
+    if isinstance(value, (datetime, date)):
+        return value.isoformat()
+    return value
+
+
+def csv_chunks(header, rows, chunk_rows=500):
+    """CSV en trozos de `chunk_rows` filas (con BOM para que Excel respete los acentos)."""
+    buffer = io.StringIO()
+    writer = csv.writer(buffer)
+    buffer.write('\ufeff')
+    writer.writerow(header)
+    for count, row in enumerate(rows, 1):
+        writer.writerow([_format_value(v) for v in row])
+        if count % chunk_rows == 0:
+            yield buffer.getvalue()
+            buffer.seek(0)
+            buffer.truncate()
+    yield buffer.getvalue()
+
+
+# --- XLSX mínimo (una hoja, cadenas en línea) escrito como ZIP en streaming ---
+
+class _ChunkSink(io.RawIOBase):
+    """Destino no posicionable para ZipFile: acumula lo escrito hasta que el generador lo entrega."""
+
+    def __init__(self):
+        self._chunks = []
+
+    def writable(self):
+        return True
+
+    def write(self, data):
+        self._chunks.append(bytes(data))
+        return len(data)
+
+    def drain(self):
+        data = b''.join(self._chunks)
+        self._chunks = []
+        return data
+
+
+_XLSX_STATIC = {
+    '[Content_Types].xml': (
+        '<?xml version="1.0" encoding="UTF-8" standalone="yes"?>'
+        '<Types xmlns="http://schemas.openxmlformats.org/package/2006/content-types">'
+        '<Default Extension="rels" ContentType="application/vnd.openxmlformats-package.relationships+xml"/>'
+        '<Default Extension="xml" ContentType="application/xml"/>'
+        '<Override PartName="/xl/workbook.xml" '
+        'ContentType="application/vnd.openxmlformats-officedocument.spreadsheetml.sheet.main+xml"/>'
+        '<Override PartName="/xl/worksheets/sheet1.xml" '
+        'ContentType="application/vnd.openxmlformats-officedocument.spreadsheetml.worksheet+xml"/>'
+        '</Types>'
+    ),
+    '_rels/.rels': (
+        '<?xml version="1.0" encoding="UTF-8" standalone="yes"?>'
+        '<Relationships xmlns="http://schemas.openxmlformats.org/package/2006/relationships">'
+        '<Relationship Id="rId1" '
+        'Type="http://schemas.openxmlformats.org/officeDocument/2006/relationships/officeDocument" '
+        'Target="xl/workbook.xml"/>'
+        '</Relationships>'
+    ),
+    'xl/workbook.xml': (
+        '<?xml version="1.0" encoding="UTF-8" standalone="yes"?>'
+        '<workbook xmlns="http://schemas.openxmlformats.org/spreadsheetml/2006/main" '
+        'xmlns:r="http://schemas.openxmlformats.org/officeDocument/2006/relationships">'
+        '<sheets><sheet name="{sheet}" sheetId="1" r:id="rId1"/></sheets>'
+        '</workbook>'
+    ),
+    'xl/_rels/workbook.xml.rels': (
+        '<?xml version="1.0" encoding="UTF-8" standalone="yes"?>'
+        '<Relationships xmlns="http://schemas.openxmlformats.org/package/2006/relationships">'
+        '<Relationship Id="rId1" '
+        'Type="http://schemas.openxmlformats.org/officeDocument/2006/relationships/worksheet" '
+        'Target="worksheets/sheet1.xml"/>'
+        '</Relationships>'
+    ),
+}
+
+
+def _xlsx_row(values):
+    cells = []
+    for value in values:
+        value = _format_value(value)
+        if isinstance(value, bool) or not isinstance(value, (int, float, Decimal)):
+            cells.append(f'<c t="inlineStr"><is><t>{escape(str(value))}</t></is></c>')
+        else:
+            cells.append(f'<c><v>{value}</v></c>')
+    return f"<row>{''.join(cells)}</row>"
+
+
+def xlsx_chunks(header, rows, sheet='Datos', chunk_rows=500):
+    """Libro XLSX de una hoja generado por trozos, sin cargar todas las filas ni el archivo en memoria."""
+    sink = _ChunkSink()
+    with zipfile.ZipFile(sink, 'w', compression=zipfile.ZIP_DEFLATED) as zf:
+        for name, content in _XLSX_STATIC.items():
+            zf.writestr(name, content.replace('{sheet}', escape(sheet)))
+        yield sink.drain()
+
+        with zf.open('xl/worksheets/sheet1.xml', 'w', force_zip64=True) as sheet_file:
+            sheet_file.write(
+                b'<?xml version="1.0" encoding="UTF-8" standalone="yes"?>'
+                b'<worksheet xmlns="http://schemas.openxmlformats.org/spreadsheetml/2006/main"><sheetData>'
+            )
+            sheet_file.write(_xlsx_row(header).encode('utf-8'))
+            for count, row in enumerate(rows, 1):
+                sheet_file.write(_xlsx_row(row).encode('utf-8'))
+                if count % chunk_rows == 0:
+                    yield sink.drain()
+            sheet_file.write(b'</sheetData></worksheet>')
+    yield sink.drain()
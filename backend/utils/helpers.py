@@ -1,7 +1,12 @@
-from flask import jsonify, request
+from flask import jsonify, request, g
 from flask_jwt_extended import get_jwt_identity, get_jwt
 from backend.db import get_db_cursor
+from backend.config import Config
+from backend.utils.cache import TTLCache
+from backend.utils.catalog_cache import subscribe, listening_since
 from functools import wraps
+import json
+import base64
 import logging
 
 app_logger = logging.getLogger(__name__) 
@@ -14,7 +19,71 @@ CUSTOMER_ROLE_ID = 4
 
 # --- 2. Funciones de Identidad ---
 def get_user_and_role():
-    """Obtiene u_id, role_id y tenant_id desde el JWT y la DB."""
+    """
+    Obtiene u_id, role_id y tenant_id desde el JWT y la DB.
+    El resultado se memoriza en `g`, así que admin_required y la ruta no repiten la consulta.
+    """
+    identity = g.get('_identity')
+    if identity is None:
+        identity = _load_user_and_role()
+        if identity[0] is not None:
+            g._identity = identity
+    return identity
+
+# user_id -> (role_id, tenant_id, token_version). Solo se usa mientras el worker escucha los
+# avisos de catálogo: los cambios de rol o bajas de otro worker llegan como 'revoked'.
+_identity_cache = TTLCache(maxsize=Config.IDENTITY_CACHE_SIZE, ttl=Config.IDENTITY_CACHE_TTL)
+# user_id -> token_version mínima aceptada tras una invalidación (rol cambiado / usuario eliminado)
+_revoked_versions = TTLCache(
+    maxsize=Config.IDENTITY_CACHE_SIZE,
+    ttl=Config.JWT_ACCESS_TOKEN_EXPIRES.total_seconds()
+)
+
+def invalidate_user_identity(user_id, min_token_version=None):
+    """
+    Olvida la identidad cacheada de un usuario. Si se indica min_token_version,
+    los JWT con una versión anterior dejan de usarse como atajo y se consulta la DB.
+    """
+    u_id = str(user_id)
+    _identity_cache.pop(u_id)
+    if min_token_version is not None:
+        _revoked_versions.set(u_id, min_token_version)
+
+def _on_catalog_change(data):
+    """Aplica en este worker las invalidaciones hechas por cualquier otro (ver catalog_cache)."""
+    if data is None:
+        # Pudieron perderse avisos: nada de lo cacheado es confiable
+        _identity_cache.clear()
+        return
+    for u_id, version in (data.get('revoked') or {}).items():
+        invalidate_user_identity(u_id, version)
+
+subscribe(_on_catalog_change)
+
+# Margen por diferencias de reloj entre el servidor que emitió el JWT y este worker
+CLAIMS_CLOCK_SKEW = 5
+
+def _claims_identity(u_id, claims, since):
+    """
+    Identidad tomada del JWT si está habilitado y su token_version sigue vigente. Solo se
+    confía en tokens emitidos después de que este worker empezó a escuchar los avisos: una
+    invalidación anterior (p. ej. previa a un reinicio) no se conoce aquí, pero el token
+    emitido después ya trae la versión nueva.
+    """
+    if not Config.IDENTITY_TRUST_JWT_CLAIMS:
+        return None
+    role_id = claims.get('role_id')
+    version = claims.get('token_version')
+    issued_at = claims.get('iat')
+    if role_id is None or version is None or issued_at is None:
+        return None
+    if issued_at < since + CLAIMS_CLOCK_SKEW:
+        return None
+    if version < _revoked_versions.get(u_id, 0):
+        return None
+    return role_id, claims.get('tenant_id'), version
+
+def _load_user_and_role():
     current_user_id = get_jwt_identity() 
     claims = get_jwt()
     
@@ -25,10 +94,20 @@ def get_user_and_role():
         u_id = str(current_user_id)
         tenant_id_token = claims.get('tenant_id')
 
+        # Sin escucha de avisos (o con la caché de catálogo desactivada) siempre se va a la DB
+        since = listening_since()
+        cached = since is not None and (_identity_cache.get(u_id) or _claims_identity(u_id, claims, since))
+        if cached:
+            _identity_cache.set(u_id, cached)
+            role_id, tenant_id, _ = cached
+            return u_id, role_id, tenant_id or tenant_id_token
+
         with get_db_cursor() as cur:
-            cur.execute("SELECT role_id, tenant_id FROM users WHERE id = %s", (u_id,))
+            cur.execute("SELECT role_id, tenant_id, token_version FROM users WHERE id = %s", (u_id,))
             record = cur.fetchone()
             if record:
+                if since is not None:
+                    _identity_cache.set(u_id, (record['role_id'], record['tenant_id'], record['token_version']))
                 # Retornamos el tenant_id de la DB, o el del token como respaldo
                 return u_id, record['role_id'], record['tenant_id'] or tenant_id_token
             
@@ -74,4 +153,34 @@ def validate_required_fields(data, fields):
             return field
         if isinstance(value, (list, dict)) and len(value) == 0:
             return field
-    return None
\ No newline at end of file
+    return None
+
+# --- 6. Paginación por cursor (keyset) ---
+def encode_cursor(values):
+    """Cursor opaco a partir de los valores de la última fila de la página."""
+    raw = json.dumps(list(values), default=str, separators=(',', ':')).encode()
+    return base64.urlsafe_b64encode(raw).decode().rstrip('=')
+
+def decode_cursor(token):
+    """Inverso de encode_cursor. Lanza ValueError si el cursor no es válido."""
+    try:
+        padded = token + '=' * (-len(token) % 4)
+        values = json.loads(base64.urlsafe_b64decode(padded.encode()))
+    except Exception:
+        raise ValueError("Cursor inválido")
+    if not isinstance(values, list):
+        raise ValueError("Cursor inválido")
+    return values
+
+def get_page_limit(default, maximum):
+    """
+    Tamaño de página pedido (?limit=). Devuelve None si el cliente no pidió paginar
+    (ni limit ni cursor), para mantener la respuesta completa de los clientes antiguos.
+    """
+    if 'limit' not in request.args and 'cursor' not in request.args:
+        return None
+    try:
+        limit = int(request.args.get('limit', default))
+    except ValueError:
+        raise ValueError("Parámetro 'limit' inválido")
+    return max(1, min(limit, maximum))
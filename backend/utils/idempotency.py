@@ -0,0 +1,129 @@
+import hashlib
+import logging
+from functools import wraps
+from flask import request, jsonify, make_response
+from flask_jwt_extended import get_jwt
+from psycopg2.extras import Json
+from backend.config import Config
+from backend.db import get_db_cursor, get_db_connection
+from backend.utils.cache import TTLCache
+
+idem_logger = logging.getLogger('backend.utils.idempotency')
+
+IDEMPOTENCY_HEADER = 'Idempotency-Key'
+MAX_KEY_LENGTH = 255
+
+# (tenant_id, scope, key) -> (request_hash, status_code, body)
+_recent = TTLCache(maxsize=Config.IDEMPOTENCY_CACHE_SIZE, ttl=Config.IDEMPOTENCY_TTL_HOURS * 3600)
+
+
+def _replay(stored, request_hash):
+    stored_hash, status_code, body = stored
+    if stored_hash != request_hash:
+        return jsonify({"msg": f"{IDEMPOTENCY_HEADER} ya usada con otro cuerpo de petición"}), 422
+    if status_code is None:
+        # La ruta confirmó sus cambios pero el proceso cayó antes de guardar la respuesta
+        return jsonify({"msg": f"La petición con esta {IDEMPOTENCY_HEADER} ya se procesó; consulte su resultado"}), 409
+    response = make_response(jsonify(body), status_code)
+    response.headers['Idempotent-Replayed'] = 'true'
+    return response
+
+
+def _load(cur, tenant_id, scope, key):
+    cur.execute(
+        "SELECT request_hash, status_code, response FROM idempotency_keys WHERE tenant_id = %s AND scope = %s AND key = %s",
+        (tenant_id, scope, key)
+    )
+    row = cur.fetchone()
+    return (row['request_hash'], row['status_code'], row['response']) if row else None
+
+
+def _discard_uncommitted():
+    """Revierte lo que la ruta dejó sin confirmar en la conexión de la petición."""
+    with get_db_connection() as conn:
+        if not conn.closed:
+            conn.rollback()
+
+
+def idempotent(f):
+    """
+    Honra la cabecera Idempotency-Key en peticiones POST: si la clave ya se procesó
+    para este tenant y endpoint, devuelve la respuesta guardada sin volver a ejecutar
+    la transacción. Los reintentos concurrentes con la misma clave se serializan con
+    un advisory lock de Postgres.
+    La clave se reserva (fila sin status_code) en la transacción de la petición, así que
+    se confirma en el mismo commit que las escrituras de la ruta: si el proceso cae antes
+    de guardar la respuesta, el reintento recibe 409 en lugar de repetir el cobro. Las
+    respuestas 5xx no se guardan; si la ruta no llegó a confirmar, se pueden reintentar.
+    Debe ir debajo de @jwt_required().
+    """
+    @wraps(f)
+    def decorated_function(*args, **kwargs):
+        key = request.headers.get(IDEMPOTENCY_HEADER)
+        if request.method != 'POST' or not key:
+            return f(*args, **kwargs)
+        if len(key) > MAX_KEY_LENGTH:
+            return jsonify({"msg": f"{IDEMPOTENCY_HEADER} demasiado larga"}), 400
+
+        tenant_id = str(get_jwt().get('tenant_id'))
+        scope = request.endpoint
+        request_hash = hashlib.sha256(request.get_data()).hexdigest()
+        cache_key = (tenant_id, scope, key)
+
+        stored = _recent.get(cache_key)
+        if stored:
+            return _replay(stored, request_hash)
+
+        lock_name = f"idem:{tenant_id}:{scope}:{key}"
+        with get_db_cursor() as cur:
+            cur.execute("SELECT pg_advisory_lock(hashtextextended(%s, 0))", (lock_name,))
+            stored = _load(cur, tenant_id, scope, key)
+            if not stored:
+                # Queda pendiente en la transacción de la petición: la confirma el commit de la ruta
+                cur.execute(
+                    "INSERT INTO idempotency_keys (tenant_id, scope, key, request_hash) VALUES (%s, %s, %s, %s)",
+                    (tenant_id, scope, key, request_hash)
+                )
+        try:
+            if stored:
+                if stored[1] is not None:
+                    _recent.set(cache_key, stored)
+                return _replay(stored, request_hash)
+
+            response = make_response(f(*args, **kwargs))
+            # Lo que la ruta no confirmó (p. ej. al responder 4xx) no debe colarse en el commit de abajo
+            _discard_uncommitted()
+            if response.status_code < 500 and response.is_json:
+                body = response.get_json()
+                with get_db_cursor(commit=True) as cur:
+                    cur.execute(
+                        """INSERT INTO idempotency_keys (tenant_id, scope, key, request_hash, status_code, response)
+                           VALUES (%s, %s, %s, %s, %s, %s)
+                           ON CONFLICT (tenant_id, scope, key)
+                           DO UPDATE SET status_code = EXCLUDED.status_code, response = EXCLUDED.response""",
+                        (tenant_id, scope, key, request_hash, response.status_code, Json(body))
+                    )
+                _recent.set(cache_key, (request_hash, response.status_code, body))
+            return response
+        finally:
+            try:
+                _discard_uncommitted()
+                with get_db_cursor(commit=True) as cur:
+                    cur.execute("SELECT pg_advisory_unlock(hashtextextended(%s, 0))", (lock_name,))
+            except Exception as e:
+                # Si la conexión murió el lock se liberó con ella
+                idem_logger.warning(f"No se pudo liberar el lock de idempotencia: {e}")
+    return decorated_function
+
+
+def purge_expired_idempotency_keys():
+    """Tarea del scheduler: borra las claves más viejas que IDEMPOTENCY_TTL_HOURS."""
+    try:
+        with get_db_cursor(commit=True) as cur:
+            cur.execute(
+                "DELETE FROM idempotency_keys WHERE created_at < now() - make_interval(hours => %s)",
+                (Config.IDEMPOTENCY_TTL_HOURS,)
+            )
+            idem_logger.info(f"Claves de idempotencia expiradas eliminadas: {cur.rowcount}")
+    except Exception as e:
+        idem_logger.error(f"Error purgando claves de idempotencia: {e}")
@@ -1,4 +1,5 @@
-from backend.db import get_db_cursor
+from backend.db import get_db_cursor, placeholders
+from psycopg2.extras import execute_values
 from datetime import date
 import uuid
 import logging
@@ -82,4 +83,30 @@ def verificar_stock_y_alertar(product_id):
             if p and p['stock'] <= STOCK_THRESHOLD:
                 create_notification(p['tenant_id'], 'almacenista', f"Stock bajo: {p['name']}", 'stock_bajo', product_id)
     except Exception as e:
-        inv_logger.error(f"Error: {e}")
\ No newline at end of file
+        inv_logger.error(f"Error: {e}")
+
+def verificar_stock_y_alertar_lote(product_ids, tenant_id=None):
+    """Versión por lotes de verificar_stock_y_alertar: una consulta y un INSERT para todo el conjunto."""
+    ids = [str(pid) for pid in dict.fromkeys(product_ids)]
+    if not ids:
+        return
+    try:
+        query = f"SELECT id, name, stock, tenant_id FROM products WHERE id IN ({placeholders(len(ids))}) AND stock <= %s"
+        params = [*ids, STOCK_THRESHOLD]
+        if tenant_id:
+            query += " AND tenant_id = %s::text"
+            params.append(tenant_id)
+        with get_db_cursor(commit=True) as cur:
+            cur.execute(query, params)
+            low = cur.fetchall()
+            if low:
+                execute_values(
+                    cur,
+                    """INSERT INTO notifications (id, tenant_id, rol_destino, mensaje, tipo, referencia_id, is_read, created_at)
+                       VALUES %s""",
+                    [(str(uuid.uuid4()), p['tenant_id'], 'almacenista', f"Stock bajo: {p['name']}", 'stock_bajo', p['id'])
+                     for p in low],
+                    template="(%s, %s, %s, %s, %s, %s, FALSE, CURRENT_TIMESTAMP)"
+                )
+    except Exception as e:
+        inv_logger.error(f"Error en verificación de stock por lote: {e}")
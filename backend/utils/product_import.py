@@ -0,0 +1,166 @@
+import io
+import csv
+import json
+import logging
+import psycopg2.extensions
+from psycopg2.extras import execute_values
+
+import_logger = logging.getLogger('backend.utils.product_import')
+
+IMPORT_COLUMNS = ('line', 'sku', 'name', 'price', 'stock', 'category')
+
+# Un único upsert desde la tabla temporal: actualiza los productos que coinciden por SKU (o por
+# nombre, sin distinguir mayúsculas, si la fila no trae SKU) e inserta el resto. Los cambios
+# de stock quedan en stock_movements (motivo 'importacion') en la misma sentencia; las filas
+# coincidentes se bloquean al leerlas para que el delta registrado sea exacto.
+UPSERT_SQL = """
+    WITH matched AS (
+        SELECT s.*, p.id AS product_id, p.stock AS old_stock
+        FROM product_import s
+        LEFT JOIN LATERAL (
+            SELECT id, stock FROM products p
+            WHERE p.tenant_id = %(tenant)s
+              AND CASE WHEN s.sku IS NOT NULL THEN p.sku = s.sku ELSE lower(p.name) = lower(s.name) END
+            ORDER BY id
+            LIMIT 1
+            FOR UPDATE
+        ) p ON TRUE
+    ),
+    updated AS (
+        UPDATE products p
+        SET name = m.name,
+            price = m.price,
+            stock = COALESCE(m.stock, p.stock),
+            category = m.category,
+            sku = COALESCE(m.sku, p.sku)
+        FROM matched m
+        WHERE p.id = m.product_id
+        RETURNING p.id, p.stock, m.old_stock
+    ),
+    inserted AS (
+        INSERT INTO products (name, price, stock, category, tenant_id, sku)
+        SELECT m.name, m.price, COALESCE(m.stock, 0), m.category, %(tenant)s, m.sku
+        FROM matched m
+        WHERE m.product_id IS NULL
+        ORDER BY m.line
+        RETURNING id, stock
+    ),
+    movements AS (
+        INSERT INTO stock_movements (tenant_id, product_id, delta, stock_after, reason, user_id)
+        SELECT %(tenant)s, id::text, stock - old_stock, stock, 'importacion', %(user)s FROM updated
+        WHERE stock <> old_stock
+        UNION ALL
+        SELECT %(tenant)s, id::text, stock, stock, 'importacion', %(user)s FROM inserted
+        WHERE stock <> 0
+    )
+    SELECT (SELECT COUNT(*) FROM updated) AS updated, (SELECT COUNT(*) FROM inserted) AS inserted
+"""
+
+
+def parse_rows(stream, content_type):
+    """
+    Lee el cuerpo (CSV con encabezado o NDJSON, un producto por línea) sin cargarlo entero.
+    Genera (número de línea, dict | None si la línea no se pudo leer).
+    """
+    if 'csv' in (content_type or ''):
+        text = io.TextIOWrapper(stream, encoding='utf-8-sig', newline='')
+        for line, row in enumerate(csv.DictReader(text), 2):
+            yield line, {k.strip().lower(): v for k, v in row.items() if k}
+        return
+    for line, raw in enumerate(stream, 1):
+        raw = raw.strip()
+        if not raw:
+            continue
+        try:
+            data = json.loads(raw)
+        except ValueError:
+            data = None
+        yield line, data if isinstance(data, dict) else None
+
+
+def validate_row(data):
+    """Normaliza una fila a (sku, name, price, stock, category). Lanza ValueError con el motivo."""
+    if data is None:
+        raise ValueError("Línea ilegible")
+    name = str(data.get('name') or '').strip()
+    category = str(data.get('category') or '').strip()
+    sku = str(data.get('sku') or '').strip() or None
+    if not name:
+        raise ValueError("Falta name")
+    if not category:
+        raise ValueError("Falta category")
+    try:
+        price = round(float(data.get('price')), 2)
+    except (TypeError, ValueError):
+        raise ValueError("price debe ser numérico")
+    if price < 0:
+        raise ValueError("price no puede ser negativo")
+    stock = data.get('stock')
+    if stock in (None, ''):
+        stock = None    # Al actualizar conserva el stock actual; al crear, 0
+    else:
+        try:
+            stock = int(float(stock))
+        except (TypeError, ValueError):
+            raise ValueError("stock debe ser entero")
+        if stock < 0:
+            raise ValueError("stock no puede ser negativo")
+    return sku, name, price, stock, category
+
+
+def collect_rows(parsed, max_rows):
+    """Valida las filas. Devuelve (filas válidas, errores [{line, msg}]); la clave repetida gana la primera."""
+    rows, errors, seen = [], [], {}
+    for count, (line, data) in enumerate(parsed, 1):
+        if count > max_rows:
+            errors.append({'line': line, 'msg': f"Se superó el máximo de {max_rows} filas por importación"})
+            break
+        try:
+            sku, name, price, stock, category = validate_row(data)
+        except ValueError as e:
+            errors.append({'line': line, 'msg': str(e)})
+            continue
+        key = ('sku', sku) if sku else ('name', name.lower())
+        if key in seen:
+            errors.append({'line': line, 'msg': f"Producto repetido en el archivo (línea {seen[key]})"})
+            continue
+        seen[key] = line
+        rows.append((line, sku, name, price, stock, category))
+    return rows, errors
+
+
+def load_staging(cur, rows):
+    """
+    Carga las filas en la tabla temporal product_import. Con psycopg2 bloqueante se usa COPY;
+    en modo cooperativo (gevent wait callback) COPY no está soportado y se usan INSERT multi-fila.
+    """
+    cur.execute(
+        """CREATE TEMP TABLE product_import (
+               line INTEGER PRIMARY KEY, sku TEXT, name TEXT NOT NULL, price NUMERIC NOT NULL,
+               stock INTEGER, category TEXT NOT NULL
+           ) ON COMMIT DROP"""
+    )
+    if psycopg2.extensions.get_wait_callback() is None:
+        buffer = io.StringIO()
+        writer = csv.writer(buffer)
+        for row in rows:
+            writer.writerow(['' if v is None else v for v in row])
+        buffer.seek(0)
+        cur.copy_expert(
+            f"COPY product_import ({', '.join(IMPORT_COLUMNS)}) FROM STDIN WITH (FORMAT csv, NULL '')",
+            buffer
+        )
+    else:
+        execute_values(
+            cur, f"INSERT INTO product_import ({', '.join(IMPORT_COLUMNS)}) VALUES %s", rows, page_size=1000
+        )
+
+
+def import_products(cur, tenant_id, rows, user_id=None):
+    """Carga `rows` y aplica el upsert en la transacción de `cur` (no confirma). Devuelve {updated, inserted}."""
+    if not rows:
+        return {'updated': 0, 'inserted': 0}
+    load_staging(cur, rows)
+    cur.execute(UPSERT_SQL, {'tenant': tenant_id, 'user': str(user_id) if user_id is not None else None})
+    result = cur.fetchone()
+    return {'updated': result['updated'], 'inserted': result['inserted']}
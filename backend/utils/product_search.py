@@ -0,0 +1,237 @@
+import re
+import heapq
+import bisect
+import logging
+import threading
+import unicodedata
+from backend.config import Config
+from backend.db import get_db_cursor
+from backend.utils.cache import TTLCache
+
+search_logger = logging.getLogger('backend.utils.product_search')
+
+_TOKEN_RE = re.compile(r'[a-z0-9]+')
+
+
+def normalize(text):
+    """Minúsculas sin acentos: 'Tubería PVC' -> 'tuberia pvc'."""
+    decomposed = unicodedata.normalize('NFKD', text or '')
+    return ''.join(ch for ch in decomposed if not unicodedata.combining(ch)).lower()
+
+
+def tokenize(text):
+    return _TOKEN_RE.findall(normalize(text))
+
+
+class ProductIndex:
+    """
+    Índice de prefijos en memoria del catálogo de un comercio, consultado con bisect:
+    - tokens de los nombres: lista ordenada de (token, product_id);
+    - tokens de las categorías: lista ordenada de (token, categoría), y por categoría sus
+      productos ya ordenados por (largo del nombre, nombre), para no recorrer categorías enteras.
+    Se actualiza producto a producto cuando se crean, modifican o eliminan.
+    """
+
+    def __init__(self, products=()):
+        self._products = {}         # id -> {'id', 'name', 'price', 'category'}
+        self._sort_keys = {}        # id -> (largo, nombre normalizado, id)
+        self._name_entries = []     # [(token, id)] ordenada
+        self._category_entries = [] # [(token, categoría)] ordenada
+        self._by_category = {}      # categoría -> [(largo, nombre normalizado, id)] ordenada
+        self._lock = threading.Lock()
+        for product in products:
+            self._add(product, keep_sorted=False)
+        self._name_entries.sort()
+        self._category_entries.sort()
+        for members in self._by_category.values():
+            members.sort()
+
+    @staticmethod
+    def _insert(items, item, keep_sorted):
+        if keep_sorted:
+            bisect.insort(items, item)
+        else:
+            items.append(item)
+
+    @staticmethod
+    def _delete(items, item):
+        i = bisect.bisect_left(items, item)
+        if i < len(items) and items[i] == item:
+            del items[i]
+
+    def _add(self, product, keep_sorted=True):
+        pid = str(product['id'])
+        category = product.get('category') or ''
+        name = normalize(product['name'])
+        self._products[pid] = {
+            'id': product['id'],
+            'name': product['name'],
+            'price': float(product['price']) if product.get('price') is not None else None,
+            'category': product.get('category'),
+        }
+        sort_key = self._sort_keys[pid] = (len(name), name, pid)
+        for token in set(tokenize(name)):
+            self._insert(self._name_entries, (token, pid), keep_sorted)
+        if category not in self._by_category:
+            self._by_category[category] = []
+            for token in set(tokenize(category)):
+                self._insert(self._category_entries, (token, category), keep_sorted)
+        self._insert(self._by_category[category], sort_key, keep_sorted)
+
+    def _remove(self, product_id):
+        pid = str(product_id)
+        old = self._products.pop(pid, None)
+        if old is None:
+            return
+        sort_key = self._sort_keys.pop(pid)
+        for token in set(tokenize(sort_key[1])):
+            self._delete(self._name_entries, (token, pid))
+        category = old['category'] or ''
+        members = self._by_category[category]
+        self._delete(members, sort_key)
+        if not members:
+            del self._by_category[category]
+            for token in set(tokenize(category)):
+                self._delete(self._category_entries, (token, category))
+
+    def upsert(self, product):
+        with self._lock:
+            self._remove(product['id'])
+            self._add(product)
+
+    def remove(self, product_id):
+        with self._lock:
+            self._remove(product_id)
+
+    @staticmethod
+    def _prefix_scan(entries, prefix):
+        """Valores de las entradas cuyo token empieza por `prefix`."""
+        found = set()
+        i = bisect.bisect_left(entries, (prefix,))
+        while i < len(entries) and entries[i][0].startswith(prefix):
+            found.add(entries[i][1])
+            i += 1
+        return found
+
+    def search(self, query, limit):
+        """
+        Productos en los que cada término de la búsqueda es prefijo de algún token del nombre
+        o de la categoría. Orden: el nombre empieza por la búsqueda, luego coincidencias solo
+        por nombre antes que las que necesitan la categoría, y nombres más cortos primero.
+        """
+        terms = tokenize(query)
+        if not terms:
+            return []
+        needle = normalize(query).strip()
+        with self._lock:
+            by_name = [self._prefix_scan(self._name_entries, term) for term in terms]
+            by_category = [self._prefix_scan(self._category_entries, term) for term in terms]
+
+            sort_keys = self._sort_keys
+            name_hits = set.intersection(*by_name)
+            ranked = heapq.nsmallest(
+                limit, name_hits, key=lambda pid: (not sort_keys[pid][1].startswith(needle), sort_keys[pid])
+            )
+
+            # Completar con productos que cumplen algún término solo por su categoría; cada
+            # categoría ya está ordenada, así que se recorre solo hasta llenar el cupo
+            if len(ranked) < limit and any(by_category):
+                missing = limit - len(ranked)
+                extra = []
+                for category in set().union(*by_category):
+                    # Términos que la categoría no cubre: esos deben estar en el nombre
+                    required = [names for names, cats in zip(by_name, by_category) if category not in cats]
+                    if required:
+                        extra.extend(
+                            sort_keys[pid] for pid in set.intersection(*required) - name_hits
+                            if (self._products[pid]['category'] or '') == category
+                        )
+                        continue
+                    # La categoría cubre todos los términos: sus productos ya están ordenados
+                    taken = 0
+                    for sort_key in self._by_category[category]:
+                        if sort_key[2] not in name_hits:
+                            extra.append(sort_key)
+                            taken += 1
+                            if taken >= missing:
+                                break
+                ranked += [key[2] for key in heapq.nsmallest(missing, extra)]
+
+            return [self._products[pid] for pid in ranked]
+
+    def __len__(self):
+        return len(self._products)
+
+
+# tenant_id -> ProductIndex. El TTL acota cuánto puede tardar en verse un cambio hecho por otro worker.
+_indexes = TTLCache(maxsize=Config.PRODUCT_INDEX_MAX_TENANTS, ttl=Config.PRODUCT_INDEX_TTL)
+_build_locks = {}
+_build_locks_guard = threading.Lock()
+
+
+def get_product_index(tenant_id):
+    """Índice del comercio; se construye con una sola consulta la primera vez (una construcción a la vez)."""
+    key = str(tenant_id)
+    index = _indexes.get(key)
+    if index is not None:
+        return index
+    with _build_locks_guard:
+        lock = _build_locks.setdefault(key, threading.Lock())
+    with lock:
+        index = _indexes.get(key)
+        if index is None:
+            with get_db_cursor() as cur:
+                cur.execute("SELECT id, name, price, category FROM products WHERE tenant_id = %s", (key,))
+                index = ProductIndex(cur.fetchall())
+            _indexes.set(key, index)
+            search_logger.info(f"Índice de productos del comercio {key} construido ({len(index)} productos)")
+    return index
+
+
+def index_product(tenant_id, product):
+    """Refleja en el índice (si ya está cargado) un producto creado o modificado."""
+    index = _indexes.get(str(tenant_id))
+    if index is not None:
+        index.upsert(product)
+
+
+def unindex_product(tenant_id, product_id):
+    index = _indexes.get(str(tenant_id))
+    if index is not None:
+        index.remove(product_id)
+
+
+def invalidate_product_index(tenant_id):
+    _indexes.pop(str(tenant_id))
+
+
+def search_products_db(cur, tenant_id, query, limit):
+    """Respaldo tolerante a errores de tipeo: similitud trigram (pg_trgm) sobre nombre y categoría."""
+    cur.execute(
+        """
+        SELECT id, name, price, category,
+               GREATEST(similarity(name, %(q)s), similarity(COALESCE(category, ''), %(q)s)) AS score
+        FROM products
+        WHERE tenant_id = %(tenant)s AND (name %% %(q)s OR category %% %(q)s)
+        ORDER BY score DESC, name
+        LIMIT %(limit)s
+        """,
+        {'tenant': str(tenant_id), 'q': query, 'limit': limit}
+    )
+    return [
+        {'id': r['id'], 'name': r['name'], 'price': float(r['price']) if r['price'] is not None else None,
+         'category': r['category'], 'score': round(float(r['score']), 3)}
+        for r in cur.fetchall()
+    ]
+
+
+def search_products(tenant_id, query, limit):
+    """
+    Autocompletado: índice de prefijos en memoria y, solo si no encuentra nada (p. ej. por un
+    error de tipeo), búsqueda trigram en la DB. Devuelve (resultados, origen: 'index' o 'db').
+    """
+    results = get_product_index(tenant_id).search(query, limit)
+    if results or len(normalize(query).strip()) < 3:
+        return results, 'index'
+    with get_db_cursor() as cur:
+        return search_products_db(cur, tenant_id, query, limit), 'db'
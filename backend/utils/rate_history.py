@@ -0,0 +1,129 @@
+import time
+import bisect
+import logging
+import threading
+from datetime import datetime, timezone
+from backend.db import get_db_cursor
+from backend.utils.bcv_api import get_dolarvzla_rate, rate_service
+
+rate_logger = logging.getLogger('backend.utils.rate_history')
+
+# Espera entre reintentos de carga de la serie tras un fallo (se duplica hasta el máximo)
+LOAD_RETRY_MIN = 5.0
+LOAD_RETRY_MAX = 300.0
+
+
+class RateHistory:
+    """
+    Copia en memoria de la tabla exchange_rates como dos arreglos paralelos ordenados
+    (epoch, tasa). "Tasa en el instante T" es una búsqueda binaria: O(log n), sin red.
+    """
+
+    def __init__(self):
+        self._times = []
+        self._rates = []
+        self._loaded = False
+        self._retry_at = 0.0
+        self._retry_delay = LOAD_RETRY_MIN
+        self._lock = threading.Lock()
+
+    def load(self):
+        with get_db_cursor(scoped=False) as cur:
+            cur.execute("SELECT extract(epoch FROM fetched_at) AS ts, rate FROM exchange_rates ORDER BY fetched_at")
+            rows = cur.fetchall()
+        with self._lock:
+            self._times = [float(r['ts']) for r in rows]
+            self._rates = [float(r['rate']) for r in rows]
+            self._loaded = True
+        rate_logger.info(f"Serie de tasas cargada: {len(rows)} puntos.")
+
+    def _ensure_loaded(self):
+        """Carga la serie la primera vez; tras un fallo no reintenta hasta que pase la espera."""
+        if self._loaded:
+            return
+        with self._lock:
+            now = time.monotonic()
+            if self._loaded or now < self._retry_at:
+                return
+            # Reserva el intento: las demás peticiones siguen sin serie en lugar de repetir la carga
+            self._retry_at = now + self._retry_delay
+        try:
+            self.load()
+        except Exception as e:
+            with self._lock:
+                delay = self._retry_delay
+                self._retry_delay = min(delay * 2, LOAD_RETRY_MAX)
+            rate_logger.error(f"No se pudo cargar la serie de tasas (se reintentará en {delay:.0f}s): {e}")
+        else:
+            with self._lock:
+                self._retry_delay = LOAD_RETRY_MIN
+
+    def record(self, rate, fetched_at):
+        """Persiste un punto si la tasa cambió respecto al último conocido."""
+        self._ensure_loaded()
+        with self._lock:
+            if self._rates and fetched_at >= self._times[-1] and self._rates[-1] == rate:
+                return
+        ts = datetime.fromtimestamp(fetched_at, tz=timezone.utc)
+        with get_db_cursor(commit=True, scoped=False) as cur:
+            # Otro worker pudo guardar ya la misma tasa: solo insertamos si difiere de la última
+            cur.execute(
+                """INSERT INTO exchange_rates (fetched_at, rate)
+                   SELECT %s, %s
+                   WHERE NOT EXISTS (
+                       SELECT 1 FROM (SELECT rate FROM exchange_rates ORDER BY fetched_at DESC LIMIT 1) last
+                       WHERE last.rate = %s
+                   )
+                   ON CONFLICT (fetched_at) DO NOTHING""",
+                (ts, rate, rate)
+            )
+        with self._lock:
+            idx = bisect.bisect_right(self._times, fetched_at)
+            self._times.insert(idx, fetched_at)
+            self._rates.insert(idx, rate)
+
+    def rate_at(self, when):
+        """Tasa vigente en `when` (datetime o epoch). None si no hay datos previos."""
+        self._ensure_loaded()
+        ts = when.timestamp() if isinstance(when, datetime) else float(when)
+        with self._lock:
+            idx = bisect.bisect_right(self._times, ts) - 1
+            return self._rates[idx] if idx >= 0 else None
+
+    def points(self, start=None, end=None):
+        """[(epoch, tasa)] con start <= epoch <= end, más el punto vigente al inicio."""
+        self._ensure_loaded()
+        lo_ts = start.timestamp() if start else float('-inf')
+        hi_ts = end.timestamp() if end else float('inf')
+        with self._lock:
+            lo = max(bisect.bisect_right(self._times, lo_ts) - 1, 0)
+            hi = bisect.bisect_right(self._times, hi_ts)
+            return list(zip(self._times[lo:hi], self._rates[lo:hi]))
+
+
+rate_history = RateHistory()
+
+def _on_rate_fetched(rate, fetched_at):
+    try:
+        rate_history.record(rate, fetched_at)
+    except Exception as e:
+        rate_logger.error(f"No se pudo guardar la tasa en la serie: {e}")
+
+rate_service.add_listener(_on_rate_fetched)
+
+def resolve_exchange_rate(when=None):
+    """
+    Tasa USD->VES para el instante `when` (datetime o epoch; por defecto, ahora).
+    La tasa actual la da el servicio de tasas, que respeta RATE_MAX_STALE: el último punto de
+    la serie solo dice cuándo cambió la tasa, no cuándo se confirmó por última vez. La serie
+    se usa para instantes anteriores a la última consulta exitosa, que sí cubre.
+    """
+    current = get_dolarvzla_rate()
+    if when is None:
+        return current
+    ts = when.timestamp() if isinstance(when, datetime) else float(when)
+    _, fetched_at = rate_service.snapshot()
+    if fetched_at is None or ts > fetched_at:
+        return current
+    rate = rate_history.rate_at(ts)
+    return rate if rate is not None else current
@@ -0,0 +1,152 @@
+import time
+import logging
+import threading
+from backend.config import Config
+from backend.db import get_db_cursor
+from backend.utils.cache import TTLCache
+from backend.utils.catalog_cache import subscribe, listening_since
+
+receivables_logger = logging.getLogger('backend.utils.receivables')
+
+# Tramos de antigüedad por días de mora (días desde fecha_vencimiento)
+AGING_BUCKETS = ('current', 'd1_30', 'd31_60', 'd61_90', 'd90_plus')
+
+# Mismo predicado que GET /api/sales/credits/pending; lo cubre idx_sales_receivables (migración 007).
+# Toda venta a crédito tiene fecha_vencimiento (migración 016 completa las antiguas), así que
+# no hace falta mirar el texto de status, que no se puede indexar.
+RECEIVABLE_FILTER = """
+    s.tenant_id = %s::text
+    AND s.balance_due_usd > 0.05
+    AND s.fecha_vencimiento IS NOT NULL
+"""
+
+AGING_SQL = f"""
+    WITH r AS (
+        SELECT s.customer_id, s.balance_due_usd, s.fecha_vencimiento,
+               GREATEST(COALESCE(CURRENT_DATE - s.fecha_vencimiento::date, 0), 0) AS dias_mora
+        FROM sales s
+        WHERE {RECEIVABLE_FILTER}
+    )
+    SELECT
+        GROUPING(r.customer_id) = 1 AS is_total,
+        r.customer_id::text AS customer_id,
+        MAX(c.name) AS customer_name,
+        MAX(c.cedula) AS customer_cedula,
+        COUNT(*) AS invoices,
+        MIN(r.fecha_vencimiento)::text AS oldest_due,
+        MAX(r.dias_mora) AS max_dias_mora,
+        COALESCE(SUM(r.balance_due_usd) FILTER (WHERE r.dias_mora = 0), 0) AS "current",
+        COALESCE(SUM(r.balance_due_usd) FILTER (WHERE r.dias_mora BETWEEN 1 AND 30), 0) AS d1_30,
+        COALESCE(SUM(r.balance_due_usd) FILTER (WHERE r.dias_mora BETWEEN 31 AND 60), 0) AS d31_60,
+        COALESCE(SUM(r.balance_due_usd) FILTER (WHERE r.dias_mora BETWEEN 61 AND 90), 0) AS d61_90,
+        COALESCE(SUM(r.balance_due_usd) FILTER (WHERE r.dias_mora > 90), 0) AS d90_plus,
+        SUM(r.balance_due_usd) AS total
+    FROM r
+    LEFT JOIN customers c ON c.id = r.customer_id
+    GROUP BY GROUPING SETS ((r.customer_id), ())
+"""
+
+# tenant_id -> snapshot del reporte
+_snapshots = TTLCache(maxsize=Config.AGING_CACHE_SIZE, ttl=Config.AGING_CACHE_TTL)
+# Comercios que consultaron el reporte recientemente (los únicos que refresca el scheduler)
+_active_tenants = TTLCache(maxsize=Config.AGING_CACHE_SIZE, ttl=Config.AGING_CACHE_TTL)
+# Contadores de invalidación: un cálculo que empezó antes de un cambio no puede guardar su resultado
+_generations = {}
+_epoch = 0
+_lock = threading.Lock()
+
+# Tipos de cambio (ver catalog_cache.CHANGE_KINDS) que pueden mover saldos por cobrar
+AGING_CHANGE_KINDS = {'customers', 'sales'}
+
+
+def compute_aging(cur, tenant_id):
+    """Reporte de antigüedad de saldos del comercio en una sola consulta agregada."""
+    cur.execute(AGING_SQL, (str(tenant_id),))
+    empty = dict.fromkeys(AGING_BUCKETS, 0.0)
+    totals = {**empty, 'total': 0.0, 'invoices': 0, 'customers': 0}
+    customers = []
+    for row in cur.fetchall():
+        amounts = {key: round(float(row[key] or 0), 2) for key in (*AGING_BUCKETS, 'total')}
+        if row['is_total']:
+            totals.update(amounts, invoices=row['invoices'])
+            continue
+        customers.append({
+            'customer_id': row['customer_id'],
+            'customer_name': row['customer_name'],
+            'customer_cedula': row['customer_cedula'],
+            'invoices': row['invoices'],
+            'oldest_due': row['oldest_due'],
+            'max_dias_mora': row['max_dias_mora'],
+            **amounts,
+        })
+    # Los más atrasados primero
+    customers.sort(key=lambda c: (c['d90_plus'], c['d61_90'], c['d31_60'], c['d1_30'], c['total']), reverse=True)
+    totals['customers'] = len(customers)
+    return {'generated_at': time.time(), 'buckets': list(AGING_BUCKETS), 'totals': totals, 'customers': customers}
+
+
+def _seen(key):
+    with _lock:
+        return _epoch, _generations.get(key, 0)
+
+
+def _store(key, snapshot, seen):
+    with _lock:
+        if (_epoch, _generations.get(key, 0)) == seen:
+            _snapshots.set(key, snapshot)
+
+
+def get_aging_snapshot(tenant_id, refresh=False):
+    """
+    Snapshot cacheado del reporte; se calcula si no existe, venció o se pide refresh.
+    Las ventas, abonos y reparaciones de saldos de cualquier worker lo descartan a través de
+    los avisos de catalog_cache; mientras este worker no los escuche, se calcula en cada lectura.
+    """
+    key = str(tenant_id)
+    listening = listening_since() is not None
+    _active_tenants.set(key, True)
+    snapshot = None if refresh or not listening else _snapshots.get(key)
+    if snapshot is None:
+        seen = _seen(key)
+        with get_db_cursor() as cur:
+            snapshot = compute_aging(cur, key)
+        if listening:
+            _store(key, snapshot, seen)
+    return snapshot
+
+
+def invalidate_aging(tenant_id):
+    """Descarta el snapshot del comercio (se recalcula en la siguiente lectura)."""
+    key = str(tenant_id)
+    with _lock:
+        _generations[key] = _generations.get(key, 0) + 1
+        _snapshots.pop(key)
+
+
+def _on_catalog_change(data):
+    global _epoch
+    if data is None:
+        # Pudieron perderse avisos: ningún snapshot es confiable
+        with _lock:
+            _epoch += 1
+            _snapshots.clear()
+    elif AGING_CHANGE_KINDS.intersection(data.get('kinds', ())):
+        invalidate_aging(data['tenant'])
+
+
+subscribe(_on_catalog_change)
+
+
+def refresh_aging_snapshots():
+    """Tarea del scheduler: recalcula los snapshots de los comercios consultados recientemente."""
+    if listening_since() is None:
+        # Sin avisos no se sirven snapshots (ver get_aging_snapshot): no hay nada que precalcular
+        return
+    for tenant_id in _active_tenants.keys():
+        try:
+            seen = _seen(tenant_id)
+            with get_db_cursor(scoped=False) as cur:
+                snapshot = compute_aging(cur, tenant_id)
+            _store(tenant_id, snapshot, seen)
+        except Exception as e:
+            receivables_logger.error(f"Error al refrescar antigüedad de saldos de {tenant_id}: {e}")
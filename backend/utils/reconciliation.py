@@ -0,0 +1,115 @@
+import time
+import logging
+from concurrent.futures import ThreadPoolExecutor
+from backend.config import Config
+from backend.db import get_db_cursor
+from backend.utils.catalog_cache import notify_catalog_change
+
+recon_logger = logging.getLogger('backend.utils.reconciliation')
+
+# Saldo esperado de cada cliente = suma de balance_due_usd de sus ventas. Una sola sentencia
+# por comercio; con repair=True el UPDATE solo toca clientes descuadrados y, si otra transacción
+# cambió el saldo mientras tanto, la condición sobre `stored` lo salta en lugar de pisarlo.
+RECONCILE_SQL = """
+    WITH expected AS (
+        SELECT s.customer_id, SUM(s.balance_due_usd) AS balance
+        FROM sales s
+        WHERE s.tenant_id = %(tenant)s::text AND s.balance_due_usd > 0
+        GROUP BY s.customer_id
+    ),
+    drift AS (
+        SELECT c.id, c.balance_pendiente_usd AS stored, COALESCE(e.balance, 0) AS expected
+        FROM customers c
+        LEFT JOIN expected e ON e.customer_id = c.id
+        WHERE c.tenant_id = %(tenant)s::text
+          AND ABS(COALESCE(c.balance_pendiente_usd, 0) - COALESCE(e.balance, 0)) > %(tolerance)s
+    ){repair}
+    SELECT COUNT(*) AS customers,
+           COALESCE(SUM(ABS(COALESCE(stored, 0) - expected)), 0) AS total_drift_usd,
+           COALESCE(MAX(ABS(COALESCE(stored, 0) - expected)), 0) AS max_drift_usd,
+           {repaired} AS repaired
+    FROM drift
+"""
+
+REPAIR_CTE = """,
+    repaired AS (
+        UPDATE customers c SET balance_pendiente_usd = d.expected
+        FROM drift d
+        WHERE c.id = d.id AND c.balance_pendiente_usd IS NOT DISTINCT FROM d.stored
+        RETURNING c.id
+    )"""
+
+
+def reconcile_tenant(tenant_id, repair=False):
+    """Verifica (y con repair=True corrige) los saldos de clientes de un comercio. Devuelve métricas."""
+    started = time.monotonic()
+    query = RECONCILE_SQL.format(
+        repair=REPAIR_CTE if repair else '',
+        repaired='(SELECT COUNT(*) FROM repaired)' if repair else '0',
+    )
+    # Conexión propia: se ejecuta en hilos del scheduler o del comando CLI
+    with get_db_cursor(commit=True, scoped=False) as cur:
+        # Nunca esperar mucho por filas bloqueadas por ventas en curso ni frenar a los cajeros
+        cur.execute("SET LOCAL lock_timeout = %s", (f"{Config.RECONCILE_LOCK_TIMEOUT_MS}ms",))
+        cur.execute("SET LOCAL statement_timeout = %s", (f"{Config.RECONCILE_STATEMENT_TIMEOUT_MS}ms",))
+        cur.execute(query, {'tenant': str(tenant_id), 'tolerance': Config.RECONCILE_TOLERANCE})
+        row = cur.fetchone()
+        if row['repaired']:
+            notify_catalog_change(cur, tenant_id, 'customers')
+    return {
+        'tenant_id': str(tenant_id),
+        'drifted_customers': row['customers'],
+        'total_drift_usd': round(float(row['total_drift_usd']), 2),
+        'max_drift_usd': round(float(row['max_drift_usd']), 2),
+        'repaired': row['repaired'],
+        'seconds': round(time.monotonic() - started, 3),
+    }
+
+
+def list_tenants():
+    with get_db_cursor(scoped=False) as cur:
+        cur.execute("SELECT DISTINCT tenant_id::text AS tenant_id FROM customers WHERE tenant_id IS NOT NULL")
+        return [row['tenant_id'] for row in cur.fetchall()]
+
+
+def reconcile_balances(repair=False, tenants=None, workers=None):
+    """
+    Concilia todos los comercios (o `tenants`) en paralelo, con a lo sumo `workers` conexiones
+    a la vez (Config.RECONCILE_WORKERS; debe quedar holgura en el pool para las peticiones).
+    Un comercio que falla no detiene al resto: su error queda en el reporte.
+    """
+    started = time.monotonic()
+    tenants = tenants if tenants is not None else list_tenants()
+    workers = max(1, min(workers or Config.RECONCILE_WORKERS, len(tenants) or 1))
+
+    def run(tenant_id):
+        try:
+            return reconcile_tenant(tenant_id, repair=repair)
+        except Exception as e:
+            recon_logger.error(f"Error conciliando saldos del comercio {tenant_id}: {e}")
+            return {'tenant_id': str(tenant_id), 'error': str(e)}
+
+    with ThreadPoolExecutor(max_workers=workers, thread_name_prefix='reconcile') as executor:
+        results = list(executor.map(run, tenants))
+
+    ok = [r for r in results if 'error' not in r]
+    summary = {
+        'tenants': len(results),
+        'failed': len(results) - len(ok),
+        'tenants_with_drift': sum(1 for r in ok if r['drifted_customers']),
+        'drifted_customers': sum(r['drifted_customers'] for r in ok),
+        'total_drift_usd': round(sum(r['total_drift_usd'] for r in ok), 2),
+        'max_drift_usd': max((r['max_drift_usd'] for r in ok), default=0.0),
+        'repaired': sum(r['repaired'] for r in ok),
+        'seconds': round(time.monotonic() - started, 3),
+    }
+    recon_logger.info(f"Conciliación de saldos ({'con' if repair else 'sin'} reparación): {summary}")
+    return summary, results
+
+
+def reconcile_balances_job():
+    """Tarea nocturna del scheduler."""
+    try:
+        reconcile_balances(repair=Config.RECONCILE_REPAIR)
+    except Exception as e:
+        recon_logger.error(f"Error en la conciliación de saldos: {e}")
@@ -0,0 +1,174 @@
+import random
+from collections import OrderedDict
+from psycopg2.extras import execute_values
+from backend.config import Config
+
+# Dimensiones de sales_daily_stats: 'total' (dim_key ''), 'seller' (user_id) y 'category'
+STAT_COLUMNS = (
+    'revenue_usd', 'revenue_ves', 'tickets', 'units',
+    'credit_usd', 'contado_usd', 'collected_usd', 'collected_ves',
+)
+
+UPSERT_SQL = f"""
+    INSERT INTO sales_daily_stats (tenant_id, day, dimension, dim_key, shard, {', '.join(STAT_COLUMNS)})
+    VALUES %s
+    ON CONFLICT (tenant_id, day, dimension, dim_key, shard) DO UPDATE SET
+        {', '.join(f'{col} = sales_daily_stats.{col} + EXCLUDED.{col}' for col in STAT_COLUMNS)}
+"""
+
+
+class StatDeltas:
+    """
+    Acumula en memoria los incrementos de una transacción y los aplica con un único
+    INSERT ... ON CONFLICT DO UPDATE (una fila por día/dimensión, no una por venta).
+    """
+
+    def __init__(self, tenant_id):
+        self.tenant_id = str(tenant_id)
+        self._rows = {}   # (day, dimension, dim_key) -> {columna: incremento}
+
+    def add(self, day, dimension, dim_key, **values):
+        row = self._rows.setdefault((day, dimension, str(dim_key)), dict.fromkeys(STAT_COLUMNS, 0))
+        for col, value in values.items():
+            row[col] += value
+
+    def add_sale(self, user_id, sale_date, lines, products, totals):
+        day = sale_date.date()
+        revenue_usd = round(totals['total_amount_usd'], 2)
+        split = 'credit_usd' if totals['status'] == 'Crédito' else 'contado_usd'
+        units = sum(line['quantity'] for line in lines)
+        sale_values = {
+            'revenue_usd': revenue_usd, 'revenue_ves': round(totals['total_amount_ves'], 2),
+            'tickets': 1, 'units': units, split: revenue_usd,
+        }
+        self.add(day, 'total', '', **sale_values)
+        self.add(day, 'seller', user_id, **sale_values)
+
+        by_category = OrderedDict()
+        for line in lines:
+            product = products[line['product_id']]
+            amount, qty = by_category.get(product['category'] or '', (0.0, 0))
+            by_category[product['category'] or ''] = (amount + float(product['price']) * line['quantity'], qty + line['quantity'])
+        for category, (amount, qty) in by_category.items():
+            self.add(day, 'category', category, revenue_usd=round(amount, 2), tickets=1, units=qty)
+
+    def add_payment(self, user_id, paid_at, amount_usd, amount_ves):
+        day = paid_at.date()
+        self.add(day, 'total', '', collected_usd=amount_usd, collected_ves=amount_ves)
+        self.add(day, 'seller', user_id, collected_usd=amount_usd, collected_ves=amount_ves)
+
+    def apply(self, cur):
+        if not self._rows:
+            return
+        # Las filas 'total' de cada día las tocan todas las ventas del comercio; repartirlas en
+        # Config.SALES_STATS_SHARDS sub-filas evita que transacciones concurrentes se esperen
+        # entre sí en el mismo bloqueo hasta el COMMIT. El orden fijo evita interbloqueos.
+        shard = random.randrange(max(1, Config.SALES_STATS_SHARDS))
+        rows = [
+            (self.tenant_id, day, dimension, dim_key, shard, *(values[col] for col in STAT_COLUMNS))
+            for (day, dimension, dim_key), values in sorted(self._rows.items())
+        ]
+        execute_values(cur, UPSERT_SQL, rows, page_size=1000)
+        self._rows.clear()
+
+
+def rebuild_sales_stats(cur, tenant_id=None):
+    """
+    Recalcula sales_daily_stats desde sales, sale_items y credit_payments (comando backfill-sales-stats).
+    Devuelve el número de filas generadas.
+    """
+    tenant_filter = "AND s.tenant_id = %(tenant)s::text" if tenant_id else ""
+    payment_filter = "AND cp.tenant_id = %(tenant)s::text" if tenant_id else ""
+    cur.execute(
+        "DELETE FROM sales_daily_stats" + (" WHERE tenant_id = %(tenant)s::text" if tenant_id else ""),
+        {'tenant': tenant_id}
+    )
+    cur.execute(
+        f"""
+        WITH s AS (
+            SELECT s.id, s.tenant_id::text AS tenant_id, s.sale_date::date AS day, s.user_id::text AS user_id,
+                   ROUND(s.total_amount_usd::numeric, 2) AS revenue_usd,
+                   ROUND(s.total_amount_ves::numeric, 2) AS revenue_ves,
+                   s.fecha_vencimiento IS NOT NULL AS is_credit,
+                   (SELECT COALESCE(SUM(si.quantity), 0) FROM sale_items si WHERE si.sale_id = s.id) AS units
+            FROM sales s
+            WHERE TRUE {tenant_filter}
+        ),
+        parts AS (
+            SELECT tenant_id, day, d.dimension, d.dim_key, revenue_usd, revenue_ves, 1 AS tickets, units,
+                   CASE WHEN is_credit THEN revenue_usd ELSE 0 END AS credit_usd,
+                   CASE WHEN is_credit THEN 0 ELSE revenue_usd END AS contado_usd,
+                   0 AS collected_usd, 0 AS collected_ves
+            FROM s CROSS JOIN LATERAL (VALUES ('total', ''), ('seller', s.user_id)) AS d(dimension, dim_key)
+            UNION ALL
+            SELECT s.tenant_id, s.day, 'category', COALESCE(p.category, ''),
+                   ROUND(SUM(si.quantity * si.price)::numeric, 2), 0, 1, SUM(si.quantity), 0, 0, 0, 0
+            FROM s
+            JOIN sale_items si ON si.sale_id = s.id
+            LEFT JOIN products p ON p.id = si.product_id
+            GROUP BY s.id, s.tenant_id, s.day, COALESCE(p.category, '')
+            UNION ALL
+            SELECT cp.tenant_id::text, COALESCE(cp.payment_date, cp.created_at)::date, d.dimension, d.dim_key,
+                   0, 0, 0, 0, 0, 0, cp.amount_usd, cp.amount_ves
+            FROM credit_payments cp
+            CROSS JOIN LATERAL (VALUES ('total', ''), ('seller', cp.user_id::text)) AS d(dimension, dim_key)
+            WHERE TRUE {payment_filter}
+        )
+        INSERT INTO sales_daily_stats (tenant_id, day, dimension, dim_key, shard, {', '.join(STAT_COLUMNS)})
+        SELECT tenant_id, day, dimension, dim_key, 0, {', '.join(f'SUM({col})' for col in STAT_COLUMNS)}
+        FROM parts
+        GROUP BY tenant_id, day, dimension, dim_key
+        """,
+        {'tenant': tenant_id}
+    )
+    return cur.rowcount
+
+
+def sales_dashboard(cur, tenant_id, date_from, date_to):
+    """
+    Resumen del período [date_from, date_to] leyendo solo sales_daily_stats: el costo depende
+    del número de días y vendedores/categorías, no del historial de ventas.
+    """
+    cur.execute(
+        f"""
+        SELECT st.dimension, st.dim_key, st.day::text AS day, MAX(u.nombre) AS name,
+               {', '.join(f'SUM(st.{col}) AS {col}' for col in STAT_COLUMNS)}
+        FROM (
+            SELECT dimension, dim_key, CASE WHEN dimension = 'total' THEN day END AS day, {', '.join(STAT_COLUMNS)}
+            FROM sales_daily_stats
+            WHERE tenant_id = %s::text AND day BETWEEN %s AND %s
+        ) st
+        LEFT JOIN users u ON st.dimension = 'seller' AND u.id::text = st.dim_key
+        GROUP BY st.dimension, st.dim_key, st.day
+        """,
+        (str(tenant_id), date_from, date_to)
+    )
+    totals = dict.fromkeys(STAT_COLUMNS, 0)
+    daily, sellers, categories = [], [], []
+    for row in cur.fetchall():
+        values = {col: float(row[col] or 0) for col in STAT_COLUMNS}
+        values['tickets'] = int(values['tickets'])
+        values['units'] = int(values['units'])
+        if row['dimension'] == 'total':
+            daily.append({'day': row['day'], **values})
+            for col in STAT_COLUMNS:
+                totals[col] += values[col]
+        elif row['dimension'] == 'seller':
+            sellers.append({'user_id': row['dim_key'], 'name': row['name'], **values})
+        else:
+            categories.append({'category': row['dim_key'], **values})
+
+    totals = {col: round(value, 2) for col, value in totals.items()}
+    tickets = totals['tickets']
+    totals['average_ticket_usd'] = round(totals['revenue_usd'] / tickets, 2) if tickets else 0.0
+    daily.sort(key=lambda d: d['day'])
+    sellers.sort(key=lambda s: s['revenue_usd'], reverse=True)
+    categories.sort(key=lambda c: c['revenue_usd'], reverse=True)
+    return {
+        'date_from': str(date_from),
+        'date_to': str(date_to),
+        'totals': totals,
+        'daily': daily,
+        'sellers': sellers,
+        'categories': categories,
+    }
@@ -0,0 +1,640 @@
+import json
+import uuid
+import logging
+from collections import OrderedDict
+from datetime import datetime, timedelta
+from psycopg2.extras import execute_values, Json
+from backend.config import Config
+from backend.db import values_sql, placeholders
+from backend.utils.sales_stats import StatDeltas
+from backend.utils.stock_ledger import MOVEMENTS_FROM_UPD, movement_params, insert_movements
+from backend.utils.catalog_cache import notify_catalog_change
+
+sales_logger = logging.getLogger('backend.utils.sales_utils')
+
+DEFAULT_CREDIT_DAYS = 30
+CREDIT_BALANCE_TOLERANCE = 0.05
+# Monedas aceptadas en los abonos (payment_currency); cualquier otro valor se rechaza
+PAYMENT_CURRENCIES = ('USD', 'VES')
+
+
+class SaleError(Exception):
+    """Venta inválida (producto inexistente, cantidad inválida, stock insuficiente...)."""
+
+
+def normalize_items(items):
+    """Valida las líneas del ticket y devuelve [{'product_id': str, 'quantity': int}]."""
+    if not isinstance(items, list) or not items:
+        raise SaleError("La venta no tiene productos")
+    lines = []
+    for item in items:
+        product_id = item.get('product_id') if isinstance(item, dict) else None
+        try:
+            quantity = int(item.get('quantity', 0))
+        except (TypeError, ValueError, AttributeError):
+            quantity = 0
+        if not product_id or quantity <= 0:
+            raise SaleError(f"Línea inválida: {item}")
+        lines.append({'product_id': str(product_id), 'quantity': quantity})
+    return lines
+
+
+def quantities_by_product(lines):
+    """Cantidad total por producto, en orden determinista (por id) para bloquear sin deadlocks."""
+    totals = {}
+    for line in lines:
+        totals[line['product_id']] = totals.get(line['product_id'], 0) + line['quantity']
+    return OrderedDict(sorted(totals.items()))
+
+
+def is_credit_sale(tipo_pago_raw, saldo_pendiente):
+    # Normalización robusta para detectar crédito
+    tipo_pago_clean = (tipo_pago_raw or '').lower().strip().replace('é', 'e').replace('á', 'a')
+    return 'credito' in tipo_pago_clean or saldo_pendiente > CREDIT_BALANCE_TOLERANCE
+
+
+def lock_products(cur, tenant_id, product_ids):
+    """
+    Bloquea todos los productos del ticket en una sola sentencia y en orden de id. FOR NO KEY
+    UPDATE basta para descontar stock y no choca con los FOR KEY SHARE que toman las claves
+    foráneas de sale_items de otras ventas en curso.
+    """
+    ids = list(product_ids)
+    cur.execute(
+        f"""SELECT id, name, price, stock, category FROM products
+            WHERE tenant_id = %s::text AND id IN ({placeholders(len(ids))})
+            ORDER BY id FOR NO KEY UPDATE""",
+        [tenant_id, *ids]
+    )
+    return {str(row['id']): row for row in cur.fetchall()}
+
+
+def read_products(cur, tenant_id, product_ids):
+    """Lectura sin bloqueo de los productos del ticket; se bloquean al final, con el descuento."""
+    ids = list(product_ids)
+    cur.execute(
+        f"""SELECT id, name, price, stock, category FROM products
+            WHERE tenant_id = %s::text AND id IN ({placeholders(len(ids))})""",
+        [tenant_id, *ids]
+    )
+    return {str(row['id']): row for row in cur.fetchall()}
+
+
+def reserve_stock(cur, tenant_id, quantities, products, sale_id=None, user_id=None):
+    """
+    Descuento condicional y atómico: una sola sentencia bloquea las filas (en orden de id y con
+    FOR NO KEY UPDATE, compatible con las claves foráneas de sale_items), comprueba stock >= cantidad, descuenta y registra los movimientos de la venta en
+    stock_movements. Si algún producto no alcanza, lanza SaleError.
+    Es la última sentencia antes del COMMIT: el bloqueo de los productos dura solo eso.
+    """
+    ids = list(quantities)
+    cur.execute(
+        b"WITH v(product_id, qty) AS (VALUES "
+        + values_sql(cur, quantities.items(), "(%s, %s::int)")
+        + b"), "
+        + cur.mogrify(
+            f"""l AS (
+                    SELECT id FROM products WHERE tenant_id = %s::text AND id IN ({placeholders(len(ids))})
+                    ORDER BY id FOR NO KEY UPDATE
+                ),
+                upd AS (
+                    UPDATE products p SET stock = p.stock - v.qty
+                    FROM v, l
+                    WHERE p.id = l.id AND p.id::text = v.product_id AND p.stock >= v.qty
+                    RETURNING p.id::text AS product_id, p.price, p.stock, -v.qty AS delta
+                ),
+                {MOVEMENTS_FROM_UPD}
+                SELECT product_id, price FROM upd""",
+            [tenant_id, *ids, *movement_params(tenant_id, 'venta', sale_id, user_id)]
+        )
+    )
+    reserved = {row['product_id']: row['price'] for row in cur.fetchall()}
+    for product_id in ids:
+        if product_id not in reserved:
+            raise SaleError(f"Stock insuficiente para {products[product_id]['name']}")
+        if reserved[product_id] != products[product_id]['price']:
+            raise SaleError(f"El precio de {products[product_id]['name']} cambió; intente de nuevo")
+
+
+def lock_stock(cur, tenant_id, quantities, products):
+    """
+    Bloquea los productos leídos antes sin bloqueo (estrategia 'lock' y lotes) y comprueba que
+    todavía alcanza el stock para `quantities` y que el precio no cambió. Devuelve el stock
+    bloqueado {product_id: stock}; lanza SaleError si algo ya no cuadra.
+    """
+    locked = lock_products(cur, tenant_id, quantities)
+    for product_id, qty in quantities.items():
+        row = locked.get(product_id)
+        if not row:
+            raise SaleError(f"Producto ID {product_id} no encontrado")
+        if row['stock'] < qty:
+            raise SaleError(f"Stock insuficiente para {row['name']}")
+        if row['price'] != products[product_id]['price']:
+            raise SaleError(f"El precio de {row['name']} cambió; intente de nuevo")
+    return {product_id: locked[product_id]['stock'] for product_id in quantities}
+
+
+def decrement_stock(cur, tenant_id, quantities):
+    """Descuenta el stock de todos los productos con un único UPDATE ... FROM (VALUES ...)."""
+    ids = list(quantities)
+    cur.execute(
+        b"UPDATE products p SET stock = p.stock - v.qty FROM (VALUES "
+        + values_sql(cur, quantities.items(), "(%s, %s::int)")
+        + b") AS v(product_id, qty) "
+        + cur.mogrify(
+            f"WHERE p.tenant_id = %s::text AND p.id IN ({placeholders(len(ids))}) AND p.id::text = v.product_id",
+            [tenant_id, *ids]
+        )
+    )
+
+
+def sale_movement_rows(tenant_id, user_id, sale_id, quantities, stock):
+    """
+    Movimientos de una venta para stock_movements; `stock` es el stock (bloqueado) antes de la
+    venta y se actualiza en el sitio, así que sirve para encadenar varias ventas del mismo lote.
+    """
+    rows = []
+    for product_id, qty in quantities.items():
+        stock[product_id] -= qty
+        rows.append((tenant_id, product_id, -qty, stock[product_id], 'venta', sale_id,
+                     str(user_id) if user_id is not None else None))
+    return rows
+
+
+def sale_item_rows(tenant_id, sale_id, lines, products):
+    """Filas (sale_id, product_id, quantity, price, tenant_id) con el precio histórico del producto."""
+    return [
+        (sale_id, line['product_id'], line['quantity'], float(products[line['product_id']]['price']), tenant_id)
+        for line in lines
+    ]
+
+
+def insert_sale_items(cur, rows):
+    """Inserta las líneas (de una o varias ventas) en un solo INSERT multi-fila."""
+    execute_values(
+        cur,
+        "INSERT INTO sale_items (sale_id, product_id, quantity, price, tenant_id) VALUES %s",
+        rows,
+        template="(%s, %s, %s, %s, %s::text)",
+        page_size=1000
+    )
+
+
+SALE_INSERT_SQL = """
+    INSERT INTO sales (
+        id, customer_id, user_id, tenant_id, sale_date, 
+        total_amount_usd, total_amount_ves, exchange_rate_used, 
+        status, tipo_pago, usd_paid, ves_paid, balance_due_usd, 
+        fecha_vencimiento, dias_credito, invoice_document, client_ref
+    ) VALUES %s
+"""
+# La factura se arma con lo que ya tenemos en memoria y se completa con cliente y
+# vendedor mediante subconsultas dentro del mismo INSERT (sin viajes extra a la DB)
+SALE_INSERT_TEMPLATE = """(%s, %s, %s, %s, %s, %s, %s, %s, %s, %s, %s, %s, %s, %s, %s,
+    %s::jsonb || jsonb_build_object(
+        'customer', (SELECT jsonb_build_object('id', c.id, 'name', c.name, 'cedula', c.cedula)
+                     FROM customers c WHERE c.id = %s AND c.tenant_id = %s::text),
+        'seller', (SELECT jsonb_build_object('id', u.id, 'name', u.nombre) FROM users u WHERE u.id = %s)
+    ), %s)"""
+
+# Misma estructura que SALE_INSERT_TEMPLATE, para ventas anteriores sin factura guardada
+INVOICE_DOCUMENT_SQL = """
+    jsonb_build_object(
+        'sale_id', s.id,
+        'sale_date', s.sale_date,
+        'status', s.status,
+        'tipo_pago', s.tipo_pago,
+        'fecha_vencimiento', s.fecha_vencimiento,
+        'dias_credito', s.dias_credito,
+        'customer', (SELECT jsonb_build_object('id', c.id, 'name', c.name, 'cedula', c.cedula)
+                     FROM customers c WHERE c.id = s.customer_id),
+        'seller', (SELECT jsonb_build_object('id', u.id, 'name', u.nombre) FROM users u WHERE u.id = s.user_id),
+        'items', COALESCE((
+            SELECT jsonb_agg(jsonb_build_object(
+                'product_id', si.product_id, 'name', p.name, 'qty', si.quantity,
+                'price_usd', si.price, 'subtotal_usd', si.quantity * si.price
+            ))
+            FROM sale_items si LEFT JOIN products p ON p.id = si.product_id
+            WHERE si.sale_id = s.id
+        ), '[]'::jsonb),
+        'totals', jsonb_build_object(
+            'usd', s.total_amount_usd, 'ves', s.total_amount_ves, 'exchange_rate', s.exchange_rate_used,
+            'usd_paid', s.usd_paid, 'ves_paid', s.ves_paid, 'balance_due_usd', s.balance_due_usd
+        )
+    )
+"""
+
+
+def invoice_document(sale_id, sale_date, lines, products, exchange_rate, tipo_pago, usd_paid, ves_paid, totals):
+    """Factura desnormalizada (sin cliente/vendedor, que se agregan en el INSERT)."""
+    return {
+        'sale_id': sale_id,
+        'sale_date': sale_date.isoformat(),
+        'status': totals['status'],
+        'tipo_pago': tipo_pago,
+        'fecha_vencimiento': totals['fecha_vencimiento'].isoformat() if totals['fecha_vencimiento'] else None,
+        'dias_credito': totals['dias_credito'],
+        'items': [
+            {
+                'product_id': line['product_id'],
+                'name': products[line['product_id']]['name'],
+                'qty': line['quantity'],
+                'price_usd': float(products[line['product_id']]['price']),
+                'subtotal_usd': round(float(products[line['product_id']]['price']) * line['quantity'], 2),
+            }
+            for line in lines
+        ],
+        'totals': {
+            'usd': totals['total_amount_usd'],
+            'ves': totals['total_amount_ves'],
+            'exchange_rate': exchange_rate,
+            'usd_paid': usd_paid,
+            'ves_paid': ves_paid,
+            'balance_due_usd': totals['balance_due_usd'],
+        },
+    }
+
+
+def backfill_invoice_documents(cur, tenant_id=None, sale_id=None, limit=1000):
+    """
+    Genera la factura de ventas antiguas que no la tienen (un UPDATE por tanda).
+    Devuelve [(id, invoice_document)] de las filas actualizadas.
+    """
+    conditions = ["invoice_document IS NULL"]
+    params = []
+    if tenant_id:
+        conditions.append("tenant_id = %s::text")
+        params.append(tenant_id)
+    if sale_id:
+        conditions.append("id = %s")
+        params.append(sale_id)
+    params.append(limit)
+    cur.execute(
+        f"""UPDATE sales s SET invoice_document = {INVOICE_DOCUMENT_SQL}
+            WHERE s.id IN (SELECT id FROM sales WHERE {' AND '.join(conditions)} LIMIT %s)
+            RETURNING s.id::text, s.invoice_document""",
+        params
+    )
+    return cur.fetchall()
+
+
+def compute_sale_totals(lines, products, exchange_rate, tipo_pago, usd_paid, ves_paid, dias_credito, sale_date):
+    """Totales USD/VES, saldo pendiente y condición (Contado/Crédito) de una venta."""
+    total_amount_usd = sum(float(products[l['product_id']]['price']) * l['quantity'] for l in lines)
+    total_amount_ves = total_amount_usd * exchange_rate
+    total_paid_usd = usd_paid + (ves_paid / exchange_rate if exchange_rate > 0 else 0)
+    saldo_pendiente = max(0.0, round(total_amount_usd - total_paid_usd, 2))
+
+    # Lógica automática de crédito por saldo
+    if is_credit_sale(tipo_pago, saldo_pendiente):
+        status = 'Crédito'
+        dias_credito = int(dias_credito if dias_credito is not None else DEFAULT_CREDIT_DAYS)
+        fecha_vencimiento = sale_date.date() + timedelta(days=dias_credito)
+    else:
+        status = 'Completado'
+        fecha_vencimiento = None
+        dias_credito = 0
+
+    return {
+        'total_amount_usd': total_amount_usd,
+        'total_amount_ves': total_amount_ves,
+        'balance_due_usd': saldo_pendiente,
+        'status': status,
+        'fecha_vencimiento': fecha_vencimiento,
+        'dias_credito': dias_credito,
+    }
+
+
+def sale_row(sale_id, tenant_id, user_id, customer_id, sale_date, exchange_rate, tipo_pago, usd_paid, ves_paid,
+             totals, lines, products, client_ref=None):
+    document = invoice_document(sale_id, sale_date, lines, products, exchange_rate, tipo_pago, usd_paid, ves_paid, totals)
+    return (
+        sale_id, customer_id, user_id, tenant_id, sale_date,
+        totals['total_amount_usd'], totals['total_amount_ves'], exchange_rate,
+        totals['status'], tipo_pago, usd_paid, ves_paid, totals['balance_due_usd'],
+        totals['fecha_vencimiento'], totals['dias_credito'],
+        Json(document, dumps=lambda obj: json.dumps(obj, default=str)), customer_id, tenant_id, user_id,
+        client_ref
+    )
+
+
+def create_sale(cur, tenant_id, user_id, customer_id, items, exchange_rate,
+                tipo_pago='Contado', usd_paid=0.0, ves_paid=0.0, dias_credito=None, sale_date=None):
+    """
+    Registra una venta completa dentro de la transacción de `cur` (no confirma).
+    Número de sentencias constante, sin importar cuántas líneas tenga el ticket.
+    Lanza SaleError si la venta no es válida.
+
+    Los productos se leen sin bloqueo para validar y calcular totales, y el inventario es lo
+    último: con Config.SALE_STOCK_STRATEGY = 'atomic' un UPDATE condicional bloquea, comprueba y
+    descuenta en una sola sentencia; con 'lock' se bloquean (FOR NO KEY UPDATE), se revalidan y
+    se descuentan con sentencias separadas. Así las filas compartidas se bloquean en el mismo
+    orden que en el resto de escrituras (clientes, agregados diarios, versiones del catálogo y
+    productos) y los más vendidos solo quedan bloqueados hasta el COMMIT.
+    """
+    lines = normalize_items(items)
+    quantities = quantities_by_product(lines)
+    sale_date = sale_date or datetime.now()
+    atomic = Config.SALE_STOCK_STRATEGY == 'atomic'
+
+    # PASO 1: Validar stock de todo el ticket (sin bloquear; se revalida al descontar)
+    products = read_products(cur, tenant_id, quantities)
+    for product_id, qty in quantities.items():
+        product = products.get(product_id)
+        if not product:
+            raise SaleError(f"Producto ID {product_id} no encontrado")
+        if product['stock'] < qty:
+            raise SaleError(f"Stock insuficiente para {product['name']}")
+
+    # PASO 2: Cálculo de Totales y Saldo
+    totals = compute_sale_totals(lines, products, exchange_rate, tipo_pago, usd_paid, ves_paid, dias_credito, sale_date)
+    credit = totals['status'] == 'Crédito'
+
+    # PASO 3: Insertar Venta e Items (filas nuevas: no esperan a otras transacciones)
+    sale_id = str(uuid.uuid4())
+    cur.execute(
+        SALE_INSERT_SQL % SALE_INSERT_TEMPLATE,
+        sale_row(sale_id, tenant_id, user_id, customer_id, sale_date, exchange_rate, tipo_pago, usd_paid, ves_paid,
+                 totals, lines, products)
+    )
+    insert_sale_items(cur, sale_item_rows(tenant_id, sale_id, lines, products))
+
+    # PASO 4: Saldo del cliente, agregados diarios y versiones (el aviso sale al confirmar)
+    if credit:
+        cur.execute(
+            "UPDATE customers SET balance_pendiente_usd = balance_pendiente_usd + %s WHERE id = %s AND tenant_id = %s::text",
+            (totals['balance_due_usd'], customer_id, tenant_id)
+        )
+    stats = StatDeltas(tenant_id)
+    stats.add_sale(user_id, sale_date, lines, products, totals)
+    stats.apply(cur)
+    notify_catalog_change(cur, tenant_id, 'stock', 'sales', *(('customers',) if credit else ()))
+
+    # PASO 5: Inventario, siempre lo último antes del COMMIT
+    if atomic:
+        reserve_stock(cur, tenant_id, quantities, products, sale_id, user_id)
+    else:
+        stock = lock_stock(cur, tenant_id, quantities, products)
+        decrement_stock(cur, tenant_id, quantities)
+        insert_movements(cur, sale_movement_rows(tenant_id, user_id, sale_id, quantities, stock))
+
+    return {'sale_id': sale_id, 'product_ids': list(quantities), **totals}
+
+
+def add_customer_balances(cur, tenant_id, deltas):
+    """Suma los saldos pendientes de varios clientes con un único UPDATE ... FROM (VALUES ...)."""
+    deltas = OrderedDict(sorted((str(k), v) for k, v in deltas.items() if v))
+    if not deltas:
+        return
+    ids = list(deltas)
+    cur.execute(
+        b"UPDATE customers c SET balance_pendiente_usd = COALESCE(c.balance_pendiente_usd, 0) + v.amount FROM (VALUES "
+        + values_sql(cur, deltas.items(), "(%s, %s::numeric)")
+        + b") AS v(customer_id, amount) "
+        + cur.mogrify(
+            f"WHERE c.tenant_id = %s::text AND c.id IN ({placeholders(len(ids))}) AND c.id::text = v.customer_id",
+            [tenant_id, *ids]
+        )
+    )
+
+
+def parse_sale_date(value):
+    if not value:
+        return datetime.now()
+    try:
+        return datetime.fromisoformat(str(value).replace('Z', '+00:00')).replace(tzinfo=None)
+    except ValueError:
+        raise SaleError(f"Fecha inválida: {value}")
+
+
+def create_sales_batch(cur, tenant_id, user_id, sales, rate_for):
+    """
+    Registra un lote de ventas (sincronización offline) dentro de la transacción de `cur`.
+
+    Productos y clientes del lote se consultan una vez (sin bloqueo); el stock se valida en
+    memoria en orden cronológico, y las ventas aceptadas se escriben con INSERT multi-fila en
+    `sales` y `sale_items`, un UPDATE agregado de saldos de clientes y, al final, otro de stock
+    con los movimientos de cada venta en un único INSERT a stock_movements. Si al bloquear los
+    productos el stock o algún precio ya no cuadra, lanza SaleError y el lote entero se revierte.
+    `rate_for(sale_date)` resuelve la tasa de cada venta si el POS no la envía.
+
+    Devuelve una lista de resultados en el mismo orden que `sales`:
+    {'index', 'client_ref', 'status': 'created'|'error', 'sale_id' | 'msg'}.
+    """
+    results = [None] * len(sales)
+    parsed = []
+    for index, data in enumerate(sales):
+        client_ref = data.get('client_ref') if isinstance(data, dict) else None
+        try:
+            if not isinstance(data, dict):
+                raise SaleError("Venta con formato JSON inválido")
+            if not data.get('customer_id'):
+                raise SaleError("Campos faltantes: customer_id")
+            parsed.append({
+                'index': index,
+                'client_ref': str(client_ref) if client_ref else None,
+                'customer_id': str(data['customer_id']),
+                'lines': normalize_items(data.get('items')),
+                'sale_date': parse_sale_date(data.get('sale_date')),
+                'tipo_pago': data.get('tipo_pago', 'Contado'),
+                'usd_paid': float(data.get('usd_paid', 0) or 0),
+                'ves_paid': float(data.get('ves_paid', 0) or 0),
+                'dias_credito': data.get('dias_credito'),
+                'exchange_rate': float(data['exchange_rate']) if data.get('exchange_rate') else None,
+            })
+        except (SaleError, TypeError, ValueError) as e:
+            results[index] = {'index': index, 'client_ref': client_ref, 'status': 'error', 'msg': str(e)}
+
+    if not parsed:
+        return results
+
+    # Una consulta para todos los productos y otra para los clientes
+    all_quantities = quantities_by_product([line for sale in parsed for line in sale['lines']])
+    products = read_products(cur, tenant_id, all_quantities)
+    customer_ids = sorted({sale['customer_id'] for sale in parsed})
+    cur.execute(
+        f"SELECT id FROM customers WHERE tenant_id = %s::text AND id IN ({placeholders(len(customer_ids))})",
+        [tenant_id, *customer_ids]
+    )
+    known_customers = {str(row['id']) for row in cur.fetchall()}
+
+    stock = {pid: row['stock'] for pid, row in products.items()}
+    sale_rows, item_rows, accepted = [], [], []
+    consumed = OrderedDict()
+    balance_deltas = {}
+    stats = StatDeltas(tenant_id)
+
+    for sale in sorted(parsed, key=lambda s: (s['sale_date'], s['index'])):
+        index = sale['index']
+        try:
+            if sale['customer_id'] not in known_customers:
+                raise SaleError(f"Cliente ID {sale['customer_id']} no encontrado")
+            quantities = quantities_by_product(sale['lines'])
+            for product_id, qty in quantities.items():
+                if product_id not in products:
+                    raise SaleError(f"Producto ID {product_id} no encontrado")
+                if stock[product_id] < qty:
+                    raise SaleError(f"Stock insuficiente para {products[product_id]['name']}")
+        except SaleError as e:
+            results[index] = {'index': index, 'client_ref': sale['client_ref'], 'status': 'error', 'msg': str(e)}
+            continue
+
+        for product_id, qty in quantities.items():
+            consumed[product_id] = consumed.get(product_id, 0) + qty
+
+        exchange_rate = sale['exchange_rate'] or rate_for(sale['sale_date'])
+        totals = compute_sale_totals(
+            sale['lines'], products, exchange_rate, sale['tipo_pago'],
+            sale['usd_paid'], sale['ves_paid'], sale['dias_credito'], sale['sale_date']
+        )
+        if totals['status'] == 'Crédito':
+            balance_deltas[sale['customer_id']] = balance_deltas.get(sale['customer_id'], 0) + totals['balance_due_usd']
+
+        sale_id = str(uuid.uuid4())
+        sale_rows.append(sale_row(
+            sale_id, tenant_id, user_id, sale['customer_id'], sale['sale_date'], exchange_rate,
+            sale['tipo_pago'], sale['usd_paid'], sale['ves_paid'], totals, sale['lines'], products,
+            client_ref=sale['client_ref']
+        ))
+        item_rows.extend(sale_item_rows(tenant_id, sale_id, sale['lines'], products))
+        for product_id, qty in quantities.items():
+            stock[product_id] -= qty
+        accepted.append((sale_id, quantities))
+        stats.add_sale(user_id, sale['sale_date'], sale['lines'], products, totals)
+        results[index] = {'index': index, 'client_ref': sale['client_ref'], 'status': 'created', 'sale_id': sale_id}
+
+    if sale_rows:
+        execute_values(cur, SALE_INSERT_SQL, sale_rows, template=SALE_INSERT_TEMPLATE, page_size=1000)
+        insert_sale_items(cur, item_rows)
+        # Mismo orden de bloqueo que create_sale: clientes, agregados, versiones y productos
+        add_customer_balances(cur, tenant_id, balance_deltas)
+        stats.apply(cur)
+        notify_catalog_change(cur, tenant_id, 'stock', 'sales', *(('customers',) if balance_deltas else ()))
+        consumed = OrderedDict(sorted(consumed.items()))
+        stock = lock_stock(cur, tenant_id, consumed, products)
+        decrement_stock(cur, tenant_id, consumed)
+        insert_movements(cur, [
+            row for sale_id, quantities in accepted
+            for row in sale_movement_rows(tenant_id, user_id, sale_id, quantities, stock)
+        ])
+
+    return results
+
+
+# --- Abonos ---
+
+def allocate_payment(invoices, amount_usd):
+    """
+    Reparte `amount_usd` entre facturas abiertas [(sale_id, saldo)] ya ordenadas de la más
+    antigua a la más reciente. Devuelve [(sale_id, aplicado, nuevo_saldo)] solo de las que reciben pago.
+    El nuevo saldo es el real (saldo - aplicado), aunque quede bajo la tolerancia: así la suma de
+    saldos de las facturas sigue igual al saldo del cliente, que baja exactamente lo aplicado.
+    """
+    allocations = []
+    remaining = round(amount_usd, 2)
+    for sale_id, balance in invoices:
+        if remaining <= 0:
+            break
+        applied = round(min(float(balance), remaining), 2)
+        new_balance = round(float(balance) - applied, 2)
+        allocations.append((sale_id, applied, new_balance))
+        remaining = round(remaining - applied, 2)
+    return allocations
+
+
+def payment_status(balance):
+    """Estado de la factura tras un abono: el saldo residual menor a la tolerancia se da por pagado."""
+    return 'Pagado' if balance < CREDIT_BALANCE_TOLERANCE else 'Abonado'
+
+
+def pay_customer_invoices(cur, tenant_id, user_id, customer_id, amount, currency, exchange_rate, paid_at=None):
+    """
+    Aplica un abono del cliente a sus facturas abiertas, de la más antigua a la más reciente (FIFO),
+    dentro de la transacción de `cur` (no confirma). Número fijo de sentencias sin importar
+    cuántas facturas cubra. Lanza SaleError si no hay deuda, el monto la excede o la moneda
+    no es una de PAYMENT_CURRENCIES.
+    """
+    if currency not in PAYMENT_CURRENCIES:
+        raise SaleError(f"Moneda de pago inválida: {currency} (use {' o '.join(PAYMENT_CURRENCIES)})")
+    paid_at = paid_at or datetime.now()
+    if currency == 'USD':
+        amount_usd = round(amount, 2)
+    else:
+        amount_usd = round(amount / exchange_rate, 2)
+    if amount_usd <= 0:
+        raise SaleError("El monto del abono debe ser mayor a cero")
+
+    # Bloquea las facturas abiertas del cliente en orden de antigüedad
+    cur.execute(
+        """SELECT id::text AS id, balance_due_usd FROM sales
+           WHERE tenant_id = %s::text AND customer_id = %s AND balance_due_usd > 0.05
+           ORDER BY sale_date, id
+           FOR UPDATE""",
+        (tenant_id, customer_id)
+    )
+    invoices = [(row['id'], row['balance_due_usd']) for row in cur.fetchall()]
+    if not invoices:
+        raise SaleError("El cliente no tiene facturas pendientes")
+    total_due = round(sum(float(balance) for _, balance in invoices), 2)
+    if amount_usd > total_due + CREDIT_BALANCE_TOLERANCE:
+        raise SaleError(f"El monto ({amount_usd:.2f} USD) excede la deuda total del cliente ({total_due:.2f} USD)")
+
+    allocations = allocate_payment(invoices, amount_usd)
+    payment_rows = []
+    for sale_id, applied, _ in allocations:
+        applied_ves = round(applied * exchange_rate, 2)
+        payment_rows.append((
+            str(uuid.uuid4()), sale_id, customer_id, user_id,
+            applied, applied_ves, applied, applied_ves,
+            exchange_rate, currency, tenant_id, paid_at, paid_at
+        ))
+    execute_values(
+        cur,
+        """INSERT INTO credit_payments (
+               id, sale_id, customer_id, user_id,
+               amount_usd, amount_ves, amount_paid_usd, amount_paid_ves,
+               exchange_rate, payment_method, tenant_id,
+               created_at, payment_date
+           ) VALUES %s""",
+        payment_rows
+    )
+
+    ids = [sale_id for sale_id, _, _ in allocations]
+    cur.execute(
+        b"UPDATE sales s SET balance_due_usd = v.balance, status = v.status, updated_at = "
+        + cur.mogrify("%s", (paid_at,))
+        + b", paid_amount_usd = COALESCE(s.paid_amount_usd, 0) + v.applied FROM (VALUES "
+        + values_sql(
+            cur,
+            [(sale_id, balance, payment_status(balance), applied) for sale_id, applied, balance in allocations],
+            "(%s, %s::numeric, %s, %s::numeric)"
+        )
+        + b") AS v(sale_id, balance, status, applied) "
+        + cur.mogrify(
+            f"WHERE s.tenant_id = %s::text AND s.id IN ({placeholders(len(ids))}) AND s.id::text = v.sale_id",
+            [tenant_id, *ids]
+        )
+    )
+
+    applied_usd = round(sum(applied for _, applied, _ in allocations), 2)
+    applied_ves = round(sum(row[5] for row in payment_rows), 2)
+    cur.execute(
+        "UPDATE customers SET balance_pendiente_usd = COALESCE(balance_pendiente_usd, 0) - %s WHERE id = %s AND tenant_id = %s::text",
+        (applied_usd, customer_id, tenant_id)
+    )
+
+    stats = StatDeltas(tenant_id)
+    stats.add_payment(user_id, paid_at, applied_usd, applied_ves)
+    stats.apply(cur)
+    notify_catalog_change(cur, tenant_id, 'customers', 'sales')
+
+    return {
+        'amount_usd': applied_usd,
+        'amount_ves': applied_ves,
+        'remaining_debt_usd': round(max(0.0, total_due - applied_usd), 2),
+        'allocations': [
+            {'sale_id': sale_id, 'applied_usd': applied, 'nuevo_saldo': balance,
+             'status': payment_status(balance)}
+            for sale_id, applied, balance in allocations
+        ],
+    }
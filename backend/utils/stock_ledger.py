@@ -0,0 +1,260 @@
+import logging
+from collections import OrderedDict
+from datetime import datetime, date, time
+from psycopg2.extras import execute_values
+from backend.config import Config
+from backend.db import get_db_cursor, values_sql, placeholders
+from backend.utils.catalog_cache import notify_catalog_change
+
+ledger_logger = logging.getLogger('backend.utils.stock_ledger')
+
+# Motivos registrados en stock_movements
+#   venta, alta (stock inicial), importacion, ajuste (PUT o ajuste manual), recepcion,
+#   devolucion, merma, conteo
+MOVEMENT_COLUMNS = "(tenant_id, product_id, delta, stock_after, reason, reference_id, user_id)"
+
+# CTE que registra en el libro las filas devueltas por un CTE `upd` con (product_id, stock, delta)
+MOVEMENTS_FROM_UPD = f"""mov AS (
+                    INSERT INTO stock_movements {MOVEMENT_COLUMNS}
+                    SELECT %s::text, product_id, delta, stock, %s, %s, %s FROM upd
+                )"""
+
+# Clave del advisory lock de las instantáneas: cada worker tiene su scheduler y solo uno debe tomarlas
+SNAPSHOT_LOCK_KEY = 7301
+
+# Primera instantánea: stock actual menos los movimientos posteriores al corte
+SNAPSHOT_BASELINE_SQL = """
+    INSERT INTO stock_snapshots (tenant_id, product_id, taken_at, stock)
+    SELECT p.tenant_id::text, p.id::text, %(until)s,
+           p.stock - COALESCE((
+               SELECT SUM(m.delta) FROM stock_movements m
+               WHERE m.tenant_id = p.tenant_id::text AND m.product_id = p.id::text AND m.created_at > %(until)s
+           ), 0)
+    FROM products p
+    WHERE p.tenant_id IS NOT NULL
+"""
+
+# Siguientes: solo los productos con movimientos desde el corte anterior (última instantánea + deltas)
+SNAPSHOT_DELTA_SQL = """
+    WITH changed AS (
+        SELECT tenant_id, product_id, SUM(delta) AS delta
+        FROM stock_movements
+        WHERE created_at > %(since)s AND created_at <= %(until)s
+        GROUP BY tenant_id, product_id
+    )
+    INSERT INTO stock_snapshots (tenant_id, product_id, taken_at, stock)
+    SELECT c.tenant_id, c.product_id, %(until)s, COALESCE(s.stock, 0) + c.delta
+    FROM changed c
+    LEFT JOIN LATERAL (
+        SELECT ss.stock FROM stock_snapshots ss
+        WHERE ss.tenant_id = c.tenant_id AND ss.product_id = c.product_id
+        ORDER BY ss.taken_at DESC
+        LIMIT 1
+    ) s ON TRUE
+"""
+
+# Stock de cada producto en `at`: última instantánea <= at más los movimientos entre ambas
+# (dos búsquedas por índice por producto, sin recorrer el historial)
+STOCK_AT_SQL = """
+    SELECT p.id, p.name, p.category, p.price,
+           COALESCE(s.stock, 0) + COALESCE(m.delta, 0) AS stock
+    FROM products p
+    LEFT JOIN LATERAL (
+        SELECT ss.taken_at, ss.stock FROM stock_snapshots ss
+        WHERE ss.tenant_id = %(tenant)s::text AND ss.product_id = p.id::text AND ss.taken_at <= %(at)s
+        ORDER BY ss.taken_at DESC
+        LIMIT 1
+    ) s ON TRUE
+    LEFT JOIN LATERAL (
+        SELECT SUM(sm.delta) AS delta FROM stock_movements sm
+        WHERE sm.tenant_id = %(tenant)s::text AND sm.product_id = p.id::text
+          AND sm.created_at > COALESCE(s.taken_at, '-infinity') AND sm.created_at <= %(at)s
+    ) m ON TRUE
+    WHERE p.tenant_id = %(tenant)s::text {product_filter}
+"""
+
+
+class StockError(Exception):
+    """Ajuste de inventario inválido (producto inexistente, stock negativo...)."""
+
+
+def movement_params(tenant_id, reason, reference_id, user_id):
+    """Parámetros de MOVEMENTS_FROM_UPD."""
+    return [tenant_id, reason, reference_id, str(user_id) if user_id is not None else None]
+
+
+def insert_movements(cur, rows):
+    """
+    Registra movimientos ya calculados [(tenant_id, product_id, delta, stock_after, reason,
+    reference_id, user_id)] con un INSERT multi-fila (no confirma).
+    """
+    if rows:
+        execute_values(
+            cur, f"INSERT INTO stock_movements {MOVEMENT_COLUMNS} VALUES %s", rows,
+            template="(%s::text, %s::text, %s, %s, %s, %s, %s)", page_size=1000
+        )
+
+
+def normalize_deltas(items):
+    """[{product_id, delta}] -> OrderedDict(product_id -> delta neto), ordenado por id y sin deltas nulos."""
+    if not isinstance(items, list) or not items:
+        raise StockError("Debe enviar al menos un producto")
+    deltas = {}
+    for item in items:
+        if not isinstance(item, dict) or not item.get('product_id'):
+            raise StockError("Cada línea requiere product_id y delta")
+        try:
+            delta = int(item.get('delta'))
+        except (TypeError, ValueError):
+            raise StockError(f"Delta inválido para el producto {item.get('product_id')}")
+        product_id = str(item['product_id'])
+        deltas[product_id] = deltas.get(product_id, 0) + delta
+    return OrderedDict(sorted((pid, d) for pid, d in deltas.items() if d))
+
+
+def adjust_stock(cur, tenant_id, user_id, deltas, reason, reference_id=None):
+    """
+    Aplica deltas relativos de stock y los registra en stock_movements con una sola sentencia,
+    dentro de la transacción de `cur` (no confirma). Como en las ventas, las versiones del
+    catálogo van antes y los productos al final, bloqueados en orden de id, así que no se
+    interbloquea con ellas. Si algún producto no existe o quedaría con stock
+    negativo lanza StockError y no se aplica nada (el llamador revierte).
+    Devuelve {product_id: stock resultante}.
+    """
+    if not deltas:
+        return {}
+    ids = list(deltas)
+    notify_catalog_change(cur, tenant_id, 'stock')
+    cur.execute(
+        b"WITH v(product_id, delta) AS (VALUES "
+        + values_sql(cur, deltas.items(), "(%s, %s::int)")
+        + b"), "
+        + cur.mogrify(
+            f"""l AS (
+                    SELECT id FROM products WHERE tenant_id = %s::text AND id IN ({placeholders(len(ids))})
+                    ORDER BY id FOR NO KEY UPDATE
+                ),
+                upd AS (
+                    UPDATE products p SET stock = p.stock + v.delta
+                    FROM v, l
+                    WHERE p.id = l.id AND p.id::text = v.product_id AND p.stock + v.delta >= 0
+                    RETURNING p.id::text AS product_id, p.stock, v.delta
+                ),
+                {MOVEMENTS_FROM_UPD}
+                SELECT product_id, stock FROM upd""",
+            [tenant_id, *ids, *movement_params(tenant_id, reason, reference_id, user_id)]
+        )
+    )
+    applied = {row['product_id']: row['stock'] for row in cur.fetchall()}
+    if missing := [pid for pid in ids if pid not in applied]:
+        raise StockError(f"Productos inexistentes o con stock insuficiente para el ajuste: {', '.join(missing)}")
+    return applied
+
+
+# --- Instantáneas y consultas históricas ---
+
+def take_stock_snapshots(cur, margin_seconds=None):
+    """
+    Toma la instantánea periódica del stock hasta now() - margen (no confirma). El margen deja
+    fuera los movimientos de transacciones que aún podrían estar en curso. La primera vez se
+    guardan todos los productos; después, solo los que tuvieron movimientos desde el corte
+    anterior, así la tabla crece con los cambios y no con el catálogo.
+    Devuelve el número de filas guardadas, o None si otro proceso la está tomando.
+    """
+    cur.execute("SELECT pg_try_advisory_xact_lock(%s) AS locked", (SNAPSHOT_LOCK_KEY,))
+    if not cur.fetchone()['locked']:
+        return None
+    margin = Config.STOCK_SNAPSHOT_MARGIN_SECONDS if margin_seconds is None else margin_seconds
+    cur.execute(
+        """SELECT now() - make_interval(secs => %s) AS until,
+                  (SELECT MAX(taken_at) FROM stock_snapshot_runs) AS since""",
+        (margin,)
+    )
+    row = cur.fetchone()
+    until, since = row['until'], row['since']
+    if since is not None and until <= since:
+        return 0
+    if since is None:
+        cur.execute(SNAPSHOT_BASELINE_SQL, {'until': until})
+    else:
+        cur.execute(SNAPSHOT_DELTA_SQL, {'since': since, 'until': until})
+    saved = cur.rowcount
+    cur.execute("INSERT INTO stock_snapshot_runs (taken_at, products) VALUES (%s, %s)", (until, saved))
+    return saved
+
+
+def take_stock_snapshots_job():
+    """Tarea del scheduler: instantánea de inventario con conexión propia."""
+    try:
+        with get_db_cursor(commit=True, scoped=False) as cur:
+            saved = take_stock_snapshots(cur)
+        if saved is not None:
+            ledger_logger.info(f"Instantánea de inventario: {saved} productos")
+    except Exception as e:
+        ledger_logger.error(f"Error tomando la instantánea de inventario: {e}")
+
+
+def parse_as_of(value):
+    """'2024-05-31' -> cierre de ese día; también acepta fecha y hora ISO."""
+    text = str(value).strip()
+    try:
+        if len(text) == 10:
+            return datetime.combine(date.fromisoformat(text), time.max)
+        return datetime.fromisoformat(text.replace('Z', '+00:00'))
+    except ValueError:
+        raise StockError(f"Fecha inválida: {value}")
+
+
+def check_history(cur, at):
+    """Lanza StockError si `at` es anterior a la primera instantánea (no hay con qué reconstruir)."""
+    cur.execute("SELECT MIN(taken_at) AS first, MIN(taken_at) > %s AS too_early FROM stock_snapshot_runs", (at,))
+    row = cur.fetchone()
+    if row['first'] is None:
+        raise StockError("Aún no hay instantáneas de inventario (flask stock-snapshot)")
+    if row['too_early']:
+        raise StockError(f"No hay historial de inventario anterior a {row['first'].isoformat()}")
+
+
+def stock_at(cur, tenant_id, at, product_ids=None):
+    """Stock de los productos del comercio (o solo `product_ids`) en el instante `at`: {product_id: fila}."""
+    check_history(cur, at)
+    params = {'tenant': str(tenant_id), 'at': at}
+    product_filter = ''
+    if product_ids:
+        product_filter = 'AND p.id::text = ANY(%(ids)s)'
+        params['ids'] = [str(pid) for pid in product_ids]
+    cur.execute(STOCK_AT_SQL.format(product_filter=product_filter), params)
+    return {str(row['id']): row for row in cur.fetchall()}
+
+
+def inventory_valuation(cur, tenant_id, at=None):
+    """
+    Valorización del inventario (stock x precio actual) por categoría. Sin `at` usa el stock
+    actual; con `at`, el reconstruido desde las instantáneas. No hay historial de precios, así
+    que el stock pasado se valora al precio vigente.
+    """
+    if at is None:
+        cur.execute(
+            """SELECT category, SUM(stock) AS units, SUM(stock * price) AS value
+               FROM products WHERE tenant_id = %s::text
+               GROUP BY category ORDER BY category""",
+            (str(tenant_id),)
+        )
+    else:
+        check_history(cur, at)
+        cur.execute(
+            f"""SELECT category, SUM(stock) AS units, SUM(stock * price) AS value
+                FROM ({STOCK_AT_SQL.format(product_filter='')}) AS s
+                GROUP BY category ORDER BY category""",
+            {'tenant': str(tenant_id), 'at': at}
+        )
+    categories = [
+        {'category': row['category'], 'units': int(row['units'] or 0), 'value_usd': round(float(row['value'] or 0), 2)}
+        for row in cur.fetchall()
+    ]
+    return {
+        'at': at.isoformat() if at else None,
+        'total_units': sum(c['units'] for c in categories),
+        'total_value_usd': round(sum(c['value_usd'] for c in categories), 2),
+        'categories': categories,
+    }